@@ -0,0 +1,106 @@
+"""
+Activation module for Mario Sisters game.
+Contains the system that puts off-screen enemies and items to sleep.
+"""
+import pygame
+from constants import *
+from collision import SpatialHash
+
+ACTIVATION_CELL_SIZE = TILE_SIZE * 8
+
+
+class SleepingGroup(pygame.sprite.Group):
+    """Sleeping entities, bucketed by position so waking only looks near the camera
+
+    Killing a sleeping sprite removes it from here like from any other group.
+    """
+
+    def __init__(self, *sprites):
+        self.spatial_hash = SpatialHash(ACTIVATION_CELL_SIZE)
+        self.homes = {}  # sprite -> (group it sleeps out of, step it fell asleep)
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.spatial_hash.insert(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.spatial_hash.remove(sprite)
+        self.homes.pop(sprite, None)
+
+
+class Activation:
+    """Keeps only the enemies and items near the camera in their update groups
+
+    Entities further than margin from the screen are moved out of their
+    group into a SleepingGroup, so the game loop, the batched physics and
+    collision checks never see them. They go back when the camera comes
+    within margin again. A class with sleep_policy "fast_forward" then gets
+    fast_forward(steps) called so its timers catch up; with "resume" it
+    carries on where it stopped.
+
+    Sleeping entities also leave the batched physics, so with both on it
+    usually manages fewer than BATCH_MIN_ENTITIES and lets the few awake
+    ones update themselves; activation does the saving then, and batching
+    only pays off when a crowd is on screen at once.
+    """
+
+    def __init__(self, groups, margin=ACTIVATION_MARGIN, physics=None):
+        self.groups = groups
+        self.margin = margin
+        self.physics = physics
+        self.sleeping = SleepingGroup()
+        self.woken = 0  # Entities woken by the last update
+        self.slept = 0  # Entities put to sleep by the last update
+
+    def window(self, camera_offset_x):
+        """Return the world rect entities must overlap to stay awake"""
+        return pygame.Rect(-camera_offset_x - self.margin, -SCREEN_HEIGHT,
+                           SCREEN_WIDTH + self.margin * 2, SCREEN_HEIGHT * 3)
+
+    def update(self, camera_offset_x, step):
+        """Wake the sleepers that came into range and put the rest to sleep"""
+        window = self.window(camera_offset_x)
+        woken = self.sleeping.spatial_hash.query(window)
+        for sprite in woken:
+            self.wake(sprite, step)
+
+        if self.physics is not None:
+            leaving = self.physics.outside(window)
+        else:
+            leaving = []
+        for group in self.groups:
+            for sprite in group:
+                if (self.physics is None or sprite not in self.physics) and not window.colliderect(sprite.rect):
+                    leaving.append(sprite)
+        for sprite in leaving:
+            self.sleep(sprite, step)
+        self.woken = len(woken)
+        self.slept = len(leaving)
+
+    def sleep(self, sprite, step):
+        """Move an entity from its group to the sleeping group"""
+        for group in self.groups:
+            if group.has(sprite):
+                group.remove(sprite)
+                self.sleeping.add(sprite)
+                self.sleeping.homes[sprite] = (group, step)
+                return
+
+    def wake(self, sprite, step):
+        """Return a sleeping entity to its group"""
+        group, slept_at = self.sleeping.homes[sprite]
+        self.sleeping.remove(sprite)
+        if sprite.sleep_policy == "fast_forward":
+            sprite.fast_forward(step - slept_at)
+        group.add(sprite)
+
+    def stats(self):
+        """Return how many entities are awake and asleep"""
+        return {
+            "awake": sum(len(group) for group in self.groups),
+            "asleep": len(self.sleeping),
+            "woken": self.woken,
+            "slept": self.slept,
+        }
@@ -0,0 +1,310 @@
+"""
+Assets module for Mario Sisters game.
+Contains the asset manager that loads images and sounds in the background.
+
+Assets are listed in assets/manifest.json under the scope that uses them:
+
+    {
+        "common": {"images": {"maria": "sisters/maria.png"}, "sounds": {"jump": "jump.wav"}},
+        "level1": {"images": {"hills": "backgrounds/hills.png"}}
+    }
+
+The "common" scope is loaded while the intro screen is up and kept for the
+whole game, and "levelN" is loaded by load_level(N) and freed when the game
+moves on to another level. Files are decoded on a thread pool; converting
+images to the display's pixel format and packing sprite frames into their
+scope's atlas happen on the main thread in poll(), since pygame surfaces
+must not be converted from other threads. Without a manifest there is
+nothing to load and sprites keep their solid-colour images.
+"""
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+from constants import *
+from render import surface_cache
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+MANIFEST_NAME = "manifest.json"
+COMMON_SCOPE = "common"
+ASSET_WORKERS = 4
+ATLAS_SIZE = 1024  # Width and height of an atlas page
+ATLAS_MAX_FRAME = 256  # Images larger than this either way get a surface of their own
+ATLAS_PADDING = 1  # Pixels left between frames
+ASSET_CACHE_BYTES = 32 * 1024 * 1024  # Budget for sounds and images kept outside the atlases
+PLACEHOLDER_COLOR = (255, 0, 255)  # Stands in for images that failed to load
+
+log = logging.getLogger(__name__)
+
+
+def level_scope(level_number):
+    """Return the manifest scope of a level's assets"""
+    return f"level{level_number}"
+
+
+def read_manifest(directory):
+    """Return {(kind, name): (scope, path)} for the assets listed in a directory's manifest"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    entries = {}
+    for scope, kinds in manifest.items():
+        for kind in ("images", "sounds"):
+            for name, filename in kinds.get(kind, {}).items():
+                key = (kind, name)
+                if key in entries:
+                    raise ValueError(f"{kind[:-1]} {name!r} is listed in both {entries[key][0]} and {scope}")
+                entries[key] = (scope, os.path.join(directory, filename))
+    return entries
+
+
+def decode(kind, path):
+    """Load an asset file into an unconverted Surface or a Sound, or None without audio"""
+    if kind == "images":
+        return pygame.image.load(path)
+    if pygame.mixer.get_init() is None:
+        return None
+    return pygame.mixer.Sound(path)
+
+
+def placeholder(kind):
+    """Return what stands in for an asset whose file could not be loaded"""
+    if kind == "images":
+        surface = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        surface.fill(PLACEHOLDER_COLOR)
+        return surface
+    if pygame.mixer.get_init() is None:
+        return None
+    return pygame.mixer.Sound(buffer=bytes(4))  # Silence
+
+
+class TextureAtlas:
+    """Sprite frames packed into shared pages, looked up by name
+
+    Frames are placed left to right on shelves as tall as the tallest frame
+    on them, and a new page opens when one fills up. Each frame is handed
+    out as a subsurface of its page, so it blits like any other image while
+    sharing the page's pixels; rect() gives its area for blitting straight
+    from the page. Frames are never moved or freed one by one; the whole
+    atlas is dropped with its scope.
+    """
+
+    def __init__(self, size=ATLAS_SIZE, padding=ATLAS_PADDING):
+        self.size = size
+        self.padding = padding
+        self.pages = []
+        self.frames = {}  # name -> subsurface of its page
+        self.rects = {}  # name -> (page number, area on the page)
+        self.x = 0
+        self.y = 0
+        self.shelf_height = 0
+
+    def __contains__(self, name):
+        return name in self.frames
+
+    def fits(self, surface):
+        """Return True if a surface is small enough to share a page"""
+        width, height = surface.get_size()
+        return width <= min(ATLAS_MAX_FRAME, self.size) and height <= min(ATLAS_MAX_FRAME, self.size)
+
+    def add(self, name, surface):
+        """Copy a surface into the atlas and return its frame"""
+        width, height = surface.get_size()
+        if self.pages and self.x + width > self.size:
+            # Start the next shelf
+            self.x = 0
+            self.y += self.shelf_height
+            self.shelf_height = 0
+        if not self.pages or self.y + height > self.size:
+            self.new_page()
+        page = self.pages[-1]
+        area = pygame.Rect(self.x, self.y, width, height)
+        page.blit(surface, area)
+        self.x += width + self.padding
+        self.shelf_height = max(self.shelf_height, height + self.padding)
+        self.frames[name] = frame = page.subsurface(area)
+        self.rects[name] = (len(self.pages) - 1, area)
+        return frame
+
+    def new_page(self):
+        """Open an empty page and start filling it from the top left"""
+        page = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
+        if pygame.display.get_surface() is not None:
+            page = page.convert_alpha()
+        page.fill((0, 0, 0, 0))
+        self.pages.append(page)
+        self.x = 0
+        self.y = 0
+        self.shelf_height = 0
+
+    def get(self, name):
+        """Return a frame, or None if the atlas does not hold it"""
+        return self.frames.get(name)
+
+    def rect(self, name):
+        """Return (page surface, area) of a frame"""
+        page, area = self.rects[name]
+        return self.pages[page], area
+
+    def size_bytes(self):
+        """Return the memory the pages take"""
+        return len(self.pages) * self.size * self.size * 4
+
+
+class AssetManager:
+    """Loads the assets of a manifest lazily or in the background, by scope
+
+    load_scope() queues every file of a scope on the thread pool, and poll()
+    takes in whatever has been decoded since. Asking for an asset that has
+    not arrived yet waits for it, or decodes it on the spot when it was
+    never queued. Small images go into their scope's TextureAtlas; sounds
+    and larger images are kept in a least recently used cache limited to
+    cache_bytes. release_scope() drops a scope's atlas and cached assets and
+    cancels its queued files. A file that fails to load is logged and
+    replaced by a placeholder, so a bad asset never stops the game.
+    """
+
+    def __init__(self, directory=ASSET_DIR, workers=ASSET_WORKERS, cache_bytes=ASSET_CACHE_BYTES):
+        self.entries = read_manifest(directory)
+        self.workers = workers
+        self.executor = None  # Started with the first background load
+        self.scopes = set()  # Scopes loaded and not yet released
+        self.pending = {}  # (kind, name) -> future decoding it
+        self.atlases = {}  # scope -> TextureAtlas
+        self.cache = OrderedDict()  # (kind, name) -> (asset, bytes), least recently used first
+        self.cache_bytes = 0
+        self.max_bytes = cache_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+
+    def load_scope(self, scope):
+        """Start decoding a scope's assets in the background"""
+        self.scopes.add(scope)
+        for key, (entry_scope, path) in self.entries.items():
+            if entry_scope != scope or key in self.pending or self.loaded(key):
+                continue
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="assets")
+            self.pending[key] = self.executor.submit(decode, key[0], path)
+
+    def release_scope(self, scope):
+        """Free a scope's assets, cancelling the ones still queued"""
+        self.scopes.discard(scope)
+        for key in [key for key in self.pending if self.entries[key][0] == scope]:
+            self.pending.pop(key).cancel()
+        self.atlases.pop(scope, None)
+        for key in [key for key in self.cache if self.entries[key][0] == scope]:
+            self.cache_bytes -= self.cache.pop(key)[1]
+
+    def loading(self):
+        """Return True while files are queued or being decoded"""
+        return bool(self.pending)
+
+    def poll(self):
+        """Take in the assets decoded since the last poll and return how many there were"""
+        done = [key for key, future in self.pending.items() if future.done()]
+        for key in done:
+            self.store(key, self.decoded(key, self.pending.pop(key)))
+        return len(done)
+
+    def decoded(self, key, future=None):
+        """Return the result of decoding an asset, or its placeholder if that failed
+
+        Without a future the file is decoded on the spot.
+        """
+        try:
+            return future.result() if future is not None else decode(key[0], self.entries[key][1])
+        except Exception as error:  # Whatever a broken file makes the decoder raise
+            log.warning("Could not load %s %r from %s: %s", key[0][:-1], key[1], self.entries[key][1], error)
+            self.failures += 1
+            return placeholder(key[0])
+
+    def loaded(self, key):
+        """Return True if an asset is in its atlas or the cache"""
+        scope = self.entries[key][0]
+        return key in self.cache or (scope in self.atlases and key[1] in self.atlases[scope])
+
+    def fetch(self, key):
+        """Return a loaded asset, waiting for or decoding it if need be, or None"""
+        if key not in self.entries:
+            return None
+        scope = self.entries[key][0]
+        atlas = self.atlases.get(scope)
+        if atlas is not None and key[1] in atlas:
+            self.hits += 1
+            return atlas.get(key[1])
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        return self.store(key, self.decoded(key, self.pending.pop(key, None)))
+
+    def store(self, key, asset):
+        """Convert a decoded asset and keep it in an atlas or the cache"""
+        if asset is None:
+            return None
+        kind, name = key
+        scope = self.entries[key][0]
+        if kind == "images":
+            if pygame.display.get_surface() is not None:
+                asset = asset.convert_alpha()
+            # Assets of a released scope only pass through the cache, so eviction frees them
+            if scope in self.scopes:
+                atlas = self.atlases.get(scope)
+                if atlas is None:
+                    atlas = self.atlases[scope] = TextureAtlas()
+                if atlas.fits(asset):
+                    return atlas.add(name, asset)
+            size = asset.get_width() * asset.get_height() * asset.get_bytesize()
+        else:
+            size = len(asset.get_raw())
+        self.cache[key] = (asset, size)
+        self.cache_bytes += size
+        while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+            self.cache_bytes -= self.cache.popitem(last=False)[1][1]
+            self.evictions += 1
+        return asset
+
+    def image(self, name):
+        """Return an image by its manifest name, or None if it is not listed"""
+        return self.fetch(("images", name))
+
+    def sound(self, name):
+        """Return a sound by its manifest name, or None if it is not listed or there is no audio"""
+        return self.fetch(("sounds", name))
+
+    def frame(self, name, size, color):
+        """Return a sprite's image, falling back to a solid-colour one when there is no art for it"""
+        image = self.image(name)
+        return image if image is not None else surface_cache.get(size, color)
+
+    def close(self):
+        """Stop the loading threads, dropping queued files"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.pending.clear()
+
+    def stats(self):
+        """Return what is loaded and how much memory it takes"""
+        return {
+            "scopes": sorted(self.scopes),
+            "pending": len(self.pending),
+            "atlas_pages": sum(len(atlas.pages) for atlas in self.atlases.values()),
+            "atlas_bytes": sum(atlas.size_bytes() for atlas in self.atlases.values()),
+            "cached": len(self.cache),
+            "cache_bytes": self.cache_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "failures": self.failures,
+        }
@@ -0,0 +1,504 @@
+"""
+Benchmark suite for Mario Sisters game.
+Times the game loop hot paths headlessly at scaled entity counts.
+
+Usage:
+    python benchmark.py [--frames N] [--scenario NAME] [--save-baseline] [--compare]
+    python benchmark.py --scaling
+    python benchmark.py --load
+    python benchmark.py --env
+    python benchmark.py --snapshot
+
+Each scenario builds a level, then times every phase of a frame separately:
+the sister, each enemy and item class, Game.update and Game.draw.
+Results are reported as per-frame percentiles in milliseconds and can be
+stored as a baseline to compare later runs against.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pygame
+from constants import *
+from game import Game
+from env import ACTIONS, MarioSistersEnv, VectorEnv
+import observation
+from snapshot import snapshot, restore
+from rewind import KEYFRAME_INTERVAL
+from enemies import Goombetta, Koopette, PiranhaQueenPlant, BossetteBowsette
+from platforms import Ground, Brick, Pipe
+from items import Coin, FeatherCap, HeelShoe, PurseItem, StarPower, OneUpMushroom
+from collision import PlatformGroup
+from pool import pools
+from render import surface_cache
+from level import (TILE_LEGEND, load_level_file, level_path, tile_level, parse_level, write_cache,
+                   read_cache, entity_name, entity_parameters)
+
+LEVEL_WIDTHS = [1, 4, 16, 64]  # In screens, for the collision scaling table
+LOAD_COPIES = 100  # Level 1 copies in the level used to time loading
+LOAD_REPEATS = 5
+ENV_STEPS = 20000  # Environment steps timed by --env, a tenth of that with pixel observations
+ENVS_PER_WORKER = 4
+SNAPSHOT_FRAMES = 300  # Frames played before the game is snapshotted
+SNAPSHOT_REPEATS = 200
+REWIND_STEPS = 300  # Frames rewound when timing the rewind buffer
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+REGRESSION_THRESHOLD = 0.2  # Flag phases whose p50 grew by more than 20%
+
+SCENARIOS = {
+    "level1": dict(copies=1),
+    "level1x10": dict(copies=10, goombettas=300, coins=300),
+    "zoo": dict(copies=10, goombettas=100, coins=100, zoo=100),
+    "level1x100-stream": dict(copies=100, stream=True),
+    "level1x10-batch": dict(copies=10, goombettas=300, coins=300, batch_physics=True),
+    "zoo-batch": dict(copies=10, goombettas=100, coins=100, zoo=100, batch_physics=True),
+    "zoo-awake": dict(copies=10, goombettas=100, coins=100, zoo=100, activation_margin=None),
+    "zoo-awake-batch": dict(copies=10, goombettas=100, coins=100, zoo=100, activation_margin=None,
+                            batch_physics=True),
+    # Every entity awake, enough for the batched physics to pay off
+    "level1x10-awake": dict(copies=10, goombettas=300, coins=300, activation_margin=None),
+    "level1x10-awake-batch": dict(copies=10, goombettas=300, coins=300, activation_margin=None,
+                                  batch_physics=True),
+    "shells": dict(copies=1, goombettas=300, shells=20),
+}
+
+
+def build_level_1(game, copies=1, goombettas=0, coins=0, zoo=0, shells=0, seed=0, stream=False):
+    """Tile level 1 copies times and scatter extra entities over it
+
+    zoo adds that many Koopettes plus a share of every other enemy and
+    power-up class, so that all of their update paths get timed. shells adds
+    Koopettes already kicked into their shells. With stream the level's own
+    entities are streamed in around the camera instead of all being spawned
+    up front.
+    """
+    rng = random.Random(seed)
+    level = tile_level(load_level_file(level_path(1)), copies)
+    game.clear_level()
+    game.build_level(level, stream)
+    width = level.width
+
+    def scatter(group, count, make):
+        for _ in range(count):
+            sprite = make(rng.randrange(TILE_SIZE, width - TILE_SIZE * 3))
+            group.add(sprite)
+            game.all_sprites.add(sprite)
+
+    scatter(game.enemies, goombettas, lambda x: pools.acquire(Goombetta, x, SCREEN_HEIGHT - TILE_SIZE * 2))
+    scatter(game.items, coins, lambda x: pools.acquire(Coin, x, SCREEN_HEIGHT - TILE_SIZE * rng.randint(3, 10)))
+    if zoo:
+        scatter(game.enemies, zoo, lambda x: pools.acquire(Koopette, x, SCREEN_HEIGHT - TILE_SIZE * 3))
+        scatter(game.enemies, zoo // 4, lambda x: PiranhaQueenPlant(x, SCREEN_HEIGHT - TILE_SIZE * 3))
+        scatter(game.enemies, zoo // 10 + 1, lambda x: BossetteBowsette(x, SCREEN_HEIGHT - TILE_SIZE * 6, game.rng))
+        for item_class in (FeatherCap, HeelShoe, PurseItem, StarPower, OneUpMushroom):
+            scatter(game.items, zoo // 5, lambda x: pools.acquire(item_class, x, SCREEN_HEIGHT - TILE_SIZE * 5))
+    for _ in range(shells):
+        shell = pools.acquire(Koopette, rng.randrange(TILE_SIZE, width - TILE_SIZE * 3), SCREEN_HEIGHT - TILE_SIZE * 3)
+        shell.stomp()
+        game.enemies.add(shell)
+        game.all_sprites.add(shell)
+    game.terrain.bake()
+
+
+def percentile(samples, fraction):
+    """Return the nearest-rank percentile of a sorted list"""
+    rank = int(fraction * len(samples) + 0.999999)
+    return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+def summarise(samples):
+    """Turn per-frame seconds into millisecond statistics"""
+    samples = sorted(sample * 1000 for sample in samples)
+    return {
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 0.50),
+        "p90": percentile(samples, 0.90),
+        "p99": percentile(samples, 0.99),
+    }
+
+
+def new_scenario_game(name):
+    """Create a headless game running the named scenario"""
+    options = dict(SCENARIOS[name])
+    game = Game(headless=True, render=True, batch_physics=options.pop("batch_physics", False),
+                activation_margin=options.pop("activation_margin", ACTIVATION_MARGIN), rewind_seconds=0,
+                seed=0)
+    game.new_game()
+    build_level_1(game, **options)
+    # Keep the sister alive so every frame does the same kind of work
+    game.player.lives = 10 ** 6
+    game.player.invincible = True
+    return game
+
+
+def release_scenario_game(game):
+    """Return a scenario game's sprites to their pools and stop its asset loader"""
+    game.clear_level()
+    game.assets.close()
+
+
+def pools_in_use():
+    """Return how many pooled sprites are on loan across every pool"""
+    return sum(stats["in_use"] for stats in pools.stats().values())
+
+
+def time_entity_phases(game, frames, warmup):
+    """Time the sister and each enemy and item class on their own, frame by frame"""
+    timings = {}
+    clock = time.perf_counter
+    platforms = game.platforms
+    for frame in range(warmup + frames):
+        start = clock()
+        game.player.update(platforms)
+        phases = [("Sister.update", clock() - start)]
+        
+        if game.physics is not None:
+            start = clock()
+            game.physics.step(platforms, game.physics_regions())
+            phases.append(("BatchPhysics.step", clock() - start))
+
+        by_class = {}
+        for group, label in ((game.enemies, "Enemy"), (game.items, "Item")):
+            for sprite in group:
+                if game.physics is not None and sprite in game.physics:
+                    continue
+                by_class.setdefault(f"{label}.update[{type(sprite).__name__}]", []).append(sprite)
+        for phase, sprites in by_class.items():
+            start = clock()
+            for sprite in sprites:
+                sprite.update(platforms)
+            phases.append((phase, clock() - start))
+
+        if frame >= warmup:
+            for phase, elapsed in phases:
+                timings.setdefault(phase, []).append(elapsed)
+    return timings
+
+
+def time_game_phases(game, frames, warmup):
+    """Time Game.update and Game.draw while the sister sweeps the level"""
+    timings = {"Game.update": [], "Game.draw": []}
+    clock = time.perf_counter
+    for frame in range(warmup + frames):
+        game.player.rect.x += 4  # Scroll the camera across the level
+        start = clock()
+        game.update()
+        updated = clock()
+        game.draw()
+        drawn = clock()
+        if frame >= warmup:
+            timings["Game.update"].append(updated - start)
+            timings["Game.draw"].append(drawn - updated)
+    return timings
+
+
+def run_scenario(name, frames, warmup):
+    """Return {phase: statistics} for one scenario"""
+    # Every scenario starts from empty pools, so their counters are its own
+    assert pools_in_use() == 0, f"{pools_in_use()} pooled sprites left over before {name}"
+    results = {}
+    game = new_scenario_game(name)
+    results["entities"] = len(game.enemies) + len(game.items) + 1
+    for phase, samples in time_entity_phases(game, frames, warmup).items():
+        results[phase] = summarise(samples)
+    release_scenario_game(game)
+    # A fresh copy, so the full frame starts from the same state
+    game = new_scenario_game(name)
+    for phase, samples in time_game_phases(game, frames, warmup).items():
+        results[phase] = summarise(samples)
+    # Entities the game loop still updated at the end of the sweep
+    results["awake"] = len(game.enemies) + len(game.items) + 1
+    release_scenario_game(game)
+    return results
+
+
+def print_scenario(name, results, baseline=None):
+    """Print a scenario table and return the phases that regressed against baseline"""
+    print(f"\n{name} ({results['entities']} entities, {results['awake']} awake)")
+    print(f"  {'phase':<36} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'vs base':>8}")
+    regressions = []
+    for phase, stats in results.items():
+        if phase in ("entities", "awake"):
+            continue
+        change = ""
+        if baseline and phase in baseline:
+            base = baseline[phase]["p50"]
+            delta = (stats["p50"] - base) / base if base else 0.0
+            change = f"{delta:+.0%}"
+            if delta > REGRESSION_THRESHOLD:
+                change += " !"
+                regressions.append((name, phase))
+        print(f"  {phase:<36} {stats['mean']:>8.3f} {stats['p50']:>8.3f} "
+              f"{stats['p90']:>8.3f} {stats['p99']:>8.3f} {change:>8}")
+    return regressions
+
+
+def print_pool_stats():
+    """Print the allocation counters of the sprite pools"""
+    print(f"\n  {'pool':<16} {'capacity':>8} {'in use':>8} {'high':>8} {'acquired':>9} {'misses':>8}")
+    for name, stats in pools.stats().items():
+        print(f"  {name:<16} {stats['capacity']:>8} {stats['in_use']:>8} {stats['high_water']:>8} "
+              f"{stats['acquired']:>9} {stats['misses']:>8}")
+
+
+def build_wide_level(game, screens, platforms):
+    """Fill the game with a repeating terrain layout that is screens wide
+
+    Enemies and coins only populate the first screen, so the entity count stays
+    the same and any growth in frame time comes from the extra platforms.
+    """
+    game.platforms = platforms
+    for screen in range(screens):
+        base_x = screen * SCREEN_WIDTH
+        for x in range(base_x, base_x + SCREEN_WIDTH, TILE_SIZE):
+            platforms.add(Ground(x, SCREEN_HEIGHT - TILE_SIZE, TILE_SIZE))
+        for x in range(base_x + 300, base_x + 500, TILE_SIZE):
+            platforms.add(Brick(x, SCREEN_HEIGHT - TILE_SIZE * 4))
+        platforms.add(Pipe(base_x + 600, SCREEN_HEIGHT, 2))
+    for x in range(100, 700, TILE_SIZE * 4):
+        game.enemies.add(Goombetta(x, SCREEN_HEIGHT - TILE_SIZE * 2))
+    for x in range(350, 550, TILE_SIZE):
+        game.items.add(Coin(x, SCREEN_HEIGHT - TILE_SIZE * 10))
+
+
+def time_frames(game, frames):
+    """Return the mean milliseconds spent moving and colliding entities per frame"""
+    start = time.perf_counter()
+    for _ in range(frames):
+        game.player.update(game.platforms)
+        for enemy in game.enemies:
+            enemy.update(game.platforms)
+        for item in game.items:
+            item.update(game.platforms)
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def run_collision_scaling(frames=60):
+    """Compare the indexed platform group against a brute-force group for several widths"""
+    game = Game(headless=True, render=False)
+    game.new_game()
+    print(f"{'screens':>8} {'platforms':>10} {'indexed ms':>10} {'brute ms':>9}")
+    for screens in LEVEL_WIDTHS:
+        results = []
+        for group in (PlatformGroup(), pygame.sprite.Group()):
+            game.enemies.empty()
+            game.items.empty()
+            build_wide_level(game, screens, group)
+            game.player.rect.topleft = (100, 300)
+            game.player.vel_x = game.player.vel_y = 0
+            results.append(time_frames(game, frames))
+        print(f"{screens:>8} {len(game.platforms):>10} {results[0]:>10.3f} {results[1]:>9.3f}")
+
+
+def best_time(action, repeats=LOAD_REPEATS):
+    """Return the fastest of several runs of action in milliseconds"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        action()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def run_load_times(copies=LOAD_COPIES):
+    """Compare parsing a large level file with reading its compiled cache"""
+    level = tile_level(load_level_file(level_path(1)), copies)
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, "level.json")
+        cache_path = os.path.join(directory, "level.lvlc")
+        with open(source_path, "w") as source_file:
+            json.dump(level_source(level), source_file)
+        source_stat = os.stat(source_path)
+        write_cache(cache_path, level, source_stat)
+
+        def parse():
+            with open(source_path) as source_file:
+                parse_level(json.load(source_file))
+
+        parsed = best_time(parse)
+        cached = best_time(lambda: read_cache(cache_path, source_stat))
+
+    game = Game(headless=True, render=True)
+    game.new_game()
+
+    def build():
+        game.clear_level()
+        game.build_level(level, stream=False)
+        game.terrain.bake()
+
+    built = best_time(build)
+    print(f"level1 x{copies}: {level.columns} columns, {len(level.entities)} entities")
+    print(f"  {'parse JSON':<24} {parsed:>9.3f} ms")
+    print(f"  {'read binary cache':<24} {cached:>9.3f} ms")
+    print(f"  {'build game objects':<24} {built:>9.3f} ms")
+
+
+def run_env_throughput(steps=ENV_STEPS):
+    """Print the steps per second of one environment per observation mode and of a vector of them"""
+    rng = random.Random(0)
+    modes = ("state", "tiles", "pixels") if observation.available() else ("state",)
+    for mode in modes:
+        env = MarioSistersEnv(observation=mode)
+        env.reset(seed=0)
+        count = steps // 10 if mode == "pixels" else steps
+        start = time.perf_counter()
+        for _ in range(count):
+            if env.step(rng.randrange(len(ACTIONS)))[2]:
+                env.reset()
+        elapsed = time.perf_counter() - start
+        label = f"MarioSistersEnv {mode}"
+        print(f"  {label:<28} {count / elapsed:>10.0f} steps/s")
+
+    workers = os.cpu_count() or 1
+    num_envs = workers * ENVS_PER_WORKER
+    vector = VectorEnv(num_envs, workers)
+    vector.reset(seed=0)
+    rounds = max(steps // num_envs, 1)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        vector.step([rng.randrange(len(ACTIONS)) for _ in range(num_envs)])
+    elapsed = time.perf_counter() - start
+    vector.close()
+    label = f"VectorEnv {num_envs} envs/{workers} workers"
+    print(f"  {label:<28} {rounds * num_envs / elapsed:>10.0f} steps/s")
+
+
+def run_snapshot_times(frames=SNAPSHOT_FRAMES, repeats=SNAPSHOT_REPEATS):
+    """Print the size of a snapshot of each level in play and the time to take and restore it"""
+    games = []
+    for number in (1, 2, 3):
+        game = Game(headless=True)
+        game.new_game()
+        game.current_level = number
+        game.load_level(number)
+        games.append((f"level{number}", game))
+    games.append(("level1x100-stream", new_scenario_game("level1x100-stream")))
+    print(f"{'level':<24} {'bytes':>8} {'snapshot us':>12} {'restore us':>12}")
+    for name, game in games:
+        game.simulate(frames)
+        data = snapshot(game)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            snapshot(game)
+        taken = (time.perf_counter() - start) / repeats * 1e6
+        start = time.perf_counter()
+        for _ in range(repeats):
+            restore(game, data)
+        restored = (time.perf_counter() - start) / repeats * 1e6
+        print(f"{name:<24} {len(data):>8} {taken:>12.1f} {restored:>12.1f}")
+    run_rewind_times()
+
+
+def run_rewind_times(steps=REWIND_STEPS):
+    """Print the memory a full rewind window takes and the cost of capturing and rewinding frames"""
+    games = []
+    for number in (1, 2, 3):
+        game = Game(headless=True, render=False)
+        game.new_game()
+        game.current_level = number
+        game.load_level(number)
+        games.append((f"level{number}", game))
+    game = Game(headless=True, render=False)
+    game.new_game()
+    build_level_1(game, copies=100, stream=True)
+    games.append(("level1x100-stream", game))
+    print(f"\n{'level':<24} {'frames':>8} {'rewind KB':>10} {'capture us':>11} {'rewind us':>10}")
+    for name, game in games:
+        game.player.lives = 10 ** 6
+        captured = 0.0
+        for frame in range(REWIND_SECONDS * SIM_RATE + KEYFRAME_INTERVAL):
+            if frame % 60 == 30:
+                game.player.rect.x += TILE_SIZE * 3  # Carry the sister along so chunks stream
+            game.update()
+            captured += game.rewind.capture_time
+        frames = REWIND_SECONDS * SIM_RATE + KEYFRAME_INTERVAL
+        stats = game.rewind.stats()
+        start = time.perf_counter()
+        for _ in range(steps):
+            game.rewind.rewind(game)
+        rewound = (time.perf_counter() - start) / steps * 1e6
+        print(f"{name:<24} {stats['frames']:>8} {stats['bytes'] / 1024:>10.1f} "
+              f"{captured / frames * 1e6:>11.1f} {rewound:>10.1f}")
+
+
+def level_source(level):
+    """Turn LevelData back into the JSON form of a level file"""
+    legend = {code: char for char, code in TILE_LEGEND.items()}
+    rows = []
+    for row in range(level.rows):
+        rows.append("".join(legend[level.tiles[col * level.rows + row]] for col in range(level.columns)))
+    entities = []
+    for record in level.entities:
+        entity = {"type": entity_name(record[0]), "x": record[1], "y": record[2]}
+        entity.update(entity_parameters(record[0], record))
+        entities.append(entity)
+    return {"name": level.name, "tiles": rows, "entities": entities}
+
+
+def main(argv=None):
+    """Run the suite from the command line and return the exit status"""
+    parser = argparse.ArgumentParser(description="Mario Sisters benchmark suite")
+    parser.add_argument("--frames", type=int, default=300, help="timed frames per scenario")
+    parser.add_argument("--warmup", type=int, default=30, help="untimed frames before timing")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline")
+    parser.add_argument("--scaling", action="store_true", help="only print the collision scaling table")
+    parser.add_argument("--load", action="store_true", help="only time level loading")
+    parser.add_argument("--env", action="store_true", help="only time the agent environments")
+    parser.add_argument("--snapshot", action="store_true", help="only time game snapshots")
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        run_collision_scaling(max(args.frames // 5, 1))
+        pygame.quit()
+        return 0
+
+    if args.load:
+        run_load_times()
+        pygame.quit()
+        return 0
+
+    if args.env:
+        run_env_throughput()
+        pygame.quit()
+        return 0
+
+    if args.snapshot:
+        run_snapshot_times()
+        pygame.quit()
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, args.frames, args.warmup)
+        regressions += print_scenario(name, results[name], baseline.get(name))
+    print_pool_stats()
+    stats = surface_cache.stats()
+    print(f"\n  surface cache: {stats['surfaces']} surfaces, {stats['hits']} hits, {stats['misses']} misses")
+    pygame.quit()
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} phase(s) regressed by more than {REGRESSION_THRESHOLD:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Collision module for Mario Sisters game.
+Contains the spatial hash broadphase used for platform collisions and the
+sorted index used for collisions between moving sprites.
+"""
+from bisect import bisect_left
+from operator import attrgetter
+
+import pygame
+from constants import *
+from tilemap import TileMap
+
+_left = attrgetter("rect.left")
+_width = attrgetter("rect.width")
+
+
+class SpatialHash:
+    """Uniform grid that buckets sprites by the cells their rect overlaps"""
+
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (col, row) -> set of sprites
+        self.bounds = {}  # sprite -> (first col, first row, last col, last row)
+        self.order = {}  # sprite -> insertion number, keeps results deterministic
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, sprite):
+        return sprite in self.bounds
+
+    def cell_bounds(self, rect):
+        """Return the inclusive cell range covered by a rect"""
+        size = self.cell_size
+        return (rect.left // size, rect.top // size,
+                (rect.right - 1) // size, (rect.bottom - 1) // size)
+
+    def insert(self, sprite):
+        """Add a sprite to every cell its rect overlaps"""
+        if sprite in self.bounds:
+            self.move(sprite)
+            return
+        self.order[sprite] = self.next_order
+        self.next_order += 1
+        self._link(sprite, self.cell_bounds(sprite.rect))
+
+    def remove(self, sprite):
+        """Drop a sprite from the grid"""
+        if sprite not in self.bounds:
+            return
+        self._unlink(sprite)
+        del self.order[sprite]
+
+    def move(self, sprite):
+        """Re-bucket a sprite after its rect changed, touching only changed cells"""
+        old = self.bounds.get(sprite)
+        if old is None:
+            self.insert(sprite)
+            return
+        new = self.cell_bounds(sprite.rect)
+        if new != old:
+            self._unlink(sprite)
+            self._link(sprite, new)
+
+    def clear(self):
+        """Forget every sprite"""
+        self.cells.clear()
+        self.bounds.clear()
+        self.order.clear()
+
+    def candidates(self, rect):
+        """Return the sprites sharing a cell with rect, without an exact test"""
+        col0, row0, col1, row1 = self.cell_bounds(rect)
+        cells = self.cells
+        if col0 == col1 and row0 == row1:
+            return set(cells.get((col0, row0), ()))
+        found = set()
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                bucket = cells.get((col, row))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+    def query(self, rect):
+        """Return the sprites whose rect overlaps rect, in insertion order"""
+        hits = [sprite for sprite in self.candidates(rect) if rect.colliderect(sprite.rect)]
+        if len(hits) > 1:
+            hits.sort(key=self.order.__getitem__)
+        return hits
+
+    def _link(self, sprite, bounds):
+        col0, row0, col1, row1 = bounds
+        cells = self.cells
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                bucket = cells.get((col, row))
+                if bucket is None:
+                    cells[(col, row)] = {sprite}
+                else:
+                    bucket.add(sprite)
+        self.bounds[sprite] = bounds
+
+    def _unlink(self, sprite):
+        col0, row0, col1, row1 = self.bounds.pop(sprite)
+        cells = self.cells
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                bucket = cells[(col, row)]
+                bucket.discard(sprite)
+                if not bucket:
+                    del cells[(col, row)]
+
+
+class SurfaceIndex:
+    """Platforms bucketed by the tile columns their top edge spans
+
+    Ledge checks read one column bucket instead of scanning every platform.
+    Tops are read from the live rect, so platforms only need re-bucketing
+    when they move sideways into other columns.
+    """
+
+    def __init__(self):
+        self.columns = {}  # column -> list of platforms
+        self.spans = {}  # platform -> (first column, last column)
+
+    def column_span(self, rect):
+        """Return the columns touched by a rect's top edge, right edge included"""
+        return rect.left // TILE_SIZE, rect.right // TILE_SIZE
+
+    def insert(self, sprite):
+        """Index a platform's top edge"""
+        span = self.column_span(sprite.rect)
+        for col in range(span[0], span[1] + 1):
+            self.columns.setdefault(col, []).append(sprite)
+        self.spans[sprite] = span
+
+    def remove(self, sprite):
+        """Drop a platform, e.g. a broken brick or a platform that fell away"""
+        span = self.spans.pop(sprite, None)
+        if span is None:
+            return
+        for col in range(span[0], span[1] + 1):
+            bucket = self.columns[col]
+            bucket.remove(sprite)
+            if not bucket:
+                del self.columns[col]
+
+    def move(self, sprite):
+        """Update the buckets of a platform that moved"""
+        if self.spans.get(sprite) != self.column_span(sprite.rect):
+            self.remove(sprite)
+            self.insert(sprite)
+
+    def has_surface(self, x, y, tolerance):
+        """Return True if a platform spanning x has its top within tolerance of y"""
+        for platform in self.columns.get(x // TILE_SIZE, ()):
+            rect = platform.rect
+            if rect.left <= x <= rect.right and abs(rect.top - y) < tolerance:
+                return True
+        return False
+
+
+class PlatformGroup(pygame.sprite.Group):
+    """Sprite group that indexes its platforms for collision queries
+
+    Grid-aligned static terrain is written into a tile map and never scanned
+    as a sprite. Everything else is kept in a spatial hash. Kinematic
+    platforms are also registered separately so that only they get ticked.
+    """
+
+    def __init__(self, *sprites):
+        self.tilemap = TileMap()
+        self.spatial_hash = SpatialHash(TILE_SIZE)
+        self.surfaces = SurfaceIndex()
+        self.tiled = set()  # Platforms stored in the tile map
+        self.active = {}  # Kinematic platforms in insertion order
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if sprite.kinematic:
+            self.active[sprite] = None
+        if sprite.tile_code and self.tilemap.fill_rect(sprite.rect, sprite.tile_code):
+            self.tiled.add(sprite)
+        else:
+            self.spatial_hash.insert(sprite)
+            self.surfaces.insert(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.active.pop(sprite, None)
+        if sprite in self.tiled:
+            self.tiled.discard(sprite)
+            self.tilemap.clear_rect(sprite.rect)
+        else:
+            self.spatial_hash.remove(sprite)
+            self.surfaces.remove(sprite)
+
+    def relocate(self, sprite):
+        """Tell the indexes that a platform has moved"""
+        if sprite in self.spatial_hash:
+            self.spatial_hash.move(sprite)
+            self.surfaces.move(sprite)
+
+    def update_active(self):
+        """Tick the kinematic platforms and re-index the cells they moved across"""
+        for platform in tuple(self.active):
+            platform.update()
+            self.relocate(platform)
+
+    def collide(self, sprite):
+        """Return the platforms overlapping a sprite that are kept as sprites"""
+        return self.spatial_hash.query(sprite.rect)
+
+    def collide_rects(self, rect):
+        """Return the rects of all solid terrain overlapping rect, tiles first"""
+        hits = self.tilemap.collide(rect)
+        for platform in self.spatial_hash.query(rect):
+            hits.append(platform.rect)
+        return hits
+
+    def load_tiles(self, cells, columns):
+        """Replace the tile map with the tile layer of a level"""
+        self.remove(*self.tiled)
+        self.tilemap.load(cells, columns)
+
+    def empty(self):
+        super().empty()
+        self.tilemap.clear()
+
+    def has_ground(self, x, y, tolerance=10):
+        """Return True if any platform offers ground at (x, y)"""
+        return (self.tilemap.has_surface(x, y, tolerance) or
+                self.surfaces.has_surface(x, y, tolerance))
+
+
+class SweepIndex:
+    """Moving sprites sorted along x, rebuilt once per step
+
+    Sprites move every step, so rather than keeping a grid up to date the
+    index is rebuilt by sorting the sprites on their left edge. A query then
+    bisects to the few sprites that can reach a rect, and returns the hits
+    in the order the sprites were given to build(), like a linear scan would.
+    """
+
+    def __init__(self):
+        self.lefts = []  # Sorted left edges
+        self.sprites = []  # The sprite with each left edge
+        self.orders = []  # Each sprite's position in the build() argument
+        self.max_width = 0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def build(self, sprites):
+        """Index sprites at their current positions"""
+        sprites = list(sprites)
+        lefts = list(map(_left, sprites))
+        self.orders = sorted(range(len(sprites)), key=lefts.__getitem__)
+        self.lefts = [lefts[order] for order in self.orders]
+        self.sprites = [sprites[order] for order in self.orders]
+        self.max_width = max(map(_width, sprites), default=0)
+
+    def query(self, rect):
+        """Return the indexed sprites overlapping rect, in build order"""
+        # Only sprites starting within max_width left of rect can reach it
+        start = bisect_left(self.lefts, rect.left - self.max_width + 1)
+        end = bisect_left(self.lefts, rect.right, start)
+        sprites = self.sprites
+        hits = [slot for slot in range(start, end) if rect.colliderect(sprites[slot].rect)]
+        hits.sort(key=self.orders.__getitem__)
+        return [sprites[slot] for slot in hits]
+
+
+def collide_platforms(sprite, platforms):
+    """Return the rects of the platforms overlapping sprite
+
+    Uses the tile map and spatial hash of a PlatformGroup when available.
+    """
+    if isinstance(platforms, PlatformGroup):
+        return platforms.collide_rects(sprite.rect)
+    return [platform.rect for platform in pygame.sprite.spritecollide(sprite, platforms, False)]
+
+
+def ground_at(platforms, x, y, tolerance=10):
+    """Return True if a platform's top edge is within tolerance of y at x"""
+    if isinstance(platforms, PlatformGroup):
+        return platforms.has_ground(x, y, tolerance)
+    for platform in platforms:
+        if (platform.rect.left <= x <= platform.rect.right and
+                abs(platform.rect.top - y) < tolerance):
+            return True
+    return False
@@ -8,6 +8,10 @@ SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 SCREEN_TITLE = "Mario Sisters"
 FPS = 60
+SIM_RATE = 60  # Fixed simulation steps per second, gameplay timers count these
+MAX_CATCHUP_STEPS = 5  # Updates allowed per rendered frame before dropping time
+ACTIVATION_MARGIN = SCREEN_WIDTH // 2  # Enemies and items further off-screen than this sleep
+REWIND_SECONDS = 30  # Play kept for rewinding
 
 # Colors
 WHITE = (255, 255, 255)
@@ -20,6 +24,7 @@ PURPLE = (128, 0, 128)
 YELLOW = (255, 255, 0)
 CYAN = (0, 255, 255)
 SKY_BLUE = (135, 206, 235)
+ORANGE = (255, 165, 0)
 
 # Player properties
 PLAYER_ACC = 0.5
@@ -27,6 +32,12 @@ PLAYER_FRICTION = -0.12
 PLAYER_GRAVITY = 0.5
 PLAYER_JUMP = -16
 
+# Projectile properties
+FIREBALL_SIZE = 12
+FIREBALL_SPEED = 7
+FIREBALL_BOUNCE = -6
+FIREBALL_LIFETIME = 120  # Simulation steps before a fireball burns out
+
 # Game properties
 TITLE_FONT_SIZE = 48
 NORMAL_FONT_SIZE = 22
@@ -37,9 +48,18 @@ TILE_SIZE = 32
 PLAYER_WIDTH = 32
 PLAYER_HEIGHT = 64
 
+# Tile codes for the level tile map
+TILE_EMPTY = 0
+TILE_GROUND = 1
+TILE_BRICK = 2
+TILE_QUESTION = 3
+TILE_PIPE = 4
+
 # Game states
 STATE_INTRO = 0
 STATE_PLAYING = 1
 STATE_GAME_OVER = 2
 STATE_WIN = 3
-STATE_PAUSE = 4
\ No newline at end of file
+STATE_PAUSE = 4
+
+LEVEL_COUNT = 3  # Completing the last level wins the game
\ No newline at end of file
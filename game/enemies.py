@@ -5,14 +5,24 @@ Contains satirical gender-swapped versions of classic enemies.
 import pygame
 import random
 from constants import *
+from collision import collide_platforms, ground_at
+from pool import PooledSprite
+from render import surface_cache
 
-class Enemy(pygame.sprite.Sprite):
+class Enemy(PooledSprite):
     """Base class for all enemies"""
     
+    batch_physics = "walker"  # Movement the batched physics engine can replicate
+    turns_at_ledges = False
+    sleep_policy = "resume"  # Or "fast_forward" to catch timers up after sleeping off-screen
+    shell_mode = False  # A moving shell knocks out the enemies it runs into
+    # Mutable numbers a snapshot stores after the position, as (attribute, struct code)
+    snapshot_fields = (("vel_x", "d"), ("vel_y", "d"), ("direction", "b"))
+    
     def __init__(self, x, y, width, height, color):
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.Surface((width, height))
-        self.image.fill(color)
+        self.image = surface_cache.get((width, height), color)
+        self.color = color
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
@@ -22,6 +32,16 @@ class Enemy(pygame.sprite.Sprite):
         self.direction = -1  # -1 left, 1 right
         self.points = 100  # Points awarded for defeat
     
+    def reset(self, x, y):
+        """Put a recycled enemy back at a spawn point in its starting state"""
+        self.image = surface_cache.get(self.rect.size, self.color)
+        self.rect.x = x
+        self.rect.y = y
+        self.vel_x = 0
+        self.vel_y = 0
+        self.direction = -1
+        self.previous_pos = None
+    
     def update(self, platforms):
         """Update enemy position and check for collisions"""
         # Apply gravity
@@ -36,66 +56,87 @@ class Enemy(pygame.sprite.Sprite):
     
     def check_horizontal_collisions(self, platforms):
         """Check and resolve horizontal collisions"""
-        hits = pygame.sprite.spritecollide(self, platforms, False)
+        hits = collide_platforms(self, platforms)
         if hits:
             self.direction *= -1  # Reverse direction
             
             # Move away from collision
             if self.direction > 0:
-                self.rect.left = hits[0].rect.right
+                self.rect.left = hits[0].right
             else:
-                self.rect.right = hits[0].rect.left
+                self.rect.right = hits[0].left
     
     def check_vertical_collisions(self, platforms):
         """Check and resolve vertical collisions"""
-        hits = pygame.sprite.spritecollide(self, platforms, False)
+        hits = collide_platforms(self, platforms)
         if hits:
             if self.vel_y > 0:  # Falling
-                self.rect.bottom = hits[0].rect.top
+                self.rect.bottom = hits[0].top
                 self.vel_y = 0
             else:  # Rising
-                self.rect.top = hits[0].rect.bottom
+                self.rect.top = hits[0].bottom
                 self.vel_y = 0
     
+    def ground_ahead(self, platforms):
+        """Check if there's ground one tile ahead in the walking direction"""
+        ahead_x = self.rect.x + self.direction * TILE_SIZE
+        ahead_y = self.rect.bottom + 5
+        return ground_at(platforms, ahead_x, ahead_y)
+    
+    def batch_ready(self):
+        """Return True while update() is the plain batch_physics movement"""
+        return True
+    
+    def fast_forward(self, steps):
+        """Advance timers by steps that passed while asleep"""
+        pass
+    
+    def restored(self):
+        """Bring state derived from restored snapshot_fields, like the image, back in line"""
+        pass
+    
     def stomp(self):
         """Handle being stomped by player"""
         self.kill()
         return self.points
+    
+    def knock_out(self):
+        """Handle being hit by a shell"""
+        self.kill()
+        return self.points
 
 
 class Goombetta(Enemy):
     """Female version of Goomba with a bow"""
     
+    turns_at_ledges = True
+    
     def __init__(self, x, y):
         super().__init__(x, y, TILE_SIZE, TILE_SIZE, (165, 42, 42))  # Brown
         self.vel_x = 1
         self.points = 100
         self.name = "Goombetta"
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 1
+    
     def update(self, platforms):
         """Update with simple left-right movement"""
         super().update(platforms)
         
         # Fall off edge detection (smarter movement)
-        ahead_x = self.rect.x + self.direction * TILE_SIZE
-        ahead_y = self.rect.bottom + 5
-        
-        # Check if there's ground ahead
-        ground_ahead = False
-        for platform in platforms:
-            if (platform.rect.left <= ahead_x <= platform.rect.right and 
-                abs(platform.rect.top - ahead_y) < 10):
-                ground_ahead = True
-                break
-        
         # If no ground ahead, turn around
-        if not ground_ahead:
+        if not self.ground_ahead(platforms):
             self.direction *= -1
 
 
 class Koopette(Enemy):
     """Female Koopa Troopa with a shell"""
     
+    sleep_policy = "fast_forward"  # A shell keeps wearing off out of sight
+    snapshot_fields = Enemy.snapshot_fields + (("shell_mode", "?"), ("shell_timer", "i"))
+    
     def __init__(self, x, y):
         super().__init__(x, y, TILE_SIZE, TILE_SIZE * 1.5, (0, 128, 0))  # Dark green
         self.vel_x = 1.5
@@ -104,6 +145,16 @@ class Koopette(Enemy):
         self.shell_mode = False
         self.shell_timer = 0
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 1.5
+        self.shell_mode = False
+        self.shell_timer = 0
+    
+    def batch_ready(self):
+        """Shells move on their own rules"""
+        return not self.shell_mode
+    
     def update(self, platforms):
         """Update with shell transformation ability"""
         if not self.shell_mode:
@@ -113,7 +164,7 @@ class Koopette(Enemy):
             self.rect.x += self.vel_x * self.direction * 3
             
             # Check for collisions in shell mode
-            hits = pygame.sprite.spritecollide(self, platforms, False)
+            hits = collide_platforms(self, platforms)
             if hits:
                 self.direction *= -1
             
@@ -121,22 +172,39 @@ class Koopette(Enemy):
             self.shell_timer -= 1
             if self.shell_timer <= 0:
                 self.shell_mode = False
-                self.image.fill((0, 128, 0))  # Back to green
+                self.image = surface_cache.get(self.rect.size, (0, 128, 0))  # Back to green
+    
+    def restored(self):
+        """Show the shell or the green Koopette the restored state calls for"""
+        self.image = surface_cache.get(self.rect.size, (200, 200, 200) if self.shell_mode else (0, 128, 0))
     
     def stomp(self):
         """When stomped, enter shell mode instead of dying"""
         if not self.shell_mode:
             self.shell_mode = True
             self.shell_timer = 180  # 3 seconds at 60 FPS
-            self.image.fill((200, 200, 200))  # Gray shell
+            self.image = surface_cache.get(self.rect.size, (200, 200, 200))  # Gray shell
             return 50  # Fewer points for just shelling
         else:
             return super().stomp()  # Actually defeat if already in shell
+    
+    def fast_forward(self, steps):
+        """Run down the shell timer without moving the shell"""
+        if self.shell_mode:
+            self.shell_timer -= steps
+            if self.shell_timer <= 0:
+                self.shell_mode = False
+                self.image = surface_cache.get(self.rect.size, (0, 128, 0))  # Back to green
 
 
 class PiranhaQueenPlant(Enemy):
     """Piranha Plant with a crown"""
     
+    batch_physics = None
+    sleep_policy = "fast_forward"  # Stays in step with the clock, like a real pipe plant
+    rise_cycle = 120 + 1 + 180 + 1  # Steps per rise and hide cycle, counting each switch
+    snapshot_fields = Enemy.snapshot_fields + (("rise_timer", "i"), ("hidden", "?"), ("current_rise", "i"))
+    
     def __init__(self, x, y, pipe_top=True):
         super().__init__(x, y, TILE_SIZE, TILE_SIZE * 2, (255, 0, 0))  # Red
         self.pipe_top = pipe_top
@@ -177,13 +245,24 @@ class PiranhaQueenPlant(Enemy):
             if self.current_rise > 0:
                 self.current_rise -= self.rise_speed
                 self.rect.y += self.rise_speed if self.pipe_top else self.rise_speed * -1
+    
+    def fast_forward(self, steps):
+        """Replay the steps, skipping whole cycles once the plant has settled into one"""
+        if steps > self.rise_cycle * 2:
+            steps = (steps - 1) % self.rise_cycle + 1 + self.rise_cycle
+        for _ in range(steps):
+            self.update(None)
 
 
 class BossetteBowsette(Enemy):
     """The big boss - gender-swapped Bowser"""
     
-    def __init__(self, x, y):
+    batch_physics = None
+    snapshot_fields = Enemy.snapshot_fields + (("health", "i"), ("attack_timer", "i"), ("attack_pattern", "b"))
+    
+    def __init__(self, x, y, rng=None):
         super().__init__(x, y, TILE_SIZE * 3, TILE_SIZE * 4, (255, 165, 0))  # Orange
+        self.rng = rng if rng is not None else random  # Pass the game's RNG for replays
         self.vel_x = 0.5
         self.points = 5000
         self.name = "Bossette"
@@ -199,7 +278,7 @@ class BossetteBowsette(Enemy):
         self.attack_timer -= 1
         if self.attack_timer <= 0:
             self.attack_timer = 180  # 3 seconds between attacks
-            self.attack_pattern = random.randint(0, 2)
+            self.attack_pattern = self.rng.randint(0, 2)
             self.attack()
     
     def attack(self):
@@ -219,4 +298,8 @@ class BossetteBowsette(Enemy):
         self.health -= 1
         if self.health <= 0:
             return super().stomp()
-        return 50  # Small points for each hit
\ No newline at end of file
+        return 50  # Small points for each hit
+    
+    def knock_out(self):
+        """Shells bounce off the boss"""
+        return 0
\ No newline at end of file
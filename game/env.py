@@ -0,0 +1,371 @@
+"""
+Environment module for Mario Sisters game.
+Contains a gym-style environment for automated agents and a vectorised one
+that steps many games in worker processes.
+
+Usage:
+    env = MarioSistersEnv()
+    observation = env.reset(seed=1)
+    observation, reward, done, info = env.step(ACTIONS.index(ACTION_RIGHT | ACTION_JUMP))
+
+Actions are indices into ACTIONS, each a combination of the ACTION_* flags.
+A "state" observation is OBSERVATION_SIZE floats: the PLAYER_FIELDS, then
+(dx, dy, present) of the OBSERVATION_ENEMIES enemies nearest the sister,
+in pixels from her centre, padded with zeros. "tiles" gives the uint8 tile
+grid around the sister and "pixels" the downscaled screen, both described
+in the observation module.
+"""
+import heapq
+import multiprocessing
+import os
+import random
+from array import array
+
+import pygame
+from constants import *
+from replay import PressedKeys
+from observation import PIXEL_SCALE, grid_shape, pixel_shape, tile_grid, downscaled_pixels
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, without it the vector buffers are memoryviews
+    np = None
+
+# Buttons an action holds down; left and right are the first two TRACKED_KEYS bits
+ACTION_LEFT = 1
+ACTION_RIGHT = 2
+ACTION_JUMP = 4
+ACTION_SPECIAL = 8
+ACTIONS = (
+    0,
+    ACTION_LEFT,
+    ACTION_RIGHT,
+    ACTION_JUMP,
+    ACTION_LEFT | ACTION_JUMP,
+    ACTION_RIGHT | ACTION_JUMP,
+    ACTION_SPECIAL,
+    ACTION_RIGHT | ACTION_SPECIAL,
+)
+HELD_KEYS = [PressedKeys(action & (ACTION_LEFT | ACTION_RIGHT)) for action in ACTIONS]
+
+PLAYER_FIELDS = ("x", "y", "vel_x", "vel_y", "on_ground", "camera_x", "lives", "power_level", "time_left")
+OBSERVATION_ENEMIES = 4
+OBSERVATION_RANGE = SCREEN_WIDTH  # Enemies further away than this horizontally are left out
+OBSERVATION_SIZE = len(PLAYER_FIELDS) + 3 * OBSERVATION_ENEMIES
+
+REWARD_PROGRESS = 0.01  # Per pixel the sister gets further right in a level
+REWARD_SCORE = 0.01  # Per point scored
+REWARD_LIFE = -1.0  # Per life lost
+
+
+def observation_spec(mode, pixel_scale=PIXEL_SCALE):
+    """Return the shape and array type code of an observation mode"""
+    if mode == "state":
+        return (OBSERVATION_SIZE,), "f"
+    if mode == "tiles":
+        return grid_shape(), "B"
+    if mode == "pixels":
+        return pixel_shape(pixel_scale), "B"
+    raise ValueError(f"Unknown observation mode {mode!r}")
+
+
+class ActionInput:
+    """Input source that holds the keys of the environment's current action"""
+
+    def __init__(self):
+        self.keys = HELD_KEYS[0]
+
+    def get_events(self):
+        return []
+
+    def get_pressed(self):
+        return self.keys
+
+
+class MarioSistersEnv:
+    """One game played one simulation step per action
+
+    The game runs headlessly and, unless render is set or the observation
+    is "pixels", never draws, so a step costs one Game.update. A drawing
+    environment gets its own screen surface, so several can share a
+    process. Jumping and the special ability are applied
+    straight to the sister on every step their flag is set rather than going
+    through the event queue. An episode ends at game over, when the last
+    level is won or after max_steps steps; info["truncated"] tells the last
+    case apart. reset() without a seed draws the next seed from the one the
+    environment was last seeded with, so a sequence of episodes is
+    reproducible from its first seed.
+    """
+
+    def __init__(self, sister=0, level=1, observation="state", render=False, frame_skip=1,
+                 max_steps=None, pixel_scale=PIXEL_SCALE, **game_options):
+        from game import Game
+        self.observation = observation
+        self.shape, self.typecode = observation_spec(observation, pixel_scale)
+        if observation != "state" and np is None:
+            raise ValueError(f"{observation} observations need NumPy")
+        self.pixel_scale = pixel_scale
+        render = render or observation == "pixels"
+        game_options.setdefault("rewind_seconds", 0)  # Agents restart episodes rather than rewind
+        self.game = Game(headless=True, render=render, **game_options)
+        self.game.input = self.input = ActionInput()
+        if render:
+            self.game.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+        self.stale = True  # Whether the screen is behind the game
+        self.sister = sister
+        self.level = level
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.seeds = random.Random()
+        self.steps = 0
+        self.best_x = 0  # Rightmost sister position in the current level
+        self.played_level = level
+        self.lives = 0
+        self.score = 0
+
+    def reset(self, seed=None):
+        """Start a new episode and return its first observation"""
+        self.restart(seed)
+        return self.observe()
+
+    def restart(self, seed=None):
+        """Start a new episode"""
+        if seed is None:
+            seed = self.seeds.randrange(2 ** 32)
+        else:
+            self.seeds.seed(seed)
+        game = self.game
+        game.seed = seed
+        game.rng.seed(seed)
+        game.selected_sister = self.sister
+        game.new_game()
+        if self.level != 1:
+            game.current_level = self.level
+            game.load_level(self.level)
+        self.input.keys = HELD_KEYS[0]
+        self.steps = 0
+        self.best_x = game.player.rect.x
+        self.played_level = game.current_level
+        self.lives = game.player.lives
+        self.score = game.score
+        self.stale = True
+
+    def step(self, action):
+        """Play an action and return (observation, reward, done, info)"""
+        reward, done, info = self.advance(action)
+        return self.observe(), reward, done, info
+
+    def advance(self, action):
+        """Play an action for frame_skip steps and return (reward, done, info)"""
+        game = self.game
+        buttons = ACTIONS[action]
+        self.input.keys = HELD_KEYS[action]
+        reward = 0.0
+        for _ in range(self.frame_skip):
+            if game.state != STATE_PLAYING:
+                break
+            if buttons & ACTION_JUMP:
+                game.player.jump()
+            if buttons & ACTION_SPECIAL:
+                game.use_special_ability()
+            game.update()
+            self.steps += 1
+            reward += self.reward()
+        self.stale = True
+        if game.render_enabled:
+            self.draw()
+        truncated = game.state == STATE_PLAYING and self.max_steps is not None and self.steps >= self.max_steps
+        done = game.state != STATE_PLAYING or truncated
+        info = {"score": game.score, "lives": game.player.lives, "level": game.current_level,
+                "steps": self.steps, "truncated": truncated}
+        return reward, done, info
+
+    def reward(self):
+        """Return the reward for the step just played"""
+        game = self.game
+        player = game.player
+        reward = (game.score - self.score) * REWARD_SCORE + (self.lives - player.lives) * REWARD_LIFE
+        if game.current_level != self.played_level:
+            self.played_level = game.current_level
+            self.best_x = player.rect.x
+        elif player.rect.x > self.best_x:
+            reward += (player.rect.x - self.best_x) * REWARD_PROGRESS
+            self.best_x = player.rect.x
+        self.score = game.score
+        self.lives = player.lives
+        return reward
+
+    def draw(self):
+        """Bring the environment's screen up to date"""
+        self.game.draw()
+        self.stale = False
+
+    def observe(self, out=None):
+        """Write the current observation into out, a new array by default, and return it"""
+        if self.observation == "tiles":
+            return tile_grid(self.game, out)
+        if self.observation == "pixels":
+            if self.stale:
+                self.draw()
+            return downscaled_pixels(self.game.screen, self.pixel_scale, out)
+        return self.state(out)
+
+    def state(self, out=None):
+        """Write the state vector into out, a new float array by default, and return it"""
+        game = self.game
+        player = game.player
+        x, y = player.rect.center
+        values = [player.rect.x, player.rect.y, player.vel_x, player.vel_y, player.on_ground,
+                  game.camera_offset_x, player.lives, player.power_level, game.time_left]
+        nearby = [enemy for enemy in game.enemies if abs(enemy.rect.centerx - x) < OBSERVATION_RANGE]
+        nearest = heapq.nsmallest(OBSERVATION_ENEMIES, nearby, key=lambda enemy: abs(enemy.rect.centerx - x))
+        for enemy in nearest:
+            values += (enemy.rect.centerx - x, enemy.rect.centery - y, 1.0)
+        values += [0.0] * (OBSERVATION_SIZE - len(values))
+        if out is None:
+            return array('f', values)
+        out[:OBSERVATION_SIZE] = array('f', values)
+        return out
+
+    def close(self):
+        """Shut the game down"""
+        pygame.quit()
+
+
+def shared_views(buffers, typecodes, shape):
+    """Return views of a VectorEnv's observation, reward, done and action buffers
+
+    With NumPy they are arrays, observations having one row per
+    environment; without it they are flat memoryviews.
+    """
+    if np is None:
+        return [memoryview(buffer).cast("B").cast(code) for buffer, code in zip(buffers, typecodes)]
+    views = [np.frombuffer(buffer, dtype=code) for buffer, code in zip(buffers, typecodes)]
+    views[0] = views[0].reshape((-1,) + shape)
+    return views
+
+
+def run_worker(connection, first, count, buffers, typecodes, options):
+    """Serve step and reset commands for environments first to first + count - 1"""
+    envs = [MarioSistersEnv(**options) for _ in range(count)]
+    shape = envs[0].shape
+    observations, rewards, dones, actions = shared_views(buffers, typecodes, shape)
+    if np is None:
+        size = shape[0]
+        rows = [observations[index * size:(index + 1) * size] for index in range(first, first + count)]
+    else:
+        rows = [observations[index] for index in range(first, first + count)]
+    try:
+        while True:
+            command, data = connection.recv()
+            if command == "step":
+                finished = {}
+                for offset, env in enumerate(envs):
+                    index = first + offset
+                    rewards[index], done, info = env.advance(actions[index])
+                    dones[index] = done
+                    if done:
+                        finished[index] = info
+                        env.restart()  # The next seed of the environment's sequence
+                    env.observe(rows[offset])
+                connection.send(finished)
+            elif command == "reset":
+                for offset, env in enumerate(envs):
+                    env.restart(data[first + offset])
+                    env.observe(rows[offset])
+                    dones[first + offset] = False
+                connection.send(None)
+            elif command == "close":
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass  # The parent went away
+    finally:
+        connection.close()
+
+
+class VectorEnv:
+    """num_envs independent games stepped in parallel by worker processes
+
+    The environments are split evenly over the workers, one per CPU by
+    default. Observations, rewards, done flags and actions live in shared
+    memory, so a step only sends one short message to each worker and back.
+    An environment whose episode ends is reset straight away: its row then
+    holds the first observation of the next episode and step() reports the
+    info of the finished one. The returned arrays are reused by the next
+    call, so copy anything that has to outlive it. Options are passed on to
+    every MarioSistersEnv. Without NumPy only "state" observations work, and
+    they come as a two-dimensional memoryview.
+    """
+
+    def __init__(self, num_envs, workers=None, start_method=None, **options):
+        self.num_envs = num_envs
+        self.shape, typecode = observation_spec(options.get("observation", "state"),
+                                                options.get("pixel_scale", PIXEL_SCALE))
+        size = 1
+        for length in self.shape:
+            size *= length
+        context = multiprocessing.get_context(start_method)
+        typecodes = (typecode, "d", "B", "B")
+        self.buffers = tuple(context.RawArray(code, length) for code, length
+                             in zip(typecodes, (num_envs * size, num_envs, num_envs, num_envs)))
+        self.observations, self.rewards, self.dones, self.actions = shared_views(self.buffers, typecodes,
+                                                                                 self.shape)
+        if np is None:
+            self.observations = self.observations.cast("B").cast(typecode, (num_envs, size))
+        workers = max(min(workers or os.cpu_count() or 1, num_envs), 1)
+        self.connections = []
+        self.processes = []
+        first = 0
+        for worker in range(workers):
+            count = num_envs // workers + (worker < num_envs % workers)
+            connection, child = context.Pipe()
+            process = context.Process(target=run_worker, daemon=True,
+                                      args=(child, first, count, self.buffers, typecodes, options))
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+            first += count
+
+    def reset(self, seed=None):
+        """Start a new episode everywhere and return the observations
+
+        Environment i is seeded with seed + i, or randomly without a seed.
+        """
+        if seed is None:
+            seeds = [random.randrange(2 ** 32) for _ in range(self.num_envs)]
+        else:
+            seeds = [seed + index for index in range(self.num_envs)]
+        for connection in self.connections:
+            connection.send(("reset", seeds))
+        for connection in self.connections:
+            connection.recv()
+        return self.observations
+
+    def step(self, actions):
+        """Play one action per environment and return (observations, rewards, dones, infos)
+
+        infos maps the index of every environment that finished an episode
+        to that episode's final info.
+        """
+        for index, action in enumerate(actions):
+            self.actions[index] = action
+        for connection in self.connections:
+            connection.send(("step", None))
+        infos = {}
+        for connection in self.connections:
+            infos.update(connection.recv())
+        return self.observations, self.rewards, self.dones, infos
+
+    def close(self):
+        """Stop the worker processes"""
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.connections = []
+        self.processes = []
@@ -2,19 +2,108 @@
 Main game module for Mario Sisters.
 Handles game states, rendering, and the game loop.
 """
+import os
 import pygame
+import random
 import sys
+import time
 from constants import *
 from player import MariaSister, LuigiettaSister, PeachSister, DaisySister
 from enemies import Goombetta, Koopette, PiranhaQueenPlant, BossetteBowsette
 from platforms import Ground, Brick, QuestionBlock, Pipe, MovingPlatform, FallingPlatform, LevelExit
 from items import Coin, HeelShoe, FeatherCap, PurseItem, StarPower, OneUpMushroom
+from collision import PlatformGroup, SweepIndex
+from render import TerrainGroup, CameraGroup, ScreenUpdater, text_cache, make_overlay, merge_rects
+from replay import LiveInput
+from level import load_level_file, level_path, entity_name, entity_parameters
+from streaming import LevelStream
+from activation import Activation
+from profiler import Profiler
+from snapshot import snapshot, restore
+from rewind import RewindBuffer, REWIND_KEY
+from assets import AssetManager, COMMON_SCOPE, level_scope
+from pool import pools
+from projectiles import Fireball
+import physics
+
+# Entity types of the level format that map straight onto a class
+ENEMY_CLASSES = {
+    "goombetta": Goombetta,
+    "koopette": Koopette,
+    "piranha": PiranhaQueenPlant,
+}
+ITEM_CLASSES = {
+    "coin": Coin,
+    "heels": HeelShoe,
+    "feather": FeatherCap,
+    "purse": PurseItem,
+    "star": StarPower,
+    "1up": OneUpMushroom,
+}
+
+# Instances allocated up front for the classes that are spawned and killed often
+POOL_CAPACITIES = {
+    Coin: 64,
+    Goombetta: 32,
+    Koopette: 16,
+    FeatherCap: 4,
+    HeelShoe: 4,
+    PurseItem: 4,
+    StarPower: 4,
+    OneUpMushroom: 4,
+    Fireball: 4,
+}
+
+HUD_RECT = pygame.Rect(0, 0, SCREEN_WIDTH, 30)
+DIRTY_REGION_LIMIT = 16  # Changed areas redrawn one by one before the whole world is redrawn instead
+IDLE_WAIT_MS = 500  # Longest an unchanged menu sleeps before checking the loop again
+MENU_STATES = (STATE_INTRO, STATE_PAUSE, STATE_GAME_OVER, STATE_WIN)
 
 class Game:
     """Main game class for Mario Sisters"""
     
-    def __init__(self):
-        """Initialize the game"""
+    def __init__(self, headless=False, render=True, sim_rate=SIM_RATE, render_fps=FPS,
+                 interpolate=False, seed=None, batch_physics=False,
+                 activation_margin=ACTIVATION_MARGIN, rewind_seconds=REWIND_SECONDS, profile=False):
+        """Initialize the game
+        
+        A headless game uses the SDL dummy drivers, so the screen is an
+        offscreen surface. With render=False drawing is skipped entirely.
+        sim_rate and render_fps set how often run() updates and draws, and
+        interpolate smooths drawing between simulation steps. Speeds and
+        frame-count timers such as shell_timer are tuned for SIM_RATE
+        steps per second, so sim_rate must be SIM_RATE. All gameplay
+        randomness comes from self.rng, seeded with seed. batch_physics moves
+        enemies and items in one vectorised pass when NumPy is installed
+        and enough of them are awake (see physics.BATCH_MIN_ENTITIES).
+        Enemies and items further than activation_margin from the screen
+        sleep until the camera comes near; None keeps everything awake.
+        The last rewind_seconds of play are kept so holding REWIND_KEY can
+        run the game backwards; 0 turns this off. Levels that are not
+        streamed, or games that add sprites of their own outside level
+        files, cannot be rewound and keep no frames.
+        With profile, frame timings are recorded from the start rather than
+        only while the F3 overlay is shown.
+        """
+        if sim_rate != SIM_RATE:
+            raise ValueError(f"sim_rate must be {SIM_RATE}, gameplay is tuned in steps of 1/{SIM_RATE} s")
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.input = LiveInput()  # Swapped for a recorder or a replay
+        self.headless = headless
+        self.render_enabled = render
+        self.sim_rate = sim_rate
+        self.render_fps = render_fps  # 0 draws as often as possible
+        self.interpolate = interpolate
+        self.profile = profile
+        self.profiler = Profiler()
+        self.profiler.enabled = profile
+        self.render_alpha = 1.0  # How far drawing is between the last two steps
+        self.previous_camera_offset_x = 0
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+        
         pygame.init()
         pygame.display.set_caption(SCREEN_TITLE)
         
@@ -26,49 +115,93 @@ class Game:
         # Font setup
         self.title_font = pygame.font.Font(None, TITLE_FONT_SIZE)
         self.normal_font = pygame.font.Font(None, NORMAL_FONT_SIZE)
+        self.text_cache = text_cache
+        
+        # Overlays are built once and reused every frame
+        self.hud_bg = make_overlay(HUD_RECT.size, BLACK, 150)
+        self.pause_overlay = make_overlay((SCREEN_WIDTH, SCREEN_HEIGHT), BLACK, 150)
+        self.game_over_overlay = make_overlay((SCREEN_WIDTH, SCREEN_HEIGHT), BLACK, 200)
+        self.win_overlay = make_overlay((SCREEN_WIDTH, SCREEN_HEIGHT), (0, 0, 100), 200)  # Dark blue
+        
+        # Only the parts of the screen that changed are redrawn and pushed to the display
+        self.updater = ScreenUpdater()
+        self.drawn_view = None  # What the screen shows, see draw()
+        self.drawn_sprites = {}  # sprite -> (image, screen position) as last drawn
+        self.drawn_hud = None
         
         # Load assets
         self.load_assets()
         
+        # Recycled sprites are allocated once, before play starts
+        for sprite_class, capacity in POOL_CAPACITIES.items():
+            pools.reserve(sprite_class, capacity)
+        
         # Create sprite groups
-        self.all_sprites = pygame.sprite.Group()
-        self.platforms = pygame.sprite.Group()
-        self.enemies = pygame.sprite.Group()
-        self.items = pygame.sprite.Group()
+        self.all_sprites = CameraGroup(indexed=render)  # Indexed by position for drawing
+        self.platforms = PlatformGroup()  # Spatially hashed for collisions
+        self.terrain = TerrainGroup(tilemap=self.platforms.tilemap)  # Static terrain, drawn from baked chunks
+        if batch_physics and physics.available():
+            self.physics = physics.BatchPhysics()
+            self.enemies = physics.PhysicsGroup(self.physics)
+            self.items = physics.PhysicsGroup(self.physics)
+        else:
+            self.physics = None
+            self.enemies = pygame.sprite.Group()
+            self.items = pygame.sprite.Group()
         self.players = pygame.sprite.Group()
+        self.enemy_index = SweepIndex()  # Candidates for collisions with enemies
+        self.item_index = SweepIndex()
+        self.shells = []  # Koopette shells on the move, as of the last step
+        if activation_margin is not None:
+            self.activation = Activation((self.enemies, self.items), activation_margin, self.physics)
+        else:
+            self.activation = None
         
         # Game variables
         self.current_level = 1
         self.score = 0
         self.time_left = 300  # seconds
         self.time_counter = 0
+        self.play_steps = 0  # Steps simulated while playing, the clock sleeping entities use
         self.camera_offset_x = 0
+        self.stream = None  # Streams the current level's chunks in and out
+        self.quick_save = None  # Snapshot taken with F5, restored with F9
+        self.rewind = RewindBuffer(rewind_seconds * sim_rate) if rewind_seconds else None
         
         # Player selection
         self.available_sisters = ["Maria", "Luigietta", "Peach", "Daisy"]
         self.selected_sister = 0
         
     def load_assets(self):
-        """Load game assets like images and sounds"""
-        # For now, we're using colored rectangles
-        # In a full game, this would load sprites, sounds, etc.
-        pass
+        """Start loading the images and sounds every screen uses"""
+        # Decoded on worker threads while the intro screen is up
+        self.assets = AssetManager()
+        self.assets.load_scope(COMMON_SCOPE)
     
     def new_game(self):
         """Start a new game"""
         # Reset game state
         self.score = 0
         self.time_left = 300
+        self.time_counter = 0
+        self.play_steps = 0
         self.current_level = 1
         self.state = STATE_PLAYING
         
-        # Clear sprite groups
+        # Clear sprite groups, returning pooled sprites to their pools
+        if hasattr(self, "player"):
+            self.clear_level()
         self.all_sprites.empty()
         self.platforms.empty()
+        self.terrain.empty()
         self.enemies.empty()
         self.items.empty()
         self.players.empty()
         
+        # Rewinding never reaches back into the previous game
+        if self.rewind is not None:
+            self.rewind.clear()
+        
         # Create the player based on selection
         self.create_player()
         
@@ -96,100 +229,190 @@ class Game:
     def load_level(self, level_number):
         """Load a level by its number"""
         # Clear existing level objects
-        for sprite in self.all_sprites:
-            if sprite != self.player:
-                sprite.kill()
+        self.clear_level()
         
         # Reset camera
         self.camera_offset_x = 0
         
-        # Create level elements based on level number
-        if level_number == 1:
-            self.create_level_1()
-        elif level_number == 2:
-            self.create_level_2()
-        elif level_number == 3:
-            self.create_boss_level()
-    
-    def create_level_1(self):
-        """Create the first level layout"""
-        # Ground platforms
-        for x in range(0, SCREEN_WIDTH * 3, TILE_SIZE):
-            if 700 < x < 900 or 1100 < x < 1300:  # Create some gaps
-                continue
-            ground = Ground(x, SCREEN_HEIGHT - TILE_SIZE, TILE_SIZE)
-            self.platforms.add(ground)
-            self.all_sprites.add(ground)
-        
-        # Add some blocks
-        for x in range(300, 500, TILE_SIZE):
-            brick = Brick(x, SCREEN_HEIGHT - TILE_SIZE * 4)
-            self.platforms.add(brick)
-            self.all_sprites.add(brick)
-        
-        # Question blocks with items
-        q_block1 = QuestionBlock(350, SCREEN_HEIGHT - TILE_SIZE * 7, "coin")
-        q_block2 = QuestionBlock(450, SCREEN_HEIGHT - TILE_SIZE * 7, "heels")
-        self.platforms.add(q_block1, q_block2)
-        self.all_sprites.add(q_block1, q_block2)
-        
-        # Pipes
-        pipe1 = Pipe(600, SCREEN_HEIGHT, 2)
-        pipe2 = Pipe(1000, SCREEN_HEIGHT, 3)
-        self.platforms.add(pipe1, pipe2)
-        self.all_sprites.add(pipe1, pipe2)
-        
-        # Moving platform
-        moving_plat = MovingPlatform(800, SCREEN_HEIGHT - TILE_SIZE * 4, 
-                                    TILE_SIZE * 3, "horizontal", 200, 1)
-        self.platforms.add(moving_plat)
-        self.all_sprites.add(moving_plat)
-        
-        # Enemies
-        goombetta1 = Goombetta(400, SCREEN_HEIGHT - TILE_SIZE * 2)
-        goombetta2 = Goombetta(800, SCREEN_HEIGHT - TILE_SIZE * 2)
-        koopette = Koopette(1200, SCREEN_HEIGHT - TILE_SIZE * 2)
-        self.enemies.add(goombetta1, goombetta2, koopette)
-        self.all_sprites.add(goombetta1, goombetta2, koopette)
-        
-        # Items/coins
-        for x in range(350, 550, TILE_SIZE):
-            coin = Coin(x, SCREEN_HEIGHT - TILE_SIZE * 10)
-            self.items.add(coin)
-            self.all_sprites.add(coin)
-        
-        # Level exit
-        self.exit = LevelExit(SCREEN_WIDTH * 2.8, SCREEN_HEIGHT)
-        self.all_sprites.add(self.exit)
-    
-    def create_level_2(self):
-        """Create the second level layout"""
-        # This would have a similar structure to level 1 but with different layout
-        # and more complex elements
-        # For brevity, we'll just add a placeholder message
-        print("Level 2 would be created here")
-    
-    def create_boss_level(self):
-        """Create the final boss level"""
-        # This would create a boss arena with the Bossette/Bowsette boss
-        # For brevity, we'll just add a placeholder message
-        print("Boss level would be created here")
+        # Free the previous level's assets and start on this one's
+        scope = level_scope(level_number)
+        for loaded in [loaded for loaded in self.assets.scopes if loaded not in (COMMON_SCOPE, scope)]:
+            self.assets.release_scope(loaded)
+        self.assets.load_scope(scope)
+        
+        # Level files are compiled to a binary cache on first load
+        self.build_level(load_level_file(level_path(level_number)))
+        
+        # Static terrain is drawn from pre-rendered chunks
+        self.terrain.bake()
+    
+    def clear_level(self):
+        """Remove every level object except the player"""
+        self.stream = None
+        for sprite in self.all_sprites:
+            if sprite != self.player:
+                sprite.kill()
+        # Drop the baked chunks first so killing terrain does not re-render them
+        terrain = self.terrain.sprites()
+        self.terrain.empty()
+        for sprite in terrain:
+            sprite.kill()
+    
+    def add_platform(self, *platforms):
+        """Add platforms to the level, keeping static terrain out of the sprite draw loop"""
+        for platform in platforms:
+            self.platforms.add(platform)
+            if platform.tile_code:
+                self.terrain.add(platform)
+            else:
+                self.all_sprites.add(platform)
+    
+    def build_level(self, level, stream=True):
+        """Populate the game from loaded LevelData
+        
+        With stream, entities only exist in the chunks around the camera;
+        otherwise the whole level is spawned at once.
+        """
+        # The tile layer goes straight into the collision tile map
+        self.platforms.load_tiles(level.tiles, level.columns)
+        if stream:
+            self.stream = LevelStream(self, level)
+            self.stream.start(self.camera_offset_x)
+        else:
+            for record in level.entities:
+                self.spawn_entity(record[0], record[1], record[2], entity_parameters(record[0], record))
+    
+    def spawn_entity(self, code, x, y, params):
+        """Create one entity of a level, add it to the right groups and return it"""
+        kind = entity_name(code)
+        if kind == "ground":
+            sprite = Ground(x, y, params["width"])
+        elif kind == "brick":
+            sprite = Brick(x, y)
+        elif kind == "question":
+            sprite = QuestionBlock(x, y, params["item"])
+        elif kind == "pipe":
+            sprite = Pipe(x, y, params["height"])
+        elif kind == "moving_platform":
+            sprite = MovingPlatform(x, y, params["width"], params["movement"],
+                                    params["distance"], params["speed"])
+        elif kind == "falling_platform":
+            sprite = FallingPlatform(x, y, params["width"])
+        elif kind == "exit":
+            self.exit = sprite = LevelExit(x, y)
+            self.all_sprites.add(sprite)
+            return sprite
+        elif kind in ENEMY_CLASSES or kind == "bossette":
+            if kind == "bossette":
+                sprite = BossetteBowsette(x, y, self.rng)  # Attacks draw on the game's seeded RNG
+            elif ENEMY_CLASSES[kind] in pools:
+                sprite = pools.acquire(ENEMY_CLASSES[kind], x, y)
+            else:
+                sprite = ENEMY_CLASSES[kind](x, y)
+            self.enemies.add(sprite)
+            self.all_sprites.add(sprite)
+            return sprite
+        else:
+            sprite = pools.acquire(ITEM_CLASSES[kind], x, y)
+            self.items.add(sprite)
+            self.all_sprites.add(sprite)
+            return sprite
+        self.add_platform(sprite)
+        return sprite
     
     def run(self):
-        """Main game loop"""
+        """Main game loop
+        
+        The world advances in fixed steps of 1 / sim_rate seconds however
+        fast frames are drawn. When drawing falls behind, at most
+        MAX_CATCHUP_STEPS updates run before the next frame and the rest of
+        the backlog is dropped, so the game skips frames instead of slowing down.
+        """
+        step_time = 1.0 / self.sim_rate
+        accumulator = 0.0
+        previous = time.perf_counter()
         while self.running:
-            self.clock.tick(FPS)
+            self.clock.tick(self.render_fps)
+            now = time.perf_counter()
+            accumulator += now - previous
+            previous = now
+            
+            self.profiler.begin_frame()
             self.events()
-            self.update()
+            self.assets.poll()
+            if self.profiler.active:
+                self.profiler.mark("assets")
+            steps = 0
+            while accumulator >= step_time and steps < MAX_CATCHUP_STEPS:
+                self.update()
+                accumulator -= step_time
+                steps += 1
+            if accumulator >= step_time:
+                accumulator %= step_time  # Too far behind, drop the backlog
+            
+            if self.render_enabled:
+                self.render_alpha = accumulator / step_time if self.interpolate else 1.0
+                self.draw()
+            self.profiler.end_frame()
+            
+            # A menu that is fully drawn only changes on input, so sleep until some arrives
+            if self.idle():
+                self.wait_for_input()
+                previous = time.perf_counter()
+        self.assets.close()
+    
+    def idle(self):
+        """Return True if nothing on screen can change without input"""
+        return (self.running and self.render_enabled and self.state in MENU_STATES and
+                self.drawn_view == self.menu_view() and not self.profiler.visible and
+                not self.assets.loading())
+    
+    def wait_for_input(self):
+        """Block until an event is queued, or for at most IDLE_WAIT_MS"""
+        if pygame.event.peek():
+            return
+        event = pygame.event.wait(IDLE_WAIT_MS)
+        if event.type != pygame.NOEVENT:
+            pygame.event.post(event)  # The queue was empty, so this keeps the order
+    
+    def step(self):
+        """Advance the game by one frame without waiting on the clock"""
+        self.profiler.begin_frame()
+        self.events()
+        self.assets.poll()
+        if self.profiler.active:
+            self.profiler.mark("assets")
+        self.update()
+        if self.render_enabled:
             self.draw()
+        self.profiler.end_frame()
+    
+    def simulate(self, frames):
+        """Step up to frames frames as fast as possible and return the elapsed seconds"""
+        start = time.perf_counter()
+        for _ in range(frames):
+            if not self.running:
+                break
+            self.step()
+        return time.perf_counter() - start
     
     def events(self):
         """Handle game events"""
-        for event in pygame.event.get():
+        for event in self.input.get_events():
             if event.type == pygame.QUIT:
                 self.running = False
             
+            # The window system lost what was on screen
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.drawn_view = None
+            
             if event.type == pygame.KEYDOWN:
+                # Debug keys work on every screen
+                if event.key == pygame.K_F3:
+                    self.toggle_profiler()
+                if event.key == pygame.K_F4:
+                    self.dump_profile()
+                
                 if event.key == pygame.K_ESCAPE:
                     if self.state == STATE_PLAYING:
                         self.state = STATE_PAUSE
@@ -208,40 +431,81 @@ class Game:
                     if event.key == pygame.K_UP or event.key == pygame.K_SPACE:
                         self.player.jump()
                     if event.key == pygame.K_z or event.key == pygame.K_LSHIFT:
-                        self.player.use_special_ability()
+                        self.use_special_ability()
                     # Add direct key handling for left/right movement
                     if event.key == pygame.K_LEFT:
                         self.player.move_left()
                     if event.key == pygame.K_RIGHT:
                         self.player.move_right()
+                    if event.key == pygame.K_F5:
+                        self.quick_save = snapshot(self)
+                    if event.key == pygame.K_F9 and self.quick_save is not None:
+                        restore(self, self.quick_save)
                 
                 elif self.state == STATE_GAME_OVER or self.state == STATE_WIN:
                     if event.key == pygame.K_RETURN:
                         self.state = STATE_INTRO
+        if self.profiler.active:
+            self.profiler.mark("events")
+    
+    def use_special_ability(self):
+        """Trigger the sister's special ability, drawing any fireballs she throws"""
+        if self.player.use_special_ability() and hasattr(self.player, "fireballs"):
+            self.all_sprites.add(self.player.fireballs)
+    
+    def toggle_profiler(self):
+        """Show or hide the frame-time graph, recording while it is shown"""
+        self.profiler.visible = not self.profiler.visible
+        self.profiler.enabled = self.profiler.visible or self.profile
+        self.drawn_view = None  # Redraw what the graph covered
+    
+    def dump_profile(self, path=None):
+        """Write the recorded frames to path.csv and path.json and return the two paths"""
+        if path is None:
+            path = time.strftime("profile-%Y%m%d-%H%M%S")
+        self.profiler.write_csv(path + ".csv")
+        self.profiler.write_chrome_trace(path + ".json")
+        return path + ".csv", path + ".json"
     
     def update(self):
         """Update game state"""
+        # Held keys are read once per step, so recordings see every step
+        keys = self.input.get_pressed()
+        profiler = self.profiler if self.profiler.active else None
+        
         if self.state == STATE_PLAYING:
+            # Holding the rewind key steps back through recent frames instead
+            if self.rewind is not None and keys[REWIND_KEY]:
+                self.rewind.rewind(self)
+                if profiler:
+                    profiler.mark("rewind")
+                return
+            
             # Update time
+            self.play_steps += 1
             self.time_counter += 1
-            if self.time_counter >= FPS:  # Every second
+            if self.time_counter >= self.sim_rate:  # Every second
                 self.time_counter = 0
                 self.time_left -= 1
                 if self.time_left <= 0:
                     self.game_over()
             
-            # Get keyboard input for player movement
-            keys = pygame.key.get_pressed()
             # Ensure continuous movement while keys are held down
             if keys[pygame.K_LEFT]:
                 self.player.move_left()
             if keys[pygame.K_RIGHT]:
                 self.player.move_right()
             
+            # Remember where things were for render interpolation
+            if self.interpolate:
+                self.store_previous_positions()
+            
             # Update moving platforms
-            for platform in self.platforms:
-                if isinstance(platform, MovingPlatform) or isinstance(platform, FallingPlatform):
-                    platform.update()
+            self.platforms.update_active()
+            for platform in self.platforms.active:
+                self.all_sprites.relocate(platform)
+            if profiler:
+                profiler.mark("platforms")
             
             # Update player
             self.player.update(self.platforms)
@@ -249,43 +513,127 @@ class Game:
             # Check if player fell off the screen
             if self.player.rect.top > SCREEN_HEIGHT:
                 self.player_died()
+            self.all_sprites.relocate(self.player)
+            if profiler:
+                profiler.mark("player")
             
             # Update camera to follow player
             self.update_camera()
             
+            # Stream level chunks in and out around the camera
+            if self.stream is not None:
+                self.stream.update(self.camera_offset_x)
+            
+            # Only entities near the camera stay in the enemy and item groups
+            if self.activation is not None:
+                self.activation.update(self.camera_offset_x, self.play_steps)
+            if profiler:
+                profiler.mark("camera")
+            
+            # Batched physics moves the enemies and items it manages in one pass
+            if self.physics is not None:
+                self.physics.step(self.platforms, self.physics_regions())
+            
             # Update enemies
+            shells = []
             for enemy in self.enemies:
-                enemy.update(self.platforms)
-                
-                # Check for player collision with enemy
-                if pygame.sprite.collide_rect(self.player, enemy):
-                    # Check if stomping (player is above and falling)
-                    if (self.player.rect.bottom < enemy.rect.centery and 
-                        self.player.vel_y > 0):
+                if self.physics is None or enemy not in self.physics:
+                    enemy.update(self.platforms)
+                self.all_sprites.relocate(enemy)
+                if enemy.shell_mode:
+                    shells.append(enemy)
+            
+            # Collisions with enemies are looked up in an index sorted along x
+            self.enemy_index.build(self.enemies)
+            
+            # Check for player collision with enemies
+            for enemy in self.enemy_index.query(self.player.rect):
+                # Check if stomping (player is above and falling)
+                if (self.player.rect.bottom < enemy.rect.centery and 
+                    self.player.vel_y > 0):
+                    self.score += enemy.stomp()
+                    self.player.vel_y = PLAYER_JUMP * 0.5  # Bounce
+                    if enemy.shell_mode and enemy not in shells:
+                        shells.append(enemy)
+                else:
+                    # Player gets hit
+                    self.player_hit()
+            
+            # Moving shells knock out the enemies they run into
+            for shell in shells:
+                if not shell.alive():
+                    continue  # Knocked out by another shell first
+                for enemy in self.enemy_index.query(shell.rect):
+                    if enemy is shell or not enemy.alive():
+                        continue
+                    self.score += enemy.knock_out()
+                    if enemy.alive():
+                        # Bounced off, unless already heading away
+                        if (enemy.rect.centerx - shell.rect.centerx) * shell.direction > 0:
+                            shell.direction *= -1
+                        break
+            self.shells = shells
+            
+            # Update fireballs
+            for fireball in getattr(self.player, "fireballs", ()):
+                fireball.update(self.platforms)
+                if not fireball.alive():
+                    continue
+                self.all_sprites.relocate(fireball)
+                for enemy in self.enemy_index.query(fireball.rect):
+                    if enemy.alive():
                         self.score += enemy.stomp()
-                        self.player.vel_y = PLAYER_JUMP * 0.5  # Bounce
-                    else:
-                        # Player gets hit
-                        self.player_hit()
+                        fireball.kill()
+                        break
+            if profiler:
+                profiler.mark("enemies")
             
             # Update items
             for item in self.items:
-                item.update(self.platforms)
-                
-                # Check if player collected item
-                if pygame.sprite.collide_rect(self.player, item):
-                    if isinstance(item, Coin):
-                        self.score += item.value
-                        item.kill()
-                    else:
-                        # Apply power-up effect
-                        item.apply_effect(self.player)
-                        item.kill()
+                if self.physics is None or item not in self.physics:
+                    item.update(self.platforms)
+                self.all_sprites.relocate(item)
+            
+            # Check if player collected items
+            self.item_index.build(self.items)
+            for item in self.item_index.query(self.player.rect):
+                if isinstance(item, Coin):
+                    self.score += item.value
+                    item.kill()
+                else:
+                    # Apply power-up effect
+                    item.apply_effect(self.player)
+                    item.kill()
+            if profiler:
+                profiler.mark("items")
             
             # Check for level exit
             if pygame.sprite.collide_rect(self.player, self.exit):
                 self.exit.touch()
                 self.complete_level()
+            
+            # Keep this frame for rewinding, unless play has just ended
+            if self.rewind is not None and self.state == STATE_PLAYING:
+                self.rewind.capture(self)
+                if profiler:
+                    profiler.mark("rewind")
+                    profiler.count("rewind_kb", self.rewind.size / 1024)
+    
+    def physics_regions(self):
+        """Return the rects the game checks enemies and items against this step"""
+        regions = [pygame.Rect(-self.camera_offset_x, 0, SCREEN_WIDTH, SCREEN_HEIGHT), self.player.rect]
+        regions += [fireball.rect for fireball in getattr(self.player, "fireballs", ())]
+        regions += [shell.rect for shell in self.shells]
+        return regions
+    
+    def store_previous_positions(self):
+        """Record the camera and moving sprites before a step so drawing can blend"""
+        self.previous_camera_offset_x = self.camera_offset_x
+        for group in (self.players, self.enemies, self.items, getattr(self.player, "fireballs", ())):
+            for sprite in group:
+                sprite.previous_pos = sprite.rect.topleft
+        for platform in self.platforms.active:
+            platform.previous_pos = platform.rect.topleft
     
     def update_camera(self):
         """Update camera position to follow player"""
@@ -339,7 +687,7 @@ class Game:
         
         # Move to next level
         self.current_level += 1
-        if self.current_level > 3:  # Assuming 3 levels total
+        if self.current_level > LEVEL_COUNT:
             self.win_game()
         else:
             self.load_level(self.current_level)
@@ -353,66 +701,146 @@ class Game:
         self.state = STATE_WIN
     
     def draw(self):
-        """Draw everything to the screen"""
-        self.screen.fill(SKY_BLUE)  # Sky background
+        """Draw what changed on screen and push only that to the display
         
-        if self.state == STATE_INTRO:
-            self.draw_intro()
-        elif self.state == STATE_PLAYING:
-            self.draw_game()
-        elif self.state == STATE_PAUSE:
+        drawn_view records what the screen shows: the camera position and
+        terrain version while playing, or the state of a menu. Menus are
+        composed once and then left alone until their view changes.
+        """
+        if self.state == STATE_PLAYING:
             self.draw_game()
-            self.draw_pause()
-        elif self.state == STATE_GAME_OVER:
-            self.draw_game_over()
-        elif self.state == STATE_WIN:
-            self.draw_win()
-        
-        pygame.display.flip()
+        else:
+            self.draw_menu()
+        
+        profiler = self.profiler if self.profiler.active else None
+        if profiler:
+            profiler.mark("hud")
+        if self.profiler.visible:
+            self.updater.add(self.profiler.draw(self.screen, SCREEN_WIDTH - 250, 40))
+            if profiler:
+                profiler.mark("profiler")
+        
+        self.updater.present()
+        if profiler:
+            profiler.mark("present")
     
-    def draw_game(self):
-        """Draw the main gameplay elements"""
-        # Apply camera offset to all sprites
-        for sprite in self.all_sprites:
-            offset_rect = sprite.rect.copy()
-            offset_rect.x += self.camera_offset_x
-            
-            # Only draw if on screen
-            if -TILE_SIZE < offset_rect.x < SCREEN_WIDTH + TILE_SIZE:
-                self.screen.blit(sprite.image, offset_rect)
-        
-        # Draw HUD
-        self.draw_hud()
+    def menu_view(self):
+        """Return what a menu screen shows, to tell when it must be redrawn"""
+        if self.state == STATE_INTRO:
+            return (STATE_INTRO, self.selected_sister)
+        if self.state in (STATE_GAME_OVER, STATE_WIN):
+            return (self.state, self.score)
+        return (self.state,)
+    
+    def draw_menu(self):
+        """Compose a menu screen once, then redraw only the intro selection as it moves"""
+        view = self.menu_view()
+        if view == self.drawn_view:
+            return
+        if self.state == STATE_INTRO and self.drawn_view and self.drawn_view[0] == STATE_INTRO:
+            for index in (self.drawn_view[1], self.selected_sister):
+                self.draw_intro_option(index)
+        else:
+            if self.state == STATE_PAUSE:
+                self.draw_game(full=True)  # The frozen world, drawn once under the overlay
+            else:
+                self.screen.fill(SKY_BLUE)  # Sky background
+            if self.state == STATE_INTRO:
+                self.draw_intro()
+            elif self.state == STATE_PAUSE:
+                self.draw_pause()
+            elif self.state == STATE_GAME_OVER:
+                self.draw_game_over()
+            elif self.state == STATE_WIN:
+                self.draw_win()
+            self.updater.invalidate()
+        self.drawn_view = view
+    
+    def draw_game(self, full=False):
+        """Draw the main gameplay elements
+        
+        While the camera and terrain stay put, only the areas that sprites
+        left or entered, plus the HUD when its text changes, are redrawn.
+        """
+        offset_x = self.camera_offset_x
+        alpha = None
+        if self.interpolate and self.render_alpha < 1.0:
+            alpha = self.render_alpha
+            offset_x = round(self.previous_camera_offset_x +
+                             (offset_x - self.previous_camera_offset_x) * alpha)
+        
+        # Only the sprites that overlap the camera window are drawn
+        placed = self.all_sprites.placements(offset_x, alpha)
+        hud = (self.score, self.player.lives, self.time_left, self.player.name)
+        view = (STATE_PLAYING, offset_x, self.terrain.version)
+        if full or view != self.drawn_view:
+            regions = [self.screen.get_rect()]
+        else:
+            regions = []
+            drawn = self.drawn_sprites
+            for sprite, placement in placed.items():
+                previous = drawn.get(sprite)
+                if previous != placement:
+                    regions.append(placement[0].get_rect(topleft=placement[1]))
+                    if previous is not None:
+                        regions.append(previous[0].get_rect(topleft=previous[1]))
+            for sprite, previous in drawn.items():
+                if sprite not in placed:
+                    regions.append(previous[0].get_rect(topleft=previous[1]))
+            if hud != self.drawn_hud:
+                regions.append(HUD_RECT)
+            regions = merge_rects(regions)
+            if len(regions) > DIRTY_REGION_LIMIT:
+                regions = [self.screen.get_rect()]
+        self.drawn_view = view
+        self.drawn_sprites = placed
+        self.drawn_hud = hud
+        
+        screen = self.screen
+        for rect in regions:
+            screen.set_clip(rect)
+            screen.fill(SKY_BLUE)  # Sky background
+            # Static terrain comes from the one or two visible baked chunks
+            self.terrain.draw_visible(screen, offset_x)
+            screen.blits([placement for placement in placed.values()
+                          if rect.colliderect(placement[0].get_rect(topleft=placement[1]))], False)
+            self.updater.add(rect)
+        if self.profiler.active:
+            self.profiler.mark("world")
+        
+        # Draw HUD over whatever was redrawn beneath it
+        for rect in regions:
+            if rect.colliderect(HUD_RECT):
+                screen.set_clip(rect)
+                self.draw_hud()
+        screen.set_clip(None)
     
     def draw_hud(self):
         """Draw the heads-up display with score, time, etc."""
         # Background for HUD
-        hud_bg = pygame.Surface((SCREEN_WIDTH, 30))
-        hud_bg.fill(BLACK)
-        hud_bg.set_alpha(150)  # Semi-transparent
-        self.screen.blit(hud_bg, (0, 0))
+        self.screen.blit(self.hud_bg, (0, 0))
         
         # Score
-        score_text = self.normal_font.render(f"SCORE: {self.score}", True, WHITE)
+        score_text = self.text_cache.render(self.normal_font, f"SCORE: {self.score}", WHITE)
         self.screen.blit(score_text, (10, 5))
         
         # Lives
-        lives_text = self.normal_font.render(f"LIVES: {self.player.lives}", True, WHITE)
+        lives_text = self.text_cache.render(self.normal_font, f"LIVES: {self.player.lives}", WHITE)
         self.screen.blit(lives_text, (200, 5))
         
         # Time
-        time_text = self.normal_font.render(f"TIME: {self.time_left}", True, WHITE)
+        time_text = self.text_cache.render(self.normal_font, f"TIME: {self.time_left}", WHITE)
         self.screen.blit(time_text, (SCREEN_WIDTH - 150, 5))
         
         # Sister name
-        name_text = self.normal_font.render(f"SISTER: {self.player.name}", True, WHITE)
+        name_text = self.text_cache.render(self.normal_font, f"SISTER: {self.player.name}", WHITE)
         self.screen.blit(name_text, (SCREEN_WIDTH // 2 - 100, 5))
     
     def draw_intro(self):
         """Draw the intro/title screen"""
         # Title
-        title_text = self.title_font.render("MARIO SISTERS", True, RED)
-        subtitle_text = self.normal_font.render("A Satirical Adventure", True, WHITE)
+        title_text = self.text_cache.render(self.title_font, "MARIO SISTERS", RED)
+        subtitle_text = self.text_cache.render(self.normal_font, "A Satirical Adventure", WHITE)
         
         title_rect = title_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//4))
         subtitle_rect = subtitle_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//4 + 50))
@@ -421,93 +849,91 @@ class Game:
         self.screen.blit(subtitle_text, subtitle_rect)
         
         # Character selection
-        select_text = self.normal_font.render("Select Your Sister:", True, WHITE)
+        select_text = self.text_cache.render(self.normal_font, "Select Your Sister:", WHITE)
         select_rect = select_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 30))
         self.screen.blit(select_text, select_rect)
         
         # Display character options
-        for i, sister in enumerate(self.available_sisters):
-            color = YELLOW if i == self.selected_sister else WHITE
-            sister_text = self.normal_font.render(sister, True, color)
-            pos_y = SCREEN_HEIGHT//2 + i * 30
-            sister_rect = sister_text.get_rect(center=(SCREEN_WIDTH//2, pos_y))
-            self.screen.blit(sister_text, sister_rect)
+        for i in range(len(self.available_sisters)):
+            self.draw_intro_option(i)
         
         # Instructions
-        instr_text = self.normal_font.render("Press UP/DOWN to select, ENTER to start", True, WHITE)
+        instr_text = self.text_cache.render(self.normal_font, "Press UP/DOWN to select, ENTER to start", WHITE)
         instr_rect = instr_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT - 100))
         self.screen.blit(instr_text, instr_rect)
         
         # Copyright
-        copyright_text = self.normal_font.render("© 2025 Satirical Games Inc.", True, WHITE)
+        copyright_text = self.text_cache.render(self.normal_font, "© 2025 Satirical Games Inc.", WHITE)
         copyright_rect = copyright_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT - 50))
         self.screen.blit(copyright_text, copyright_rect)
     
+    def draw_intro_option(self, index):
+        """Draw one sister's row of the intro menu, highlighted if selected"""
+        pos_y = SCREEN_HEIGHT//2 + index * 30
+        row = pygame.Rect(0, pos_y - 15, SCREEN_WIDTH, 30)
+        self.screen.fill(SKY_BLUE, row)
+        color = YELLOW if index == self.selected_sister else WHITE
+        sister_text = self.text_cache.render(self.normal_font, self.available_sisters[index], color)
+        sister_rect = sister_text.get_rect(center=(SCREEN_WIDTH//2, pos_y))
+        self.screen.blit(sister_text, sister_rect)
+        self.updater.add(row)
+    
     def draw_pause(self):
         """Draw the pause screen overlay"""
         # Semi-transparent overlay
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.fill(BLACK)
-        overlay.set_alpha(150)
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.pause_overlay, (0, 0))
         
         # Pause text
-        pause_text = self.title_font.render("PAUSED", True, WHITE)
+        pause_text = self.text_cache.render(self.title_font, "PAUSED", WHITE)
         pause_rect = pause_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
         self.screen.blit(pause_text, pause_rect)
         
         # Instructions
-        instr_text = self.normal_font.render("Press ESC to resume", True, WHITE)
+        instr_text = self.text_cache.render(self.normal_font, "Press ESC to resume", WHITE)
         instr_rect = instr_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50))
         self.screen.blit(instr_text, instr_rect)
     
     def draw_game_over(self):
         """Draw the game over screen"""
         # Semi-transparent overlay
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.fill(BLACK)
-        overlay.set_alpha(200)
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.game_over_overlay, (0, 0))
         
         # Game Over text
-        over_text = self.title_font.render("GAME OVER", True, RED)
+        over_text = self.text_cache.render(self.title_font, "GAME OVER", RED)
         over_rect = over_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//3))
         self.screen.blit(over_text, over_rect)
         
         # Score
-        score_text = self.normal_font.render(f"Final Score: {self.score}", True, WHITE)
+        score_text = self.text_cache.render(self.normal_font, f"Final Score: {self.score}", WHITE)
         score_rect = score_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
         self.screen.blit(score_text, score_rect)
         
         # Restart instructions
-        restart_text = self.normal_font.render("Press ENTER to return to title screen", True, WHITE)
+        restart_text = self.text_cache.render(self.normal_font, "Press ENTER to return to title screen", WHITE)
         restart_rect = restart_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50))
         self.screen.blit(restart_text, restart_rect)
     
     def draw_win(self):
         """Draw the victory screen"""
         # Semi-transparent overlay
-        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-        overlay.fill((0, 0, 100))  # Dark blue
-        overlay.set_alpha(200)
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.win_overlay, (0, 0))
         
         # Victory text
-        win_text = self.title_font.render("YOU WIN!", True, YELLOW)
+        win_text = self.text_cache.render(self.title_font, "YOU WIN!", YELLOW)
         win_rect = win_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//3))
         self.screen.blit(win_text, win_rect)
         
         # Satirical message
-        message_text = self.normal_font.render("The princesses saved themselves!", True, WHITE)
+        message_text = self.text_cache.render(self.normal_font, "The princesses saved themselves!", WHITE)
         message_rect = message_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
         self.screen.blit(message_text, message_rect)
         
         # Score
-        score_text = self.normal_font.render(f"Final Score: {self.score}", True, WHITE)
+        score_text = self.text_cache.render(self.normal_font, f"Final Score: {self.score}", WHITE)
         score_rect = score_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 40))
         self.screen.blit(score_text, score_rect)
         
         # Return instructions
-        return_text = self.normal_font.render("Press ENTER to return to title screen", True, WHITE)
+        return_text = self.text_cache.render(self.normal_font, "Press ENTER to return to title screen", WHITE)
         return_rect = return_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 80))
         self.screen.blit(return_text, return_rect)
\ No newline at end of file
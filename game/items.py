@@ -5,20 +5,36 @@ Contains collectibles, power-ups, and other items.
 import pygame
 import random
 from constants import *
+from collision import collide_platforms
+from pool import PooledSprite
+from render import surface_cache
 
-class Item(pygame.sprite.Sprite):
+class Item(PooledSprite):
     """Base class for all collectible items"""
     
+    batch_physics = "item"  # Movement the batched physics engine can replicate
+    sleep_policy = "resume"  # Items have no timers that matter off-screen
+    snapshot_fields = (("vel_x", "d"), ("vel_y", "d"))  # Stored after the position
+    
     def __init__(self, x, y, width, height, color):
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.Surface((width, height))
-        self.image.fill(color)
+        self.image = surface_cache.get((width, height), color)
+        self.color = color
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
         
         self.vel_x = 0
         self.vel_y = 0
+    
+    def reset(self, x, y):
+        """Put a recycled item back at a spawn point in its starting state"""
+        self.image = surface_cache.get(self.rect.size, self.color)
+        self.rect.x = x
+        self.rect.y = y
+        self.vel_x = 0
+        self.vel_y = 0
+        self.previous_pos = None
         
     def update(self, platforms):
         """Update item position and apply physics"""
@@ -32,30 +48,41 @@ class Item(pygame.sprite.Sprite):
         # Check for collisions with platforms
         self.check_collisions(platforms)
     
+    def batch_ready(self):
+        """Return True while update() is the plain batch_physics movement"""
+        return True
+    
+    def restored(self):
+        """Bring state derived from restored snapshot_fields, like the image, back in line"""
+        pass
+    
     def check_collisions(self, platforms):
         """Basic collision detection"""
         # Vertical collisions
-        hits = pygame.sprite.spritecollide(self, platforms, False)
+        hits = collide_platforms(self, platforms)
         if hits:
             if self.vel_y > 0:  # Falling
-                self.rect.bottom = hits[0].rect.top
+                self.rect.bottom = hits[0].top
                 self.vel_y = 0
                 
         # Horizontal collisions
-        for platform in hits:
+        for platform_rect in hits:
             if self.vel_x > 0:  # Moving right
-                if self.rect.right > platform.rect.left and self.rect.right < platform.rect.right:
-                    self.rect.right = platform.rect.left
+                if self.rect.right > platform_rect.left and self.rect.right < platform_rect.right:
+                    self.rect.right = platform_rect.left
                     self.vel_x *= -1  # Bounce
             elif self.vel_x < 0:  # Moving left
-                if self.rect.left < platform.rect.right and self.rect.left > platform.rect.left:
-                    self.rect.left = platform.rect.right
+                if self.rect.left < platform_rect.right and self.rect.left > platform_rect.left:
+                    self.rect.left = platform_rect.right
                     self.vel_x *= -1  # Bounce
 
 
 class Coin(Item):
     """Basic collectible coin"""
     
+    batch_physics = "coin"
+    snapshot_fields = Item.snapshot_fields + (("bob_direction", "b"), ("start_y", "d"), ("current_bob", "d"))
+    
     def __init__(self, x, y):
         super().__init__(x, y, TILE_SIZE//2, TILE_SIZE//2, YELLOW)
         self.value = 100
@@ -68,6 +95,12 @@ class Coin(Item):
         self.start_y = y
         self.current_bob = 0
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.bob_direction = 1
+        self.start_y = y
+        self.current_bob = 0
+    
     def update(self, platforms=None):
         """Coins don't fall, they bob up and down"""
         if self.bobbing:
@@ -86,6 +119,10 @@ class FeatherCap(Item):
         self.vel_x = 2  # Moves horizontally
         self.power_type = "cape"
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 2
+    
     def apply_effect(self, player):
         """Apply the cape power to the player"""
         player.power_level = 2
@@ -100,6 +137,10 @@ class HeelShoe(Item):
         self.vel_x = 2  # Moves horizontally
         self.power_type = "heels"
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 2
+    
     def apply_effect(self, player):
         """Apply the heel power to the player"""
         player.power_level = 1
@@ -114,6 +155,10 @@ class PurseItem(Item):
         self.vel_x = 2  # Moves horizontally
         self.power_type = "purse"
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 2
+    
     def apply_effect(self, player):
         """Apply the purse power to the player"""
         player.power_level = 3
@@ -123,6 +168,9 @@ class PurseItem(Item):
 class StarPower(Item):
     """Temporary invincibility star"""
     
+    batch_physics = None
+    snapshot_fields = Item.snapshot_fields + (("color_index", "b"), ("color_timer", "b"), ("cycling", "?"))
+    
     def __init__(self, x, y):
         super().__init__(x, y, TILE_SIZE, TILE_SIZE, (255, 215, 0))  # Gold
         self.vel_x = 3
@@ -133,6 +181,15 @@ class StarPower(Item):
         self.colors = [RED, ORANGE, YELLOW, GREEN, BLUE, PURPLE]
         self.color_index = 0
         self.color_timer = 0
+        self.cycling = False  # Still gold until the first colour change
+    
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 3
+        self.vel_y = -5
+        self.color_index = 0
+        self.color_timer = 0
+        self.cycling = False
     
     def update(self, platforms):
         """Stars bounce around the level"""
@@ -147,7 +204,13 @@ class StarPower(Item):
         if self.color_timer >= 5:
             self.color_timer = 0
             self.color_index = (self.color_index + 1) % len(self.colors)
-            self.image.fill(self.colors[self.color_index])
+            self.image = surface_cache.get(self.rect.size, self.colors[self.color_index])
+            self.cycling = True
+    
+    def restored(self):
+        """Show the restored colour of the cycle"""
+        color = self.colors[self.color_index] if self.cycling else self.color
+        self.image = surface_cache.get(self.rect.size, color)
     
     def apply_effect(self, player):
         """Apply temporary invincibility"""
@@ -163,6 +226,10 @@ class OneUpMushroom(Item):
         self.vel_x = 2
         self.power_type = "1up"
     
+    def reset(self, x, y):
+        super().reset(x, y)
+        self.vel_x = 2
+    
     def apply_effect(self, player):
         """Grant an extra life"""
         player.lives += 1
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Level module for Mario Sisters game.
+Contains the declarative level format and its compiled binary cache.
+
+A level file is JSON with two layers:
+
+    {
+        "name": "World 1-1",
+        "tiles": ["....", "####"],
+        "entities": [{"type": "brick", "x": 300, "y": 472}, ...]
+    }
+
+The tile layer is a list of rows, top to bottom, anchored to the bottom of
+the screen: the last row sits on the bottom row of the tile map. Each
+character is a tile from TILE_LEGEND. Everything that is interactive, moves
+or does not sit on the grid goes in the entity layer, in pixel coordinates.
+
+The first load compiles the file into a .lvlc cache next to it: a header,
+the level name, the tile map bytes in the tile map's own column-major layout and a table of
+fixed-size entity records. Later loads memory-map the cache and skip JSON
+parsing altogether, as long as the source file is unchanged and the cache
+is as long as its header says.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from constants import *
+from tilemap import TILE_ROWS
+
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+CACHE_SUFFIX = ".lvlc"
+CACHE_MAGIC = b"MSLV"
+CACHE_VERSION = 2
+
+# magic, version, rows, columns, entity count, source mtime (ns), source size,
+# then the length of the UTF-8 level name that follows
+CACHE_HEADER = struct.Struct("<4sHHIIqqH")
+# entity type, x, y and up to four type-specific parameters
+ENTITY_RECORD = struct.Struct("<B3xiiiiii")
+
+TILE_LEGEND = {
+    ".": TILE_EMPTY,
+    "#": TILE_GROUND,
+    "B": TILE_BRICK,
+    "?": TILE_QUESTION,
+    "P": TILE_PIPE,
+}
+
+# Entity types in code order, each with its parameter names and defaults
+ENTITY_TYPES = [
+    ("ground", (("width", TILE_SIZE),)),
+    ("brick", ()),
+    ("question", (("item", "coin"),)),
+    ("pipe", (("height", 2),)),
+    ("moving_platform", (("width", TILE_SIZE * 3), ("movement", "horizontal"),
+                         ("distance", 128), ("speed", 1))),
+    ("falling_platform", (("width", TILE_SIZE * 3),)),
+    ("goombetta", ()),
+    ("koopette", ()),
+    ("piranha", ()),
+    ("bossette", ()),
+    ("coin", ()),
+    ("heels", ()),
+    ("feather", ()),
+    ("purse", ()),
+    ("star", ()),
+    ("1up", ()),
+    ("exit", ()),
+]
+ENTITY_CODES = {name: code for code, (name, _) in enumerate(ENTITY_TYPES)}
+
+# String parameters are stored as indices into these tables
+ITEM_NAMES = ["coin", "heels", "feather", "purse", "star", "1up"]
+MOVEMENT_TYPES = ["horizontal", "vertical"]
+STRING_PARAMETERS = {"item": ITEM_NAMES, "movement": MOVEMENT_TYPES}
+
+
+class LevelData:
+    """A loaded level: tile map bytes plus a table of entity records"""
+
+    def __init__(self, columns, rows, tiles, entities, name=""):
+        self.columns = columns
+        self.rows = rows
+        self.tiles = tiles  # array('B'), column-major like TileMap.cells
+        self.entities = entities  # [(type code, x, y, p0, p1, p2, p3), ...]
+        self.name = name
+
+    @property
+    def width(self):
+        return self.columns * TILE_SIZE
+
+
+def entity_name(code):
+    """Return the type name of an entity code"""
+    return ENTITY_TYPES[code][0]
+
+
+def decode_parameter(name, value):
+    """Turn a stored parameter back into what the constructors expect"""
+    table = STRING_PARAMETERS.get(name)
+    return table[value] if table is not None else value
+
+
+def entity_parameters(code, record):
+    """Return {parameter name: value} for an entity record"""
+    names = ENTITY_TYPES[code][1]
+    return {name: decode_parameter(name, value) for (name, _), value in zip(names, record[3:])}
+
+
+def parse_level(source):
+    """Build LevelData from the decoded JSON of a level file"""
+    rows = source.get("tiles", [])
+    if len(rows) > TILE_ROWS:
+        raise ValueError(f"A level has at most {TILE_ROWS} tile rows, got {len(rows)}")
+    columns = max([len(row) for row in rows] + [source.get("width", 0) // TILE_SIZE])
+    tiles = array('B', bytes(columns * TILE_ROWS))
+    first_row = TILE_ROWS - len(rows)
+    for row_index, row in enumerate(rows):
+        for col, char in enumerate(row):
+            if char not in TILE_LEGEND:
+                raise ValueError(f"Unknown tile {char!r} in row {row_index}")
+            tiles[col * TILE_ROWS + first_row + row_index] = TILE_LEGEND[char]
+
+    entities = []
+    for entity in source.get("entities", []):
+        code = ENTITY_CODES[entity["type"]]
+        values = []
+        for name, default in ENTITY_TYPES[code][1]:
+            value = entity.get(name, default)
+            table = STRING_PARAMETERS.get(name)
+            values.append(table.index(value) if table is not None else int(value))
+        values += [0] * (4 - len(values))
+        entities.append((code, int(entity["x"]), int(entity["y"]), *values))
+    return LevelData(columns, TILE_ROWS, tiles, entities, source.get("name", ""))
+
+
+def write_cache(path, level, source_stat):
+    """Write the compiled form of a level, replacing any old cache atomically
+
+    Each writer gets a temporary file of its own, so processes compiling
+    the same level at once never write into each other's file.
+    """
+    name = level.name.encode("utf-8")
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as cache_file:
+            cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, level.rows, level.columns,
+                                               len(level.entities), source_stat.st_mtime_ns,
+                                               source_stat.st_size, len(name)))
+            cache_file.write(name)
+            cache_file.write(level.tiles.tobytes())
+            for record in level.entities:
+                cache_file.write(ENTITY_RECORD.pack(*record))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_cache(path, source_stat):
+    """Return the cached LevelData, or None if the cache is missing, stale or truncated"""
+    try:
+        cache_file = open(path, "rb")
+    except OSError:
+        return None
+    with cache_file:
+        if os.fstat(cache_file.fileno()).st_size < CACHE_HEADER.size:
+            return None
+        with mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return unpack_cache(data, source_stat)
+
+
+def unpack_cache(data, source_stat):
+    """Decode a mapped cache file, or return None if it is stale or the wrong length"""
+    magic, version, rows, columns, count, mtime, size, name_length = CACHE_HEADER.unpack_from(data, 0)
+    if (magic != CACHE_MAGIC or version != CACHE_VERSION or rows != TILE_ROWS or
+            mtime != source_stat.st_mtime_ns or size != source_stat.st_size):
+        return None
+    # A write cut short leaves a file that would decode to a partial level
+    if len(data) != CACHE_HEADER.size + name_length + rows * columns + count * ENTITY_RECORD.size:
+        return None
+    start = CACHE_HEADER.size
+    try:
+        name = data[start:start + name_length].decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    start += name_length
+    tiles = array('B')
+    tiles.frombytes(data[start:start + rows * columns])
+    start += rows * columns
+    entities = list(ENTITY_RECORD.iter_unpack(data[start:start + count * ENTITY_RECORD.size]))
+    return LevelData(columns, rows, tiles, entities, name)
+
+
+def load_level_file(path):
+    """Load a level, compiling it to the binary cache on first use"""
+    source_stat = os.stat(path)
+    cache_path = os.path.splitext(path)[0] + CACHE_SUFFIX
+    level = read_cache(cache_path, source_stat)
+    if level is not None:
+        return level
+    with open(path) as level_file:
+        level = parse_level(json.load(level_file))
+    try:
+        write_cache(cache_path, level, source_stat)
+    except OSError:
+        pass  # Read-only install, parse again next time
+    return level
+
+
+def level_path(level_number):
+    """Return the file of a numbered level"""
+    return os.path.join(LEVEL_DIR, f"level{level_number}.json")
+
+
+def tile_level(level, copies):
+    """Return a level made of copies of another laid side by side
+
+    Only the last copy keeps its exit, so the level ends at its far end.
+    """
+    tiles = array('B', level.tiles * copies)
+    entities = []
+    exit_code = ENTITY_CODES["exit"]
+    for copy in range(copies):
+        offset_x = copy * level.width
+        for record in level.entities:
+            if record[0] == exit_code and copy < copies - 1:
+                continue
+            entities.append((record[0], record[1] + offset_x) + tuple(record[2:]))
+    return LevelData(level.columns * copies, level.rows, tiles, entities, level.name)
@@ -7,6 +7,13 @@ Controls:
 - Space/Up: Jump
 - Z/Shift: Special ability
 - ESC: Pause
+- F3: Frame-time graph
+- F4: Save the recorded frame times as CSV and Chrome trace JSON
+- F5: Quick save
+- F9: Quick load
+- Backspace (hold): Rewind
+
+Use run_headless() to simulate the game without a window, e.g. on CI.
 """
 import pygame
 from game import Game
@@ -20,5 +27,17 @@ def main():
     # Clean up pygame
     pygame.quit()
 
+def run_headless(frames, sister=0, render=False):
+    """Play frames frames without a window as fast as possible
+    
+    Starts a new game with the selected sister straight away and returns the
+    game together with the elapsed wall-clock seconds.
+    """
+    game = Game(headless=True, render=render)
+    game.selected_sister = sister
+    game.new_game()
+    elapsed = game.simulate(frames)
+    return game, elapsed
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Observation module for Mario Sisters game.
+Contains compact views of the game state for agents and analysis tools.
+
+tile_grid() describes what occupies each tile around the sister straight
+from the tile map and the sprite groups, without drawing anything.
+downscaled_pixels() samples a drawn screen through pygame.surfarray.
+Both need NumPy.
+"""
+import pygame
+from constants import *
+from enemies import Goombetta, Koopette, PiranhaQueenPlant, BossetteBowsette
+from items import Coin, HeelShoe, FeatherCap, PurseItem, StarPower, OneUpMushroom
+from tilemap import TILE_ROWS, TILE_ORIGIN_Y
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, without it these observations are unavailable
+    np = None
+
+GRID_COLUMNS = 16  # Tiles across the grid, centred on the sister
+GRID_ROWS = TILE_ROWS  # Levels are one screen tall, so the grid covers all of it
+PIXEL_SCALE = 4  # Screen pixels per observed pixel along each axis
+
+# Channels of a tile grid, each holding one code per tile
+CHANNEL_TERRAIN = 0
+CHANNEL_ENEMY = 1
+CHANNEL_ITEM = 2
+CHANNEL_PLAYER = 3
+GRID_CHANNELS = 4
+
+# Terrain codes are the tile codes, plus these for terrain kept as sprites
+TERRAIN_PLATFORM = 5  # Moving and falling platforms
+TERRAIN_EXIT = 6
+ENEMY_CODES = {Goombetta: 1, Koopette: 2, PiranhaQueenPlant: 3, BossetteBowsette: 4}
+ENEMY_SHELL = 5  # A Koopette in her shell
+ITEM_CODES = {Coin: 1, HeelShoe: 2, FeatherCap: 3, PurseItem: 4, StarPower: 5, OneUpMushroom: 6}
+PLAYER_SISTER = 1
+PLAYER_FIREBALL = 2
+
+
+def available():
+    """Return True if NumPy is installed"""
+    return np is not None
+
+
+def grid_shape(columns=GRID_COLUMNS):
+    """Return the shape of a tile grid"""
+    return (GRID_ROWS, columns, GRID_CHANNELS)
+
+
+def pixel_shape(scale=PIXEL_SCALE):
+    """Return the shape of a downscaled screen"""
+    return (-(-SCREEN_HEIGHT // scale), -(-SCREEN_WIDTH // scale), 3)
+
+
+def mark_cells(grid, window, rect, channel, code):
+    """Write code into channel for every grid cell that rect overlaps"""
+    if not window.colliderect(rect):
+        return
+    col0 = max((rect.left - window.left) // TILE_SIZE, 0)
+    col1 = min((rect.right - 1 - window.left) // TILE_SIZE, grid.shape[1] - 1)
+    row0 = max((rect.top - TILE_ORIGIN_Y) // TILE_SIZE, 0)
+    row1 = min((rect.bottom - 1 - TILE_ORIGIN_Y) // TILE_SIZE, GRID_ROWS - 1)
+    grid[row0:row1 + 1, col0:col1 + 1, channel] = code
+
+
+def tile_grid(game, out=None, columns=GRID_COLUMNS):
+    """Write what occupies each tile around the sister into out and return it
+
+    out is a uint8 array of grid_shape(columns), created when not given.
+    Terrain is copied from the tile map a column slice at a time, and every
+    other object marks the tiles its rect overlaps in its own channel.
+    Sprites asleep off-screen are not included.
+    """
+    if out is None:
+        out = np.zeros(grid_shape(columns), np.uint8)
+    else:
+        out.fill(0)
+    first = game.player.rect.centerx // TILE_SIZE - columns // 2
+    window = pygame.Rect(first * TILE_SIZE, TILE_ORIGIN_Y, columns * TILE_SIZE, GRID_ROWS * TILE_SIZE)
+
+    tilemap = game.platforms.tilemap
+    start = max(first, 0)
+    end = min(first + columns, tilemap.columns)
+    if end > start:
+        # Viewed afresh every call, since an array exporting its buffer cannot grow
+        cells = np.frombuffer(tilemap.cells, np.uint8).reshape(tilemap.columns, tilemap.rows)
+        out[:, start - first:end - first, CHANNEL_TERRAIN] = cells[start:end].T
+        del cells
+    # Few platforms stay out of the tile map, so checking them all beats a query over the window
+    for platform in game.platforms.spatial_hash.order:
+        mark_cells(out, window, platform.rect, CHANNEL_TERRAIN, platform.tile_code or TERRAIN_PLATFORM)
+    level_exit = getattr(game, "exit", None)
+    if level_exit is not None and level_exit.alive():
+        mark_cells(out, window, level_exit.rect, CHANNEL_TERRAIN, TERRAIN_EXIT)
+
+    for enemy in game.enemies:
+        code = ENEMY_SHELL if enemy.shell_mode else ENEMY_CODES[type(enemy)]
+        mark_cells(out, window, enemy.rect, CHANNEL_ENEMY, code)
+    for item in game.items:
+        mark_cells(out, window, item.rect, CHANNEL_ITEM, ITEM_CODES[type(item)])
+    for fireball in getattr(game.player, "fireballs", ()):
+        mark_cells(out, window, fireball.rect, CHANNEL_PLAYER, PLAYER_FIREBALL)
+    mark_cells(out, window, game.player.rect, CHANNEL_PLAYER, PLAYER_SISTER)
+    return out
+
+
+def downscaled_pixels(surface, scale=PIXEL_SCALE, out=None):
+    """Write every scale-th pixel of surface into out, rows first, and return it
+
+    out is a uint8 array of pixel_shape(scale), created when not given. The
+    surface is read through a pygame.surfarray.pixels3d() view sliced with
+    strides, so only the sampled pixels are copied, never the whole frame.
+    The view is dropped before returning, which unlocks the surface again.
+    """
+    view = pygame.surfarray.pixels3d(surface)
+    sampled = view[::scale, ::scale].transpose(1, 0, 2)
+    if out is None:
+        out = np.empty(sampled.shape, np.uint8)
+    out[...] = sampled
+    del view, sampled
+    return out
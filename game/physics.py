@@ -0,0 +1,466 @@
+"""
+Physics module for Mario Sisters game.
+Contains the optional batched physics engine for enemies and items.
+
+Entity state lives in NumPy arrays, one slot per entity, and every frame
+gravity, movement and tile collision response are computed for all of them
+at once. The results match the per-sprite update() methods exactly, but
+sprite rects are only written back for entities near the camera, the sister
+or a projectile, since nothing else looks at them.
+
+Entities close to a platform that is kept as a sprite, or in a state the
+batch pass does not model (a Koopette shell), run their own update() instead.
+So does every entity while fewer than BATCH_MIN_ENTITIES are managed, since
+below that the fixed cost of each NumPy call outweighs the per-sprite loop;
+with activation on, only the awake entities count.
+"""
+import pygame
+from constants import *
+from collision import PlatformGroup
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, without it every sprite updates itself
+    np = None
+
+SYNC_MARGIN = TILE_SIZE * 2  # Entities this close to a region of interest keep their rects current
+PLATFORM_MARGIN = 4  # Slack beyond an entity's reach before sprite platforms count as near
+INITIAL_CAPACITY = 256
+BATCH_MIN_ENTITIES = 256  # Fewer managed entities than this update themselves
+
+# How a class moves, from its batch_physics attribute
+MODE_WALKER = 1  # Enemy.update
+MODE_ITEM = 2  # Item.update
+MODE_COIN = 3  # Coin.update
+BATCH_MODES = {"walker": MODE_WALKER, "item": MODE_ITEM, "coin": MODE_COIN}
+
+
+def available():
+    """Return True if NumPy is installed"""
+    return np is not None
+
+
+def round_half_away(values):
+    """Round like a float assigned to a pygame Rect"""
+    return np.where(values >= 0, np.floor(values + 0.5), np.ceil(values - 0.5)).astype(np.int64)
+
+
+class BatchPhysics:
+    """Struct-of-arrays state and a vectorised update for enemies and items"""
+
+    def __init__(self, capacity=INITIAL_CAPACITY, min_entities=BATCH_MIN_ENTITIES):
+        self.min_entities = min_entities
+        self.sprites = []
+        self.index = {}  # sprite -> slot
+        self.count = 0
+        self.capacity = 0
+        self.fields = {
+            "x": np.int64, "y": np.int64, "w": np.int64, "h": np.int64,
+            "vx": np.float64, "vy": np.float64, "direction": np.int64,
+            "bob": np.float64, "bob_speed": np.float64, "bob_height": np.float64,
+            "start_y": np.float64, "mode": np.int8, "ledge": np.bool_,
+            "ready": np.bool_, "synced": np.bool_,
+            # Where the sprite's rect was last written, behind x and y while unsynced
+            "rect_x": np.int64, "rect_y": np.int64,
+        }
+        for name, dtype in self.fields.items():
+            setattr(self, name, np.zeros(0, dtype))
+        self.grow(capacity)
+        self.stale = False  # The sprites updated themselves and the arrays lag behind
+        # Rects of the platforms kept as sprites, rebuilt when the spatial hash changes
+        self.platform_hash = None
+        self.platform_key = None
+        self.platform_rects = np.zeros((0, 4), np.int64)
+        self.kinematic_rows = []  # (row, platform) of the platforms that move
+        self.batched = 0  # Entities moved by the last vectorised pass
+        self.fallbacks = 0  # Entities that updated themselves in the last step
+
+    def __contains__(self, sprite):
+        return sprite in self.index
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, capacity):
+        """Make room for at least capacity entities"""
+        if capacity <= self.capacity:
+            return
+        for name, dtype in self.fields.items():
+            array = np.zeros(capacity, dtype)
+            array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def add(self, sprite):
+        """Start managing a sprite if its class declares a batch mode"""
+        mode = BATCH_MODES.get(getattr(sprite, "batch_physics", None))
+        if mode is None or sprite in self.index:
+            return
+        if self.count == self.capacity:
+            self.grow(self.capacity * 2)
+        slot = self.count
+        self.sprites.append(sprite)
+        self.index[sprite] = slot
+        self.count += 1
+        self.mode[slot] = mode
+        self.ledge[slot] = getattr(sprite, "turns_at_ledges", False)
+        self.gather(slot)
+
+    def remove(self, sprite):
+        """Stop managing a sprite, moving the last slot into its place"""
+        slot = self.index.get(sprite)
+        if slot is None:
+            return
+        if not self.synced[slot]:
+            self.scatter(slot)
+        del self.index[sprite]
+        last = self.count - 1
+        if slot != last:
+            for name in self.fields:
+                array = getattr(self, name)
+                array[slot] = array[last]
+            moved = self.sprites[last]
+            self.sprites[slot] = moved
+            self.index[moved] = slot
+        self.sprites.pop()
+        self.count -= 1
+
+    def gather(self, slot):
+        """Copy a sprite's state into its slot"""
+        sprite = self.sprites[slot]
+        rect = sprite.rect
+        self.x[slot] = self.rect_x[slot] = rect.x
+        self.y[slot] = self.rect_y[slot] = rect.y
+        self.w[slot] = rect.width
+        self.h[slot] = rect.height
+        self.vx[slot] = sprite.vel_x
+        self.vy[slot] = sprite.vel_y
+        if self.mode[slot] == MODE_COIN:
+            self.direction[slot] = sprite.bob_direction
+            self.bob[slot] = sprite.current_bob
+            self.bob_speed[slot] = sprite.bob_speed
+            self.bob_height[slot] = sprite.bob_height
+            self.start_y[slot] = sprite.start_y
+        elif self.mode[slot] == MODE_WALKER:
+            self.direction[slot] = sprite.direction
+        self.ready[slot] = sprite.batch_ready()
+        self.synced[slot] = True
+
+    def scatter(self, slot):
+        """Copy a slot's state back to its sprite"""
+        sprite = self.sprites[slot]
+        sprite.rect.x = self.rect_x[slot] = int(self.x[slot])
+        sprite.rect.y = self.rect_y[slot] = int(self.y[slot])
+        sprite.vel_x = float(self.vx[slot])
+        sprite.vel_y = float(self.vy[slot])
+        if self.mode[slot] == MODE_COIN:
+            sprite.bob_direction = int(self.direction[slot])
+            sprite.current_bob = float(self.bob[slot])
+        elif self.mode[slot] == MODE_WALKER:
+            sprite.direction = int(self.direction[slot])
+        self.synced[slot] = True
+
+    def sync(self):
+        """Copy every slot its sprite is behind on back to the sprite"""
+        for slot in np.flatnonzero(~self.synced[:self.count]).tolist():
+            self.scatter(slot)
+
+    def overlapping(self, rects, margin):
+        """Return a mask of the entities within margin of any of rects
+
+        An unsynced sprite also counts if its outdated rect is that close,
+        so the game never finds it where it no longer is.
+        """
+        n = self.count
+        w, h = self.w[:n], self.h[:n]
+        mask = np.zeros(n, np.bool_)
+        for x, y in ((self.x[:n], self.y[:n]), (self.rect_x[:n], self.rect_y[:n])):
+            for rect in rects:
+                mask |= ((x < rect.right + margin) & (x + w > rect.left - margin) &
+                         (y < rect.bottom + margin) & (y + h > rect.top - margin))
+        return mask
+
+    def outside(self, rect):
+        """Return the managed sprites that do not overlap rect"""
+        if self.stale:
+            return [sprite for sprite in self.sprites if not rect.colliderect(sprite.rect)]
+        n = self.count
+        x, y, w, h = self.x[:n], self.y[:n], self.w[:n], self.h[:n]
+        inside = (x < rect.right) & (x + w > rect.left) & (y < rect.bottom) & (y + h > rect.top)
+        return [self.sprites[slot] for slot in np.flatnonzero(~inside).tolist()]
+
+    def sprite_platform_rects(self, platforms):
+        """Return the rects of the platforms kept as sprites as an (n, 4) array
+
+        The array is only rebuilt when platforms join or leave the spatial
+        hash; the rows of kinematic platforms are refreshed every call.
+        """
+        spatial_hash = platforms.spatial_hash
+        key = (spatial_hash.next_order, len(spatial_hash))
+        if spatial_hash is not self.platform_hash or key != self.platform_key:
+            sprites = list(spatial_hash.order)
+            self.platform_rects = np.array([tuple(sprite.rect) for sprite in sprites], np.int64).reshape(-1, 4)
+            self.kinematic_rows = [(row, sprite) for row, sprite in enumerate(sprites) if sprite.kinematic]
+            self.platform_hash = spatial_hash
+            self.platform_key = key
+        rects = self.platform_rects
+        for row, sprite in self.kinematic_rows:
+            rects[row] = tuple(sprite.rect)
+        return rects
+
+    def near_sprite_platforms(self, platforms):
+        """Return a mask of the entities that could touch a platform that is not a tile
+
+        An entity can reach anything within its speed this step, and ledge
+        checks look one tile ahead and a few pixels below its feet.
+        """
+        n = self.count
+        near = np.zeros(n, np.bool_)
+        if not platforms.spatial_hash or n == 0:
+            return near
+        rects = self.sprite_platform_rects(platforms)
+        left = rects[:, 0]
+        top = rects[:, 1]
+        right = left + rects[:, 2]
+        bottom = top + rects[:, 3]
+        x, y, w, h = self.x[:n], self.y[:n], self.w[:n], self.h[:n]
+        reach_x = TILE_SIZE + PLATFORM_MARGIN + np.ceil(np.abs(self.vx[:n])).astype(np.int64)
+        reach_y = PLATFORM_MARGIN + np.ceil(np.abs(self.vy[:n])).astype(np.int64)
+
+        # Cheap first pass on tile columns, then exact boxes for what is left
+        widest = int(reach_x.max())
+        first = min(int(left.min()) - widest, int(x.min())) // TILE_SIZE - 1
+        last = max(int(right.max()) + widest, int((x + w).max())) // TILE_SIZE
+        occupied = np.zeros(last - first + 3, np.int64)
+        np.add.at(occupied, (left - widest) // TILE_SIZE - first, 1)
+        np.add.at(occupied, (right + widest) // TILE_SIZE - first + 1, -1)
+        columns = np.concatenate(([0], np.cumsum(np.cumsum(occupied) > 0)))
+        candidates = np.flatnonzero(columns[(x + w) // TILE_SIZE - first + 1] -
+                                    columns[x // TILE_SIZE - first] > 0)
+        if len(candidates):
+            cx = x[candidates, None]
+            cy = y[candidates, None]
+            rx = reach_x[candidates, None]
+            ry = reach_y[candidates, None]
+            near[candidates] = ((cx - rx < right) & (cx + w[candidates, None] + rx > left) &
+                                (cy - ry < bottom) & (cy + h[candidates, None] + ry + 16 > top)).any(axis=1)
+        return near
+
+    def step(self, platforms, regions):
+        """Advance every managed entity by one simulation step
+
+        regions are the rects the game checks entities against this step,
+        such as the screen and the sister; entities near them are read from
+        and written back to their sprites.
+        """
+        n = self.count
+        self.batched = self.fallbacks = 0
+        if n == 0:
+            return
+        if n < self.min_entities:
+            # Too few for the batch pass to pay off, so the sprites are the state
+            self.sync()
+            for sprite in self.sprites:
+                sprite.update(platforms)
+            self.stale = True
+            self.fallbacks = n
+            return
+        if self.stale:
+            for slot in range(n):
+                self.gather(slot)
+            self.stale = False
+        # The game may have changed sprites near the action, so read them back first
+        near = self.overlapping(regions, SYNC_MARGIN)
+        for slot in np.flatnonzero(near).tolist():
+            if self.synced[slot]:
+                self.gather(slot)
+            else:
+                self.scatter(slot)
+
+        if isinstance(platforms, PlatformGroup):
+            scalar = ~self.ready[:n] | self.near_sprite_platforms(platforms)
+            batch = ~scalar
+            tilemap = platforms.tilemap
+            # A temporary view, a live export would stop the tile map from growing
+            cells = np.frombuffer(tilemap.cells, np.uint8).reshape(tilemap.columns, tilemap.rows)
+            mode = self.mode[:n]
+            self.step_walkers(np.flatnonzero(batch & (mode == MODE_WALKER)), cells, tilemap)
+            self.step_items(np.flatnonzero(batch & (mode == MODE_ITEM)), cells, tilemap)
+            del cells
+            self.step_coins(np.flatnonzero(batch & (mode == MODE_COIN)))
+        else:
+            scalar = np.ones(n, np.bool_)
+            batch = ~scalar
+
+        moved = np.flatnonzero(batch)
+        self.synced[moved] = False
+        self.batched = len(moved)
+        for slot in (moved[near[moved] | self.overlapping(regions, SYNC_MARGIN)[moved]]).tolist():
+            self.scatter(slot)
+
+        for slot in np.flatnonzero(scalar).tolist():
+            if not self.synced[slot]:
+                self.scatter(slot)
+            self.sprites[slot].update(platforms)
+            self.gather(slot)
+        self.fallbacks = int(scalar.sum())
+
+    def step_walkers(self, slots, cells, tilemap):
+        """Enemy.update, plus Goombetta's turn at ledges, for a set of slots"""
+        if not len(slots):
+            return
+        x, y, w, h = self.x[slots], self.y[slots], self.w[slots], self.h[slots]
+        vy = self.vy[slots] + PLAYER_GRAVITY * 0.8
+        direction = self.direction[slots]
+
+        x = round_half_away(x + self.vx[slots] * direction)
+        hit, col, row = first_tile(cells, tilemap, x, y, w, h)
+        direction = np.where(hit, -direction, direction)
+        x = np.where(hit, np.where(direction > 0, (col + 1) * TILE_SIZE, col * TILE_SIZE - w), x)
+
+        y = y + np.trunc(vy).astype(np.int64)
+        hit, col, row = first_tile(cells, tilemap, x, y, w, h)
+        top = tilemap.origin_y + row * TILE_SIZE
+        y = np.where(hit, np.where(vy > 0, top - h, top + TILE_SIZE), y)
+        vy = np.where(hit, 0.0, vy)
+
+        ledge = self.ledge[slots]
+        if ledge.any():
+            ground = has_surface(cells, tilemap, x + direction * TILE_SIZE, y + h + 5, 10)
+            direction = np.where(ledge & ~ground, -direction, direction)
+
+        self.x[slots] = x
+        self.y[slots] = y
+        self.vy[slots] = vy
+        self.direction[slots] = direction
+
+    def step_items(self, slots, cells, tilemap):
+        """Item.update for a set of slots"""
+        if not len(slots):
+            return
+        x, y, w, h = self.x[slots], self.y[slots], self.w[slots], self.h[slots]
+        vx = self.vx[slots]
+        vy = self.vy[slots] + PLAYER_GRAVITY * 0.5
+        x = x + np.trunc(vx).astype(np.int64)
+        y = y + np.trunc(vy).astype(np.int64)
+
+        hits = tile_hits(cells, tilemap, x, y, w, h)
+        if hits:
+            # Land on the first tile hit
+            hit = np.zeros(len(slots), np.bool_)
+            top = np.zeros(len(slots), np.int64)
+            for solid, col, row in hits:
+                first = solid & ~hit
+                top = np.where(first, tilemap.origin_y + row * TILE_SIZE, top)
+                hit |= solid
+            land = hit & (vy > 0)
+            y = np.where(land, top - h, y)
+            vy = np.where(land, 0.0, vy)
+            # Then bounce off each tile in turn, like the loop over hits
+            for solid, col, row in hits:
+                left = col * TILE_SIZE
+                right = left + TILE_SIZE
+                moving_right = solid & (vx > 0) & (x + w > left) & (x + w < right)
+                moving_left = solid & (vx < 0) & (x < right) & (x > left)
+                x = np.where(moving_right, left - w, np.where(moving_left, right, x))
+                vx = np.where(moving_right | moving_left, -vx, vx)
+
+        self.x[slots] = x
+        self.y[slots] = y
+        self.vx[slots] = vx
+        self.vy[slots] = vy
+
+    def step_coins(self, slots):
+        """Coin.update for a set of slots"""
+        if not len(slots):
+            return
+        bob = self.bob[slots] + self.bob_speed[slots] * self.direction[slots]
+        direction = self.direction[slots]
+        self.direction[slots] = np.where(np.abs(bob) >= self.bob_height[slots], -direction, direction)
+        self.bob[slots] = bob
+        self.y[slots] = round_half_away(self.start_y[slots] + bob)
+
+    def stats(self):
+        """Return counters for the last step"""
+        return {"entities": self.count, "batched": self.batched, "fallbacks": self.fallbacks}
+
+
+def cell_ranges(tilemap, x, y, w, h):
+    """Vectorised TileMap.cell_range"""
+    col0 = np.maximum(x // TILE_SIZE, 0)
+    col1 = np.minimum((x + w - 1) // TILE_SIZE, tilemap.columns - 1)
+    row0 = np.maximum((y - tilemap.origin_y) // TILE_SIZE, 0)
+    row1 = np.minimum((y + h - 1 - tilemap.origin_y) // TILE_SIZE, tilemap.rows - 1)
+    return col0, row0, col1, row1
+
+
+def solid_at(cells, col, row):
+    """Return the tile codes at cells, with TILE_EMPTY outside the map"""
+    columns, rows = cells.shape
+    inside = (col >= 0) & (col < columns) & (row >= 0) & (row < rows)
+    codes = cells[np.clip(col, 0, max(columns - 1, 0)), np.clip(row, 0, rows - 1)] if columns else 0
+    return inside & (codes != TILE_EMPTY)
+
+
+def tile_hits(cells, tilemap, x, y, w, h):
+    """Return the solid tiles overlapping rects in TileMap.collide order
+
+    The result is a list of (mask, col, row) per cell offset, so entry k
+    describes, for every rect, the k-th cell it could overlap.
+    """
+    col0, row0, col1, row1 = cell_ranges(tilemap, x, y, w, h)
+    span_cols = int((w.max() - 1) // TILE_SIZE + 2)
+    span_rows = int((h.max() - 1) // TILE_SIZE + 2)
+    hits = []
+    for dc in range(span_cols):
+        col = col0 + dc
+        for dr in range(span_rows):
+            row = row0 + dr
+            solid = (col <= col1) & (row <= row1) & solid_at(cells, col, row)
+            if solid.any():
+                hits.append((solid, col, row))
+    return hits
+
+
+def first_tile(cells, tilemap, x, y, w, h):
+    """Return (hit mask, col, row) of the first solid tile each rect overlaps"""
+    hit = np.zeros(len(x), np.bool_)
+    first_col = np.zeros(len(x), np.int64)
+    first_row = np.zeros(len(x), np.int64)
+    for solid, col, row in tile_hits(cells, tilemap, x, y, w, h):
+        first = solid & ~hit
+        first_col = np.where(first, col, first_col)
+        first_row = np.where(first, row, first_row)
+        hit |= solid
+    return hit, first_col, first_row
+
+
+def has_surface(cells, tilemap, x, y, tolerance):
+    """Vectorised TileMap.has_surface"""
+    col = x // TILE_SIZE
+    on_edge = x % TILE_SIZE == 0
+    row = (y - tilemap.origin_y) // TILE_SIZE
+    found = np.zeros(len(x), np.bool_)
+    for candidate_row in (row, row + 1):
+        near = ((candidate_row >= 0) & (candidate_row < tilemap.rows) &
+                (np.abs(tilemap.origin_y + candidate_row * TILE_SIZE - y) < tolerance))
+        for candidate_col, allowed in ((col - 1, on_edge), (col, True)):
+            open_above = (candidate_row == 0) | ~solid_at(cells, candidate_col, candidate_row - 1)
+            found |= near & allowed & solid_at(cells, candidate_col, candidate_row) & open_above
+    return found
+
+
+class PhysicsGroup(pygame.sprite.Group):
+    """Sprite group that hands its members to a BatchPhysics engine"""
+
+    def __init__(self, physics, *sprites):
+        self.physics = physics
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.physics.add(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.physics.remove(sprite)
@@ -4,23 +4,40 @@ Contains terrain elements like blocks, pipes, and platforms.
 """
 import pygame
 from constants import *
+from render import surface_cache
 
 class Platform(pygame.sprite.Sprite):
     """Base class for all platform objects"""
     
+    tile_code = TILE_EMPTY  # Static terrain that can be stored in the tile map
+    kinematic = False  # Moves on its own and needs update() every frame
+    snapshot_fields = ()  # Mutable numbers a snapshot stores, as (attribute, struct code)
+    
     def __init__(self, x, y, width, height, color):
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.Surface((width, height))
-        self.image.fill(color)
+        self.image = surface_cache.get((width, height), color)
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
         self.solid = True  # Can be collided with
+    
+    def recolor(self, color):
+        """Show the platform in a new colour and refresh any baked copy of it"""
+        self.image = surface_cache.get(self.rect.size, color)
+        for group in self.groups():
+            if hasattr(group, "refresh_sprite"):
+                group.refresh_sprite(self)
+    
+    def restored(self):
+        """Bring state derived from restored snapshot_fields, like the image, back in line"""
+        pass
 
 
 class Ground(Platform):
     """Basic ground platform"""
     
+    tile_code = TILE_GROUND
+    
     def __init__(self, x, y, width):
         super().__init__(x, y, width, TILE_SIZE, (150, 75, 0))  # Brown
 
@@ -28,6 +45,9 @@ class Ground(Platform):
 class Brick(Platform):
     """Breakable brick block"""
     
+    tile_code = TILE_BRICK
+    snapshot_fields = (("hit_count", "i"), ("contains_item", "?"))
+    
     def __init__(self, x, y):
         super().__init__(x, y, TILE_SIZE, TILE_SIZE, (210, 105, 30))  # Dark orange
         self.hit_count = 0
@@ -40,7 +60,7 @@ class Brick(Platform):
         if self.contains_item:
             # Logic to spawn item would go here
             self.contains_item = False
-            self.image.fill((210, 180, 140))  # Lighter color after item is out
+            self.recolor((210, 180, 140))  # Lighter color after item is out
             return True
         
         if self.breakable:
@@ -54,6 +74,9 @@ class Brick(Platform):
 class QuestionBlock(Platform):
     """Question mark block with hidden items"""
     
+    tile_code = TILE_QUESTION
+    snapshot_fields = (("active", "?"),)
+    
     def __init__(self, x, y, item_type="coin"):
         super().__init__(x, y, TILE_SIZE, TILE_SIZE, (255, 255, 0))  # Yellow
         self.active = True
@@ -63,15 +86,23 @@ class QuestionBlock(Platform):
         """Spawn an item when hit from below"""
         if self.active:
             self.active = False
-            self.image.fill((128, 128, 128))  # Gray after being hit
+            self.recolor((128, 128, 128))  # Gray after being hit
             # Spawning item logic would go here
             return True
         return False
+    
+    def restored(self):
+        """Recolour the block if it was hit, or un-hit, by the restore"""
+        color = (255, 255, 0) if self.active else (128, 128, 128)
+        if self.image is not surface_cache.get(self.rect.size, color):
+            self.recolor(color)
 
 
 class Pipe(Platform):
     """Warp pipe"""
     
+    tile_code = TILE_PIPE
+    
     def __init__(self, x, y, height=2):
         # Create pipe with specified height (in tiles)
         pipe_height = TILE_SIZE * height
@@ -93,6 +124,9 @@ class Pipe(Platform):
 class MovingPlatform(Platform):
     """Platform that moves along a path"""
     
+    kinematic = True
+    snapshot_fields = (("direction", "b"), ("move_counter", "d"))
+    
     def __init__(self, x, y, width, movement_type="horizontal", distance=128, speed=1):
         super().__init__(x, y, width, TILE_SIZE, (200, 200, 200))  # Gray
         
@@ -126,6 +160,9 @@ class MovingPlatform(Platform):
 class FallingPlatform(Platform):
     """Platform that falls after being stepped on"""
     
+    kinematic = True
+    snapshot_fields = (("triggered", "?"), ("fall_delay", "i"), ("fall_speed", "d"))
+    
     def __init__(self, x, y, width):
         super().__init__(x, y, width, TILE_SIZE, (150, 150, 150))  # Light gray
         self.triggered = False
@@ -153,6 +190,8 @@ class FallingPlatform(Platform):
 class LevelExit(Platform):
     """Flag pole or other level exit"""
     
+    snapshot_fields = (("reached", "?"),)
+    
     def __init__(self, x, y):
         super().__init__(x, y - TILE_SIZE * 5, TILE_SIZE, TILE_SIZE * 5, (255, 215, 0))  # Gold
         self.solid = False  # Can pass through
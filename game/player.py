@@ -4,14 +4,26 @@ Contains the Sister characters with their unique abilities.
 """
 import pygame
 from constants import *
+from collision import collide_platforms
+from render import text_cache, surface_cache
+from pool import pools
+from projectiles import Fireball
 
 class Sister(pygame.sprite.Sprite):
     """Base class for all sister characters"""
     
+    status_font = None  # Shared by all sisters, created on first use
+    invincible = False  # Set while a hit or a star protects her
+    invincible_timer = 0
+    # Mutable numbers a snapshot stores after the position, as (attribute, struct code)
+    snapshot_fields = (("vel_x", "d"), ("vel_y", "d"), ("acc_x", "d"), ("acc_y", "d"), ("direction", "b"),
+                       ("jumping", "?"), ("on_ground", "?"), ("score", "q"), ("lives", "i"),
+                       ("power_level", "b"), ("ability_cooldown", "i"), ("ability_active", "?"),
+                       ("invincible", "?"), ("invincible_timer", "i"))
+    
     def __init__(self, x, y, color, name):
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.Surface((PLAYER_WIDTH, PLAYER_HEIGHT))
-        self.image.fill(color)
+        self.image = surface_cache.get((PLAYER_WIDTH, PLAYER_HEIGHT), color)
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
@@ -66,26 +78,26 @@ class Sister(pygame.sprite.Sprite):
     
     def check_horizontal_collisions(self, platforms):
         """Check and resolve horizontal collisions"""
-        hits = pygame.sprite.spritecollide(self, platforms, False)
+        hits = collide_platforms(self, platforms)
         if hits:
             if self.vel_x > 0:  # Moving right
-                self.rect.right = hits[0].rect.left
+                self.rect.right = hits[0].left
             else:  # Moving left
-                self.rect.left = hits[0].rect.right
+                self.rect.left = hits[0].right
             self.vel_x = 0
     
     def check_vertical_collisions(self, platforms):
         """Check and resolve vertical collisions"""
         self.on_ground = False
-        hits = pygame.sprite.spritecollide(self, platforms, False)
+        hits = collide_platforms(self, platforms)
         if hits:
             if self.vel_y > 0:  # Falling
-                self.rect.bottom = hits[0].rect.top
+                self.rect.bottom = hits[0].top
                 self.on_ground = True
                 self.vel_y = 0
                 self.jumping = False
             else:  # Rising and hit head
-                self.rect.top = hits[0].rect.bottom
+                self.rect.top = hits[0].bottom
                 self.vel_y = 0
     
     def jump(self):
@@ -114,9 +126,9 @@ class Sister(pygame.sprite.Sprite):
     
     def draw_status(self, screen):
         """Draw character status like lives and power"""
-        font = pygame.font.Font(None, SMALL_FONT_SIZE)
-        text = font.render(f"{self.name}: {self.lives} Lives", True, WHITE)
-        return text
+        if Sister.status_font is None:
+            Sister.status_font = pygame.font.Font(None, SMALL_FONT_SIZE)
+        return text_cache.render(Sister.status_font, f"{self.name}: {self.lives} Lives", WHITE)
 
 
 class LuigiettaSister(Sister):
@@ -152,8 +164,8 @@ class MariaSister(Sister):
     def use_special_ability(self):
         """Throw a fireball in the direction facing"""
         if super().use_special_ability():
-            # Create fireball logic would go here
-            print(f"Maria throws fireball {self.direction}")
+            x = self.rect.right if self.direction > 0 else self.rect.left
+            self.fireballs.add(pools.acquire(Fireball, x, self.rect.centery, self.direction))
             return True
         return False
 
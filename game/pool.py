@@ -0,0 +1,125 @@
+"""
+Pool module for Mario Sisters game.
+Contains object pools that recycle sprites instead of recreating them.
+"""
+import pygame
+
+
+class PooledSprite(pygame.sprite.Sprite):
+    """Sprite that goes back to the pool it came from when killed
+
+    Pooled classes implement reset(*args) to put an instance back in the
+    state a fresh constructor call with the same arguments would give it;
+    ObjectPool refuses classes without one.
+    """
+
+    pool = None  # Set while the sprite is on loan from a pool
+    lease = 0  # Changes every time the sprite is acquired
+
+    def kill(self):
+        super().kill()
+        pool = self.pool
+        if pool is not None:
+            self.pool = None
+            pool.release(self)
+
+
+class ObjectPool:
+    """Pre-allocated instances of one sprite class
+
+    Instances keep their rect and attributes between loans, so acquiring one
+    only resets state. When the pool is empty a new instance is created and
+    counted as a miss; released instances beyond capacity are dropped.
+    """
+
+    def __init__(self, sprite_class, capacity=0, factory=None):
+        if not callable(getattr(sprite_class, "reset", None)):
+            raise TypeError(f"{sprite_class.__name__} has no reset() method and cannot be pooled")
+        self.sprite_class = sprite_class
+        self.factory = factory or (lambda: sprite_class(0, 0))
+        self.capacity = 0
+        self.free = []
+        self.in_use = 0
+        self.high_water = 0
+        self.acquired = 0
+        self.misses = 0
+        self.reserve(capacity)
+
+    def reserve(self, capacity):
+        """Grow the pool to capacity instances, allocating them now"""
+        if capacity > self.capacity:
+            self.free.extend(self.factory() for _ in range(capacity - self.capacity))
+            self.capacity = capacity
+
+    def acquire(self, *args):
+        """Return an instance reset with args"""
+        if self.free:
+            sprite = self.free.pop()
+        else:
+            sprite = self.factory()
+            self.misses += 1
+        sprite.reset(*args)
+        sprite.pool = self
+        sprite.lease += 1
+        self.acquired += 1
+        self.in_use += 1
+        if self.in_use > self.high_water:
+            self.high_water = self.in_use
+        return sprite
+
+    def release(self, sprite):
+        """Take back an instance that is no longer in play"""
+        self.in_use -= 1
+        if len(self.free) < self.capacity:
+            self.free.append(sprite)
+
+    def stats(self):
+        """Return the pool's allocation counters"""
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "high_water": self.high_water,
+            "acquired": self.acquired,
+            "misses": self.misses,
+        }
+
+
+class PoolRegistry:
+    """One ObjectPool per sprite class"""
+
+    def __init__(self):
+        self.pools = {}
+
+    def __contains__(self, sprite_class):
+        return sprite_class in self.pools
+
+    def __getitem__(self, sprite_class):
+        return self.pools[sprite_class]
+
+    def reserve(self, sprite_class, capacity, factory=None):
+        """Create or grow the pool of a class"""
+        pool = self.pools.get(sprite_class)
+        if pool is None:
+            pool = self.pools[sprite_class] = ObjectPool(sprite_class, capacity, factory)
+        else:
+            pool.reserve(capacity)
+        return pool
+
+    def acquire(self, sprite_class, *args):
+        """Return an instance of a pooled class, reset with args
+
+        A class without a pool gets an empty one, so every instance is a miss
+        until capacity is reserved for it.
+        """
+        pool = self.pools.get(sprite_class)
+        if pool is None:
+            pool = self.reserve(sprite_class, 0)
+        return pool.acquire(*args)
+
+    def stats(self):
+        """Return {class name: counters} for every pool"""
+        return {sprite_class.__name__: pool.stats() for sprite_class, pool in self.pools.items()}
+
+
+# Shared by the level loader, the streamer and the sisters' projectiles
+pools = PoolRegistry()
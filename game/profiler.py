@@ -0,0 +1,253 @@
+"""
+Profiler module for Mario Sisters game.
+Contains the frame-time profiler, its on-screen graph and trace export.
+"""
+import csv
+import json
+import time
+from array import array
+
+import pygame
+from constants import *
+
+PROFILE_FRAMES = 600  # Frames kept in the ring buffer, 10 seconds at 60 FPS
+PROFILE_REFRESH = 30  # Frames between updates of the percentile table
+GRAPH_WIDTH = 240  # One pixel column per frame
+GRAPH_HEIGHT = 100
+GRAPH_SCALE = GRAPH_HEIGHT / (2000 / FPS)  # Pixels per millisecond, two frame budgets tall
+GRAPH_BACKGROUND = (20, 20, 20)
+
+# Phases in the order they happen in a frame, with their graph colours
+PROFILE_PHASES = {
+    "events": (200, 200, 200),
+    "assets": (0, 128, 128),
+    "platforms": (150, 75, 0),
+    "player": (255, 105, 180),
+    "camera": (0, 255, 255),
+    "enemies": (255, 0, 0),
+    "items": (255, 255, 0),
+    "rewind": (255, 140, 0),
+    "world": (0, 200, 0),
+    "hud": (80, 140, 255),
+    "profiler": (200, 100, 255),
+    "present": (255, 255, 255),
+}
+# Values sampled once per frame, like how much memory something holds
+PROFILE_COUNTERS = ("rewind_kb",)
+
+
+def percentile(samples, fraction):
+    """Return the nearest-rank percentile of a sorted list"""
+    rank = int(fraction * len(samples) + 0.999999)
+    return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+class Profiler:
+    """Per-phase frame timings in a fixed-size ring buffer
+
+    The game calls begin_frame() and end_frame() around every frame and
+    mark(phase) after each phase, which charges the time since the previous
+    mark to that phase. A phase that runs several times in a frame, like
+    the updates of a catch-up step, adds up. count(counter, value) samples
+    a counter, which keeps its value in later frames until sampled again.
+    While disabled, begin_frame() only copies a flag and the game skips its
+    marks, so recording can be switched on at any time without slowing the
+    game down when it is off.
+    """
+
+    def __init__(self, capacity=PROFILE_FRAMES, phases=PROFILE_PHASES, counters=PROFILE_COUNTERS):
+        self.phases = list(phases)
+        self.colors = [phases[phase] for phase in self.phases]
+        self.columns = {phase: column for column, phase in enumerate(self.phases)}
+        self.counters = list(counters)
+        self.counter_columns = {counter: column for column, counter in enumerate(self.counters)}
+        self.capacity = capacity
+        self.samples = array('d', bytes(8 * capacity * len(self.phases)))  # Seconds, one row per frame
+        self.counts = array('d', bytes(8 * capacity * len(self.counters)))  # One row per frame
+        self.latest = array('d', bytes(8 * len(self.counters)))  # Last sampled value of each counter
+        self.starts = array('d', bytes(8 * capacity))  # Seconds from origin to each frame's start
+        self.ends = array('d', bytes(8 * capacity))
+        self.blank_row = array('d', bytes(8 * len(self.phases)))
+        self.origin = time.perf_counter()
+        self.frames = 0  # Frames recorded since the last clear
+        self.enabled = False  # Takes effect at the next begin_frame()
+        self.active = False  # Whether the current frame is being recorded
+        self.visible = False
+        self.row = 0
+        self.last = 0.0
+        self.font = None
+        self.graph = None
+        self.table = None
+
+    def begin_frame(self):
+        """Start recording a frame if the profiler is enabled"""
+        self.active = self.enabled
+        if not self.active:
+            return
+        now = time.perf_counter()
+        slot = self.frames % self.capacity
+        self.row = slot * len(self.phases)
+        self.samples[self.row:self.row + len(self.phases)] = self.blank_row
+        self.starts[slot] = now - self.origin
+        self.last = now
+
+    def mark(self, phase):
+        """Charge the time since the previous mark to a phase"""
+        now = time.perf_counter()
+        self.samples[self.row + self.columns[phase]] += now - self.last
+        self.last = now
+
+    def count(self, counter, value):
+        """Sample a counter"""
+        self.latest[self.counter_columns[counter]] = value
+
+    def end_frame(self):
+        """Finish the frame being recorded"""
+        if not self.active:
+            return
+        slot = self.frames % self.capacity
+        self.ends[slot] = time.perf_counter() - self.origin
+        width = len(self.counters)
+        self.counts[slot * width:(slot + 1) * width] = self.latest
+        self.frames += 1
+        if self.visible:
+            self.plot(self.row)
+            if self.frames % PROFILE_REFRESH == 0 or self.table is None:
+                self.table = self.render_table()
+
+    def clear(self):
+        """Forget every recorded frame"""
+        self.frames = 0
+        self.graph = None
+        self.table = None
+
+    def recorded(self):
+        """Return the buffer slots of the recorded frames, oldest first"""
+        if self.frames <= self.capacity:
+            return range(self.frames)
+        first = self.frames % self.capacity
+        return [(first + offset) % self.capacity for offset in range(self.capacity)]
+
+    def phase_samples(self, column):
+        """Return the recorded seconds of one phase, oldest first"""
+        width = len(self.phases)
+        return [self.samples[slot * width + column] for slot in self.recorded()]
+
+    def counter_samples(self, column):
+        """Return the recorded values of one counter, oldest first"""
+        width = len(self.counters)
+        return [self.counts[slot * width + column] for slot in self.recorded()]
+
+    def frame_samples(self):
+        """Return the recorded seconds from the start to the end of each frame, oldest first"""
+        return [self.ends[slot] - self.starts[slot] for slot in self.recorded()]
+
+    def summary(self):
+        """Return {phase: (p50, p99)} in milliseconds, plus the whole frame as "frame" """
+        if not self.frames:
+            return {}
+        results = {}
+        for column, phase in enumerate(self.phases):
+            samples = sorted(self.phase_samples(column))
+            results[phase] = (percentile(samples, 0.50) * 1000, percentile(samples, 0.99) * 1000)
+        samples = sorted(self.frame_samples())
+        results["frame"] = (percentile(samples, 0.50) * 1000, percentile(samples, 0.99) * 1000)
+        return results
+
+    def write_csv(self, path):
+        """Write one row per recorded frame with every phase in milliseconds, then the counters"""
+        width = len(self.phases)
+        counters = len(self.counters)
+        first = self.frames - len(self.recorded())
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["frame", "start_ms", "frame_ms"] + [f"{phase}_ms" for phase in self.phases] +
+                            self.counters)
+            for number, slot in enumerate(self.recorded(), first):
+                row = self.samples[slot * width:(slot + 1) * width]
+                counts = self.counts[slot * counters:(slot + 1) * counters]
+                writer.writerow([number, f"{self.starts[slot] * 1000:.3f}",
+                                 f"{(self.ends[slot] - self.starts[slot]) * 1000:.3f}"] +
+                                [f"{seconds * 1000:.3f}" for seconds in row] +
+                                [f"{value:.3f}" for value in counts])
+
+    def write_chrome_trace(self, path):
+        """Write the recorded frames in the Chrome trace event format
+
+        The file opens in chrome://tracing or Perfetto. Phases are laid end
+        to end from the start of their frame, in the order they run, and
+        counters become counter tracks.
+        """
+        width = len(self.phases)
+        counters = len(self.counters)
+        first = self.frames - len(self.recorded())
+        events = []
+        for number, slot in enumerate(self.recorded(), first):
+            start = self.starts[slot] * 1e6
+            events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1, "ts": round(start, 3),
+                           "dur": round((self.ends[slot] - self.starts[slot]) * 1e6, 3),
+                           "args": {"frame": number}})
+            offset = start
+            for column, phase in enumerate(self.phases):
+                duration = self.samples[slot * width + column] * 1e6
+                if duration:
+                    events.append({"name": phase, "ph": "X", "pid": 1, "tid": 1,
+                                   "ts": round(offset, 3), "dur": round(duration, 3)})
+                    offset += duration
+            for column, counter in enumerate(self.counters):
+                events.append({"name": counter, "ph": "C", "pid": 1, "ts": round(start, 3),
+                               "args": {counter: self.counts[slot * counters + column]}})
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+    def plot(self, row):
+        """Scroll the graph one pixel and draw a frame's phases as a stacked column"""
+        if self.graph is None:
+            self.graph = pygame.Surface((GRAPH_WIDTH, GRAPH_HEIGHT))
+            self.graph.fill(GRAPH_BACKGROUND)
+        graph = self.graph
+        graph.scroll(-1, 0)
+        x = GRAPH_WIDTH - 1
+        graph.fill(GRAPH_BACKGROUND, (x, 0, 1, GRAPH_HEIGHT))
+        bottom = float(GRAPH_HEIGHT)
+        for column, color in enumerate(self.colors):
+            height = self.samples[row + column] * 1000 * GRAPH_SCALE
+            if height > 0 and bottom > 0:
+                top = max(bottom - height, 0.0)
+                if round(bottom) > round(top):
+                    graph.fill(color, (x, round(top), 1, round(bottom) - round(top)))
+                bottom = top
+        # Mark the frame budget
+        graph.set_at((x, GRAPH_HEIGHT - round(1000 / FPS * GRAPH_SCALE)), WHITE)
+
+    def render_table(self):
+        """Render the p50 and p99 of every phase into one surface"""
+        if self.font is None:
+            self.font = pygame.font.Font(None, SMALL_FONT_SIZE)
+        lines = [("phase", "p50 ms", "p99 ms", WHITE)]
+        for phase, (p50, p99) in self.summary().items():
+            lines.append((phase, f"{p50:.2f}", f"{p99:.2f}", PROFILE_PHASES.get(phase, WHITE)))
+        # Counters show their latest value
+        for column, counter in enumerate(self.counters):
+            lines.append((counter, "", f"{self.latest[column]:.1f}", WHITE))
+        line_height = self.font.get_linesize()
+        table = pygame.Surface((GRAPH_WIDTH, line_height * len(lines)))
+        table.fill(GRAPH_BACKGROUND)
+        for number, (phase, p50, p99, color) in enumerate(lines):
+            y = number * line_height
+            table.blit(self.font.render(phase, True, color), (4, y))
+            # Numbers are right-aligned in their columns
+            for right, text in ((150, p50), (GRAPH_WIDTH - 4, p99)):
+                surface = self.font.render(text, True, color)
+                table.blit(surface, (right - surface.get_width(), y))
+        return table
+
+    def draw(self, surface, x, y):
+        """Blit the graph with the percentile table under it and return the area covered"""
+        area = pygame.Rect(x, y, 0, 0)
+        if self.graph is not None:
+            area.union_ip(surface.blit(self.graph, (x, y)))
+            y += GRAPH_HEIGHT
+        if self.table is not None:
+            area.union_ip(surface.blit(self.table, (x, y)))
+        return area
@@ -0,0 +1,50 @@
+"""
+Projectiles module for Mario Sisters game.
+Contains the things the sisters throw.
+"""
+import pygame
+from constants import *
+from collision import collide_platforms
+from pool import PooledSprite
+from render import surface_cache
+
+class Fireball(PooledSprite):
+    """Maria's fireball, which bounces along the ground until it hits something"""
+    
+    snapshot_fields = (("vel_x", "d"), ("vel_y", "d"), ("lifetime", "i"))  # Stored after the position
+    
+    def __init__(self, x, y, direction=1):
+        pygame.sprite.Sprite.__init__(self)
+        self.image = surface_cache.get((FIREBALL_SIZE, FIREBALL_SIZE), ORANGE)
+        self.rect = self.image.get_rect()
+        self.reset(x, y, direction)
+    
+    def reset(self, x, y, direction=1):
+        """Launch the fireball from (x, y) in a direction"""
+        self.rect.center = (x, y)
+        self.vel_x = FIREBALL_SPEED * direction
+        self.vel_y = 0
+        self.lifetime = FIREBALL_LIFETIME
+        self.previous_pos = None
+    
+    def update(self, platforms):
+        """Fly forward, bounce off floors and burn out against walls"""
+        self.lifetime -= 1
+        if self.lifetime <= 0 or self.rect.top > SCREEN_HEIGHT:
+            self.kill()
+            return
+        
+        self.rect.x += self.vel_x
+        if collide_platforms(self, platforms):
+            self.kill()  # Hit a wall
+            return
+        
+        self.vel_y += PLAYER_GRAVITY
+        self.rect.y += int(self.vel_y)
+        hits = collide_platforms(self, platforms)
+        if hits:
+            if self.vel_y > 0:  # Landed, so bounce
+                self.rect.bottom = hits[0].top
+                self.vel_y = FIREBALL_BOUNCE
+            else:
+                self.kill()
@@ -0,0 +1,406 @@
+"""
+Rendering module for Mario Sisters game.
+Contains helpers that cache drawing work between frames.
+"""
+from collections import OrderedDict
+
+import pygame
+from constants import *
+from collision import SpatialHash
+from tilemap import TILE_COLORS
+
+CHUNK_WIDTH = SCREEN_WIDTH
+CHUNK_COLORKEY = (255, 0, 255)  # Magenta marks the empty parts of a chunk
+CAMERA_CELL_SIZE = TILE_SIZE * 4
+TEXT_CACHE_SIZE = 256
+FULL_UPDATE_FRACTION = 0.5  # Past this share of the screen one full flip is cheaper
+
+
+class TerrainChunk:
+    """One screen-wide strip of pre-rendered static terrain"""
+
+    def __init__(self, index):
+        self.index = index
+        self.left = index * CHUNK_WIDTH
+        self.sprites = []  # Terrain sprites overlapping this chunk, in draw order
+        self.surface = None
+        self.top = 0  # World y of the surface's first row
+        self.stale = True  # Rendered on first view rather than up front
+
+    def tile_bounds(self, tilemap):
+        """Return the world (top, bottom) of the solid tiles in this chunk, or None"""
+        if tilemap is None:
+            return None
+        rows = tilemap.rows
+        first_col = self.left // TILE_SIZE
+        last_col = min((self.left + CHUNK_WIDTH) // TILE_SIZE, tilemap.columns)
+        top = bottom = None
+        for col in range(first_col, last_col):
+            column = tilemap.cells[col * rows:(col + 1) * rows]
+            for row, code in enumerate(column):
+                if code:
+                    if top is None or row < top:
+                        top = row
+                    if bottom is None or row > bottom:
+                        bottom = row
+        if top is None:
+            return None
+        return tilemap.origin_y + top * TILE_SIZE, tilemap.origin_y + (bottom + 1) * TILE_SIZE
+
+    def bake(self, tilemap=None):
+        """Render every tile and sprite of the chunk into a fresh surface"""
+        self.stale = False
+        spans = [(sprite.rect.top, sprite.rect.bottom) for sprite in self.sprites]
+        tiles = self.tile_bounds(tilemap)
+        if tiles is not None:
+            spans.append(tiles)
+        if not spans:
+            self.surface = None
+            return
+        self.top = min(top for top, _ in spans)
+        bottom = max(bottom for _, bottom in spans)
+        self.surface = pygame.Surface((CHUNK_WIDTH, bottom - self.top))
+        self.surface.fill(CHUNK_COLORKEY)
+        self.surface.set_colorkey(CHUNK_COLORKEY)
+        self.draw_area(pygame.Rect(self.left, self.top, CHUNK_WIDTH, bottom - self.top), tilemap)
+
+    def rebake_area(self, rect, tilemap=None):
+        """Redraw only the part of the chunk covered by a world rect"""
+        if self.stale:
+            return  # Nothing drawn yet, the first view renders everything
+        if self.surface is None or rect.top < self.top or rect.bottom > self.top + self.surface.get_height():
+            self.bake(tilemap)
+            return
+        self.surface.set_clip(rect.move(-self.left, -self.top))
+        self.surface.fill(CHUNK_COLORKEY)
+        self.draw_area(rect, tilemap)
+        self.surface.set_clip(None)
+
+    def draw_area(self, rect, tilemap):
+        """Draw the tiles and sprites overlapping a world rect onto the surface"""
+        surface = self.surface
+        if tilemap is not None:
+            col0, row0, col1, row1 = tilemap.cell_range(rect)
+            for row in range(row0, row1 + 1):
+                # One fill per horizontal run of equal tiles
+                y = tilemap.origin_y + row * TILE_SIZE - self.top
+                col = col0
+                while col <= col1:
+                    code = tilemap.get_tile(col, row)
+                    end = col + 1
+                    while end <= col1 and tilemap.get_tile(end, row) == code:
+                        end += 1
+                    if code:
+                        surface.fill(TILE_COLORS[code], (col * TILE_SIZE - self.left, y,
+                                                         (end - col) * TILE_SIZE, TILE_SIZE))
+                    col = end
+        for sprite in self.sprites:
+            if sprite.rect.colliderect(rect):
+                surface.blit(sprite.image, (sprite.rect.x - self.left, sprite.rect.y - self.top))
+
+
+class TerrainGroup(pygame.sprite.Group):
+    """Static terrain that is drawn from baked chunk surfaces
+
+    Chunks show the solid cells of the tile map, if one is given, plus the
+    sprites in this group. Sprites must not move. When one is killed or
+    recoloured, only its own area is re-rendered in the chunks it overlaps.
+    version changes whenever terrain that may already be on screen does.
+    """
+
+    def __init__(self, *sprites, tilemap=None):
+        self.chunks = {}  # index -> TerrainChunk
+        self.tilemap = tilemap
+        self.baked = False
+        self.version = 0
+        super().__init__(*sprites)
+
+    def chunk_range(self, rect):
+        """Return the chunk indices a world rect overlaps"""
+        return range(rect.left // CHUNK_WIDTH, (rect.right - 1) // CHUNK_WIDTH + 1)
+
+    def chunk(self, index):
+        """Return the chunk at an index, creating it if needed"""
+        chunk = self.chunks.get(index)
+        if chunk is None:
+            chunk = self.chunks[index] = TerrainChunk(index)
+        return chunk
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        for index in self.chunk_range(sprite.rect):
+            chunk = self.chunk(index)
+            chunk.sprites.append(sprite)
+            if self.baked:
+                chunk.rebake_area(sprite.rect, self.tilemap)
+                self.version += 1
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        for index in self.chunk_range(sprite.rect):
+            chunk = self.chunks[index]
+            chunk.sprites.remove(sprite)
+            if self.baked:
+                chunk.rebake_area(sprite.rect, self.tilemap)
+                self.version += 1
+
+    def empty(self):
+        self.baked = False
+        super().empty()
+        self.chunks.clear()
+        self.version += 1
+
+    def bake(self):
+        """Prepare the chunks once the level has been built
+
+        Each chunk is rendered the first time it comes into view, so loading a
+        long level does not pay for chunks the player never reaches.
+        """
+        if self.tilemap is not None:
+            for index in range(-(-self.tilemap.columns * TILE_SIZE // CHUNK_WIDTH)):
+                self.chunk(index)
+        for chunk in self.chunks.values():
+            chunk.stale = True
+        self.baked = True
+        self.version += 1
+
+    def refresh_sprite(self, sprite):
+        """Re-render a sprite whose image changed"""
+        if self.baked and self.has(sprite):
+            self.refresh_rect(sprite.rect)
+
+    def refresh_rect(self, rect):
+        """Re-render a world area, e.g. after tiles in it changed"""
+        if self.baked:
+            for index in self.chunk_range(rect):
+                self.chunk(index).rebake_area(rect, self.tilemap)
+            self.version += 1
+
+    def evict(self, index):
+        """Free the baked surface of a chunk that went out of range"""
+        chunk = self.chunks.get(index)
+        if chunk is not None:
+            chunk.surface = None
+            chunk.stale = True
+            self.version += 1
+
+    def draw_visible(self, surface, offset_x):
+        """Blit the chunks that overlap the screen and return how many were drawn"""
+        first = int(-offset_x) // CHUNK_WIDTH
+        drawn = 0
+        for index in (first, first + 1):
+            chunk = self.chunks.get(index)
+            if chunk is not None and chunk.stale:
+                chunk.bake(self.tilemap)
+            if chunk is not None and chunk.surface is not None:
+                surface.blit(chunk.surface, (chunk.left + offset_x, chunk.top))
+                drawn += 1
+        return drawn
+
+
+class CameraGroup(pygame.sprite.Group):
+    """Sprite group that can list the sprites inside the camera window
+
+    Sprites are bucketed in a coarse spatial hash, so the cost of a query
+    depends on what is on screen rather than on the size of the level.
+    Anything that moves a sprite must call relocate() afterwards. A game that
+    never draws passes indexed=False to skip the bookkeeping; visible() then
+    checks every sprite.
+    """
+
+    def __init__(self, *sprites, indexed=True):
+        self.spatial_hash = SpatialHash(CAMERA_CELL_SIZE) if indexed else None
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if self.spatial_hash is not None:
+            self.spatial_hash.insert(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        if self.spatial_hash is not None:
+            self.spatial_hash.remove(sprite)
+
+    def relocate(self, sprite):
+        """Tell the index that a sprite has moved"""
+        spatial_hash = self.spatial_hash
+        if spatial_hash is not None and sprite in spatial_hash:
+            spatial_hash.move(sprite)
+
+    def visible(self, offset_x):
+        """Return the sprites overlapping the screen, in the order they were added"""
+        screen = pygame.Rect(-offset_x, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        if self.spatial_hash is None:
+            return [sprite for sprite in self.sprites() if screen.colliderect(sprite.rect)]
+        return self.spatial_hash.query(screen)
+
+    def placements(self, offset_x, alpha=None):
+        """Return {sprite: (image, screen position)} for the on-screen sprites, in draw order
+
+        With alpha, sprites that recorded a previous_pos are placed that far
+        between their previous and current position.
+        """
+        placed = {}
+        for sprite in self.visible(offset_x):
+            rect = sprite.rect
+            previous = getattr(sprite, "previous_pos", None) if alpha is not None else None
+            if previous is None:
+                placed[sprite] = (sprite.image, (rect.x + offset_x, rect.y))
+            else:
+                x = previous[0] + (rect.x - previous[0]) * alpha
+                y = previous[1] + (rect.y - previous[1]) * alpha
+                placed[sprite] = (sprite.image, (round(x + offset_x), round(y)))
+        return placed
+
+    def draw_visible(self, surface, offset_x, alpha=None):
+        """Blit the on-screen sprites shifted by the camera and return how many were drawn"""
+        placed = self.placements(offset_x, alpha)
+        surface.blits(placed.values(), False)
+        return len(placed)
+
+
+class TextCache:
+    """Rendered text surfaces keyed on (font, string, colour) with LRU eviction"""
+
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        """Return an antialiased surface for the text, rasterising it only once"""
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        """Drop every cached surface"""
+        self.surfaces.clear()
+
+
+# Shared by the game screens and the sisters' status labels
+text_cache = TextCache()
+
+
+def merge_rects(rects):
+    """Return rects with every group of overlapping ones replaced by their union"""
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        index = 0
+        while index < len(merged):
+            if merged[index].colliderect(rect):
+                rect.union_ip(merged.pop(index))
+                index = 0  # The grown rect may now reach earlier ones
+            else:
+                index += 1
+        merged.append(rect)
+    return merged
+
+
+class ScreenUpdater:
+    """Collects the areas of the screen that changed and pushes only those
+
+    Overlapping areas are merged first. When nothing changed the display is
+    left alone, and when the changes cover most of the screen, or
+    invalidate() was called, the whole display is flipped instead.
+    """
+
+    def __init__(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        self.screen_rect = pygame.Rect((0, 0), size)
+        self.rects = []
+        self.full = True
+        self.flips = 0
+        self.updates = 0
+        self.skips = 0
+
+    def invalidate(self):
+        """Push the whole screen at the next present()"""
+        self.full = True
+
+    def add(self, rect):
+        """Mark a screen area as changed"""
+        rect = self.screen_rect.clip(rect)
+        if rect.width and rect.height:
+            self.rects.append(rect)
+
+    def present(self):
+        """Send the changed areas to the display and start collecting afresh"""
+        rects = merge_rects(self.rects)
+        area = sum(rect.width * rect.height for rect in rects)
+        if self.full or area > self.screen_rect.width * self.screen_rect.height * FULL_UPDATE_FRACTION:
+            pygame.display.flip()
+            self.flips += 1
+        elif rects:
+            pygame.display.update(rects)
+            self.updates += 1
+        else:
+            self.skips += 1
+        self.rects = []
+        self.full = False
+
+    def stats(self):
+        """Return how many frames were flipped, partly updated or skipped"""
+        return {"flips": self.flips, "updates": self.updates, "skips": self.skips}
+
+
+class SurfaceCache:
+    """Shared solid-colour sprite images keyed on (size, colour, variant)
+
+    Sprites that look alike share one Surface, converted to the display's
+    pixel format once a display exists so blits need no conversion. Never
+    draw on a cached surface; a sprite that changes colour swaps in the
+    surface for its new colour instead. variant tells apart images of the
+    same size and colour that a caller draws its own details on.
+    """
+
+    def __init__(self):
+        self.surfaces = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, size, color, variant=None):
+        """Return the shared surface for a size and colour, creating it only once"""
+        key = ((int(size[0]), int(size[1])), tuple(color), variant)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = pygame.Surface(key[0])
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.fill(color)
+        self.surfaces[key] = surface
+        return surface
+
+    def clear(self):
+        """Drop every cached surface"""
+        self.surfaces.clear()
+
+    def stats(self):
+        """Return the cache's size and hit counters"""
+        return {"surfaces": len(self.surfaces), "hits": self.hits, "misses": self.misses}
+
+
+# Shared by every sprite that is drawn as a coloured rectangle
+surface_cache = SurfaceCache()
+
+
+def make_overlay(size, color, alpha):
+    """Create a translucent surface once so it can be blitted every frame"""
+    overlay = pygame.Surface(size)
+    overlay.fill(color)
+    overlay.set_alpha(alpha)
+    return overlay
@@ -0,0 +1,248 @@
+"""
+Replay module for Mario Sisters game.
+Contains the input sources used for live play, recording and headless replay.
+
+Usage:
+    python replay.py record FILE
+    python replay.py play FILE [--render] [--trace CSV] [--compare CSV]
+
+A replay stores the RNG seed plus, for every simulation step, the events
+handled before it and the state of the keys it read. Playing it back on a
+fresh game reproduces the session step for step.
+"""
+import argparse
+import struct
+import sys
+import time
+
+import pygame
+from rewind import REWIND_KEY
+
+REPLAY_MAGIC = b"MSRP"
+REPLAY_VERSION = 2
+HEADER = struct.Struct("<4sHqIB")  # magic, version, seed, steps, tracked key count
+KEY_CODE = struct.Struct("<i")
+STEP = struct.Struct("<HB")  # pressed key mask, event count
+STEPS = {1: struct.Struct("<BB"), 2: STEP}  # Step layout of every version still read
+EVENT = struct.Struct("<Bi")  # event kind, key
+
+# Keys whose held state is stored, one bit each
+TRACKED_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN,
+                pygame.K_SPACE, pygame.K_z, pygame.K_LSHIFT, pygame.K_ESCAPE, REWIND_KEY)
+
+# Only the events the game reacts to are recorded
+EVENT_QUIT = 0
+EVENT_KEYDOWN = 1
+
+
+class LiveInput:
+    """Reads events and held keys straight from pygame"""
+
+    def get_events(self):
+        return pygame.event.get()
+
+    def get_pressed(self):
+        return pygame.key.get_pressed()
+
+
+class PressedKeys:
+    """Held-key state rebuilt from a replay, indexable like get_pressed()"""
+
+    def __init__(self, mask, keys=TRACKED_KEYS):
+        self.pressed = {key for bit, key in enumerate(keys) if mask & (1 << bit)}
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class InputRecorder:
+    """Passes input through from another source and records it per step
+
+    Events are collected until the game next reads the held keys, which it
+    does once per update, so each recorded step holds the events handled
+    before that update.
+    """
+
+    def __init__(self, source, seed, keys=TRACKED_KEYS):
+        self.source = source
+        self.seed = seed
+        self.keys = keys
+        self.pending = []
+        self.steps = []  # (key mask, [(kind, key), ...])
+
+    def get_events(self):
+        events = self.source.get_events()
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.pending.append((EVENT_QUIT, 0))
+            elif event.type == pygame.KEYDOWN:
+                self.pending.append((EVENT_KEYDOWN, event.key))
+        return events
+
+    def get_pressed(self):
+        pressed = self.source.get_pressed()
+        mask = 0
+        for bit, key in enumerate(self.keys):
+            if pressed[key]:
+                mask |= 1 << bit
+        self.steps.append((mask, self.pending))
+        self.pending = []
+        return pressed
+
+    def save(self, path):
+        """Write the recorded steps to a replay file"""
+        with open(path, "wb") as replay_file:
+            replay_file.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed,
+                                          len(self.steps), len(self.keys)))
+            for key in self.keys:
+                replay_file.write(KEY_CODE.pack(key))
+            for mask, events in self.steps:
+                replay_file.write(STEP.pack(mask, len(events)))
+                for kind, key in events:
+                    replay_file.write(EVENT.pack(kind, key))
+
+
+class ReplayInput:
+    """Feeds a recorded session back to the game one step at a time"""
+
+    def __init__(self, path):
+        with open(path, "rb") as replay_file:
+            data = replay_file.read()
+        magic, version, self.seed, step_count, key_count = HEADER.unpack_from(data, 0)
+        if magic != REPLAY_MAGIC or version not in STEPS:
+            raise ValueError(f"{path} is not a replay file this version can read")
+        step = STEPS[version]
+        offset = HEADER.size
+        self.keys = []
+        for _ in range(key_count):
+            self.keys.append(KEY_CODE.unpack_from(data, offset)[0])
+            offset += KEY_CODE.size
+
+        self.steps = []
+        for _ in range(step_count):
+            mask, event_count = step.unpack_from(data, offset)
+            offset += step.size
+            events = []
+            for _ in range(event_count):
+                events.append(EVENT.unpack_from(data, offset))
+                offset += EVENT.size
+            self.steps.append((mask, events))
+        self.position = 0
+
+    def __len__(self):
+        return len(self.steps)
+
+    def finished(self):
+        return self.position >= len(self.steps)
+
+    def get_events(self):
+        if self.finished():
+            return []
+        events = []
+        for kind, key in self.steps[self.position][1]:
+            if kind == EVENT_QUIT:
+                events.append(pygame.event.Event(pygame.QUIT))
+            else:
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=key))
+        return events
+
+    def get_pressed(self):
+        mask = self.steps[self.position][0] if not self.finished() else 0
+        self.position += 1
+        return PressedKeys(mask, self.keys)
+
+
+def record(path, **game_options):
+    """Play the game in a window and save the session to path"""
+    from game import Game
+    game = Game(**game_options)
+    recorder = InputRecorder(game.input, game.seed)
+    game.input = recorder
+    game.run()
+    recorder.save(path)
+    return len(recorder.steps)
+
+
+def play(path, render=False):
+    """Replay a session headlessly and return per-step (update, draw) seconds"""
+    from game import Game
+    replay = ReplayInput(path)
+    game = Game(headless=True, render=render, seed=replay.seed)
+    game.input = replay
+    clock = time.perf_counter
+    trace = []
+    while game.running and not replay.finished():
+        start = clock()
+        game.events()
+        game.update()
+        updated = clock()
+        if render:
+            game.draw()
+        trace.append((updated - start, clock() - updated))
+    return game, trace
+
+
+def save_trace(path, trace):
+    """Write a frame-time trace as CSV in milliseconds"""
+    with open(path, "w") as trace_file:
+        trace_file.write("step,update_ms,draw_ms\n")
+        for step, (update, draw) in enumerate(trace):
+            trace_file.write(f"{step},{update * 1000:.4f},{draw * 1000:.4f}\n")
+
+
+def load_trace(path):
+    """Read a CSV trace written by save_trace back into seconds"""
+    trace = []
+    with open(path) as trace_file:
+        next(trace_file)
+        for line in trace_file:
+            _, update, draw = line.split(",")
+            trace.append((float(update) / 1000, float(draw) / 1000))
+    return trace
+
+
+def compare_traces(before, after):
+    """Print p50 and p99 update and draw times of two traces side by side"""
+    def stat(trace, column, fraction):
+        samples = sorted(step[column] * 1000 for step in trace)
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)] if samples else 0.0
+
+    print(f"{'':<12} {'before':>9} {'after':>9} {'change':>8}")
+    for column, name in ((0, "update"), (1, "draw")):
+        for fraction, label in ((0.5, "p50"), (0.99, "p99")):
+            old = stat(before, column, fraction)
+            new = stat(after, column, fraction)
+            change = f"{(new - old) / old:+.0%}" if old else ""
+            print(f"{name + ' ' + label:<12} {old:>9.3f} {new:>9.3f} {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record or replay Mario Sisters sessions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="play in a window and record")
+    record_parser.add_argument("file")
+    record_parser.add_argument("--seed", type=int, default=None)
+    play_parser = commands.add_parser("play", help="replay headlessly")
+    play_parser.add_argument("file")
+    play_parser.add_argument("--render", action="store_true", help="also draw every step offscreen")
+    play_parser.add_argument("--trace", help="write per-step frame times to this CSV file")
+    play_parser.add_argument("--compare", help="compare frame times with an earlier CSV trace")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        steps = record(args.file, seed=args.seed)
+        print(f"Recorded {steps} steps to {args.file}")
+    else:
+        game, trace = play(args.file, render=args.render)
+        total = sum(update + draw for update, draw in trace)
+        print(f"Replayed {len(trace)} steps in {total * 1000:.1f} ms, final score {game.score}")
+        if args.trace:
+            save_trace(args.trace, trace)
+        if args.compare:
+            compare_traces(load_trace(args.compare), trace)
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
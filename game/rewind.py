@@ -0,0 +1,151 @@
+"""
+Rewind module for Mario Sisters game.
+Contains the ring buffer of recent game states that lets play run backwards.
+"""
+import struct
+import time
+from collections import deque
+
+import pygame
+from constants import *
+import snapshot
+
+REWIND_KEY = pygame.K_BACKSPACE  # Held to rewind
+KEYFRAME_INTERVAL = 60  # Frames from one full state to the next
+# Head length, changed record count, entity count or -1 if the order is unchanged,
+# tail length or -1 if the tail is unchanged
+FRAME = struct.Struct("<IIii")
+RECORD = struct.Struct("<IH")  # entity index, record length
+
+
+class RewindBuffer:
+    """The last frames of play, as keyframes followed by deltas
+
+    Every frame is a snapshot split into parts (see snapshot.capture()).
+    A keyframe stores all of them. The frames after it store the parts
+    before and after the entity records, plus only the records that
+    changed since the frame before and the record order when it changed,
+    so entities standing still cost nothing. Frames are kept in groups
+    headed by a keyframe, and the oldest group is dropped as a whole once
+    the rest cover the window, so between capacity and capacity +
+    KEYFRAME_INTERVAL frames are kept.
+    """
+
+    def __init__(self, capacity, keyframe_interval=KEYFRAME_INTERVAL):
+        self.capacity = capacity
+        self.keyframe_interval = keyframe_interval
+        self.groups = deque()  # [encoded keyframe, encoded delta, ...] per group
+        self.capture_time = 0.0  # Seconds the last capture took
+        self.clear()
+
+    def clear(self):
+        """Forget every frame"""
+        self.groups.clear()
+        self.frames = 0
+        self.size = 0  # Bytes of encoded frames held
+        # The newest frame, which the next delta is taken against
+        self.head = b""
+        self.records = {}  # entity index -> record
+        self.order = []  # entity indices in record order
+        self.tail = b""
+
+    def __len__(self):
+        return self.frames
+
+    def capture(self, game):
+        """Add the state of a game as the newest frame and return True
+
+        A game snapshots cannot describe, such as one playing a level that
+        is not streamed, has no frames to go back to: the buffer is emptied
+        and False returned.
+        """
+        start = time.perf_counter()
+        try:
+            head, records, tail = snapshot.capture(game)
+        except ValueError:
+            self.clear()
+            self.capture_time = time.perf_counter() - start
+            return False
+        order = [index for index, _ in records]
+        keyframe = not self.groups or len(self.groups[-1]) >= self.keyframe_interval
+        if keyframe:
+            changed = records
+        else:
+            previous = self.records
+            changed = [(index, record) for index, record in records if previous.get(index) != record]
+        parts = [FRAME.pack(len(head), len(changed),
+                            len(order) if keyframe or order != self.order else -1,
+                            len(tail) if keyframe or tail != self.tail else -1), head]
+        for index, record in changed:
+            parts.append(RECORD.pack(index, len(record)))
+            parts.append(record)
+        if keyframe or order != self.order:
+            parts.append(struct.pack(f"<{len(order)}I", *order))
+        if keyframe or tail != self.tail:
+            parts.append(tail)
+        frame = b"".join(parts)
+
+        if keyframe:
+            self.groups.append([frame])
+        else:
+            self.groups[-1].append(frame)
+        self.frames += 1
+        self.size += len(frame)
+        self.head, self.order, self.tail = head, order, tail
+        self.records = dict(records)
+        # Whole groups go once the newer ones cover the window
+        while self.frames - len(self.groups[0]) >= self.capacity:
+            self.drop(self.groups.popleft())
+        self.capture_time = time.perf_counter() - start
+        return True
+
+    def drop(self, frames):
+        """Account for frames leaving the buffer"""
+        self.frames -= len(frames)
+        self.size -= sum(map(len, frames))
+
+    def rewind(self, game):
+        """Put the game back one frame and return True, or False if there is none left
+
+        The newest frame is the state the game is in, so it is dropped and
+        the one before it restored.
+        """
+        if self.frames < 2:
+            return False
+        group = self.groups[-1]
+        self.drop([group.pop()])
+        if not group:
+            self.groups.pop()
+            group = self.groups[-1]
+        self.decode(group)
+        snapshot.restore(game, b"".join([self.head] + [self.records[index] for index in self.order] + [self.tail]))
+        return True
+
+    def decode(self, group):
+        """Rebuild the newest frame from a group's keyframe and deltas"""
+        records = {}
+        for frame in group:
+            head_length, changed, entities, tail_length = FRAME.unpack_from(frame, 0)
+            offset = FRAME.size
+            self.head = frame[offset:offset + head_length]
+            offset += head_length
+            for _ in range(changed):
+                index, length = RECORD.unpack_from(frame, offset)
+                offset += RECORD.size
+                records[index] = frame[offset:offset + length]
+                offset += length
+            if entities >= 0:
+                self.order = list(struct.unpack_from(f"<{entities}I", frame, offset))
+                offset += 4 * entities
+            if tail_length >= 0:
+                self.tail = frame[offset:offset + tail_length]
+        self.records = {index: records[index] for index in self.order}
+
+    def stats(self):
+        """Return counters describing what the buffer holds"""
+        return {
+            "frames": self.frames,
+            "keyframes": len(self.groups),
+            "bytes": self.size,
+            "capture_us": self.capture_time * 1e6,
+        }
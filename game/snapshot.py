@@ -0,0 +1,322 @@
+"""
+Snapshot module for Mario Sisters game.
+Contains compact snapshots of a game in progress and restoring them.
+
+A snapshot is a bytes object holding only the mutable numbers of a game:
+its counters and camera, the sister, her fireballs and every entity of the
+level's loaded chunks, each packed with a struct built from its class's
+snapshot_fields. Sprites and Surfaces are never pickled. Entities are
+named by their index in the level, so a snapshot can be restored into any
+game, respawning and removing sprites as needed before the numbers are
+written back. Only games whose entities all come from a streamed level
+can be snapshotted.
+"""
+import random
+import struct
+from operator import attrgetter
+
+from constants import *
+from platforms import Platform
+from pool import pools
+from projectiles import Fireball
+
+SNAPSHOT_MAGIC = b"MSSN"
+SNAPSHOT_VERSION = 1
+# magic, version, level, sister, state, seed, score, time left, time counter, play steps,
+# camera, previous camera, then the counts of chunks, chunk states, entities, fireballs,
+# shells and batched entities, and whether the RNG state follows
+HEADER = struct.Struct("<4sHHBBqqiiqddIIIHHIB")
+ENTITY = struct.Struct("<IB")  # entity index, flags
+SLEPT_AT = struct.Struct("<q")
+RNG_WORDS = 625  # Mersenne Twister state plus its position
+
+# Entity flags
+ENTITY_ALIVE = 1
+ENTITY_ENEMY = 2
+ENTITY_ITEM = 4
+ENTITY_ASLEEP = 8  # Followed by the step it fell asleep
+
+seeded_states = {}  # seed -> RNG state right after seeding, for spotting an unused RNG
+
+
+class Codec:
+    """Packs the position and snapshot_fields of one sprite class
+
+    Static platforms never move, so their position is left out.
+    """
+
+    def __init__(self, sprite_class):
+        fields = sprite_class.snapshot_fields
+        self.names = [name for name, _ in fields]
+        self.positional = not issubclass(sprite_class, Platform) or sprite_class.kinematic
+        self.platform = issubclass(sprite_class, Platform)
+        names = (["rect.x", "rect.y"] if self.positional else []) + self.names
+        self.struct = struct.Struct("<" + ("ii" if self.positional else "") +
+                                    "".join(code for _, code in fields))
+        if len(names) > 1:
+            self.getter = attrgetter(*names)
+        elif names:
+            getter = attrgetter(names[0])
+            self.getter = lambda sprite: (getter(sprite),)
+        else:
+            self.getter = lambda sprite: ()
+        self.restored = getattr(sprite_class, "restored", None)
+
+    def pack(self, sprite):
+        return self.struct.pack(*self.getter(sprite))
+
+    def unpack_into(self, sprite, data, offset):
+        """Write a packed record back into a sprite and return the offset after it"""
+        values = self.struct.unpack_from(data, offset)
+        if self.positional:
+            sprite.rect.x = values[0]
+            sprite.rect.y = values[1]
+            values = values[2:]
+        for name, value in zip(self.names, values):
+            setattr(sprite, name, value)
+        if self.restored is not None:
+            self.restored(sprite)
+        return offset + self.struct.size
+
+
+codecs = {}
+
+
+def codec(sprite_class):
+    """Return the Codec of a class, building it on first use"""
+    found = codecs.get(sprite_class)
+    if found is None:
+        found = codecs[sprite_class] = Codec(sprite_class)
+    return found
+
+
+def pack_ints(values, code="I"):
+    return struct.pack(f"<{len(values)}{code}", *values)
+
+
+def unpack_ints(data, offset, count, code="I"):
+    """Return count packed integers and the offset after them"""
+    layout = struct.Struct(f"<{count}{code}")
+    return layout.unpack_from(data, offset), offset + layout.size
+
+
+def snapshot(game):
+    """Return the mutable state of a game in progress as bytes"""
+    head, records, tail = capture(game)
+    return b"".join([head] + [record for _, record in records] + [tail])
+
+
+def capture(game):
+    """Return a snapshot in three parts
+
+    The parts are the bytes before the entity records, the records as
+    (entity index, bytes) in order, and the bytes after them. Joined
+    together they are what snapshot() returns.
+    """
+    stream = game.stream
+    if stream is None or not hasattr(game, "player"):
+        raise ValueError("Only a game playing a streamed level can be snapshotted")
+    if game.physics is not None:
+        game.physics.sync()  # Sprites behind their batched state catch up first
+
+    indices = {}  # sprite in play -> entity index
+    dead = []
+    for entries in stream.loaded.values():
+        for index, sprite, lease in entries:
+            if sprite.alive() and getattr(sprite, "lease", 0) == lease:
+                indices[sprite] = index
+            else:
+                dead.append(index)
+    names = dict(indices)  # Entities not yet recorded
+
+    def entity_index(sprite):
+        index = names.pop(sprite, None)
+        if index is None:
+            raise ValueError(f"{type(sprite).__name__} at {sprite.rect.topleft} is not a level entity")
+        return index
+
+    # Entities are listed in group order, so restoring rebuilds the groups exactly
+    records = []
+    for flag, group in ((ENTITY_ENEMY, game.enemies), (ENTITY_ITEM, game.items)):
+        for sprite in group:
+            index = entity_index(sprite)
+            records.append((index, ENTITY.pack(index, ENTITY_ALIVE | flag) + codec(type(sprite)).pack(sprite)))
+    if game.activation is not None:
+        for sprite in game.activation.sleeping:
+            group, slept_at = game.activation.sleeping.homes[sprite]
+            flag = ENTITY_ENEMY if group is game.enemies else ENTITY_ITEM
+            index = entity_index(sprite)
+            records.append((index, ENTITY.pack(index, ENTITY_ALIVE | ENTITY_ASLEEP | flag) +
+                            SLEPT_AT.pack(slept_at) + codec(type(sprite)).pack(sprite)))
+    for sprite, index in names.items():
+        records.append((index, ENTITY.pack(index, ENTITY_ALIVE) + codec(type(sprite)).pack(sprite)))
+    for index in dead:
+        records.append((index, ENTITY.pack(index, 0)))
+
+    # Entity indices of the moving shells and of the batched entities in slot order
+    shells = [indices[sprite] for sprite in game.shells if sprite in indices]
+    batched = []
+    if game.physics is not None:
+        batched = [indices[sprite] for sprite in game.physics.sprites]
+
+    state_indices = []
+    state_codes = []
+    for states in stream.states.values():
+        state_indices += states.keys()
+        state_codes += states.values()
+
+    rng_state = game.rng.getstate()
+    seeded = seeded_states.get(game.seed)
+    if seeded is None:
+        seeded = seeded_states[game.seed] = random.Random(game.seed).getstate()
+    has_rng = rng_state != seeded
+
+    player = game.player
+    fireballs = list(getattr(player, "fireballs", ()))
+    chunks = list(stream.loaded)
+    head = [
+        HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, game.current_level, game.selected_sister,
+                    game.state, game.seed, game.score, game.time_left, game.time_counter,
+                    game.play_steps, game.camera_offset_x, game.previous_camera_offset_x,
+                    len(chunks), len(state_indices), len(records), len(fireballs), len(shells),
+                    len(batched), has_rng),
+        pack_ints(chunks),
+        pack_ints(state_indices),
+        pack_ints(state_codes, "B"),
+        codec(type(player)).pack(player),
+        codec(type(game.exit)).pack(game.exit),
+    ]
+    head += [codec(Fireball).pack(fireball) for fireball in fireballs]
+    tail = [pack_ints(shells), pack_ints(batched)]
+    if has_rng:
+        tail.append(pack_ints(rng_state[1]))
+    return b"".join(head), records, b"".join(tail)
+
+
+def restore(game, data):
+    """Put a game back in the state a snapshot recorded
+
+    The game may be a different one than the snapshot was taken from, as
+    long as it loads the same level files.
+    """
+    (magic, version, level, sister, state, seed, score, time_left, time_counter, play_steps,
+     camera, previous_camera, chunk_count, state_count, entity_count, fireball_count,
+     shell_count, batched_count, has_rng) = HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"Not a version {SNAPSHOT_VERSION} snapshot")
+    offset = HEADER.size
+    chunks, offset = unpack_ints(data, offset, chunk_count)
+    state_indices, offset = unpack_ints(data, offset, state_count)
+    state_codes, offset = unpack_ints(data, offset, state_count, "B")
+
+    # The right sister on the right level
+    player = getattr(game, "player", None)
+    if player is None or player.name != game.available_sisters[sister]:
+        if player is not None:
+            for fireball in list(getattr(player, "fireballs", ())):
+                fireball.kill()
+            player.kill()
+        game.selected_sister = sister
+        game.create_player()
+        player = game.player
+    # After the last level the win screen keeps it loaded, with current_level past it
+    if game.stream is None or min(game.current_level, LEVEL_COUNT) != min(level, LEVEL_COUNT):
+        game.load_level(min(level, LEVEL_COUNT))
+    game.current_level = level
+    stream = game.stream
+
+    # Stream in the snapshot's chunks, with what had been removed from the others
+    wanted = set(chunks)
+    for chunk_index in [index for index in stream.loaded if index not in wanted]:
+        stream.evict(chunk_index)
+    states = {}
+    for index, code in zip(state_indices, state_codes):
+        states.setdefault(stream.chunk_of(index), {})[index] = code
+    stream.states = states
+    entering = [index for index in chunks if index not in stream.loaded]
+    if entering:
+        stream.load(entering)
+    # Chunks that stayed loaded come first otherwise, and the entity records follow this order
+    stream.loaded = {index: stream.loaded[index] for index in chunks}
+
+    offset = codec(type(player)).unpack_into(player, data, offset)
+    player.previous_pos = None
+    offset = codec(type(game.exit)).unpack_into(game.exit, data, offset)
+    for fireball in list(getattr(player, "fireballs", ())):
+        fireball.kill()
+    for _ in range(fireball_count):
+        fireball = pools.acquire(Fireball, 0, 0)
+        offset = codec(Fireball).unpack_into(fireball, data, offset)
+        player.fireballs.add(fireball)
+        game.all_sprites.add(fireball)
+
+    # Groups are emptied and refilled in the snapshot's order
+    activation = game.activation
+    groups = [game.enemies, game.items] + ([activation.sleeping] if activation is not None else [])
+    for group in groups:
+        group.remove(*group.sprites())
+    current = {}  # entity index -> (loaded entries, position in them, live sprite or None)
+    for entries in stream.loaded.values():
+        for position, (index, sprite, lease) in enumerate(entries):
+            live = sprite.alive() and getattr(sprite, "lease", 0) == lease
+            current[index] = (entries, position, sprite if live else None)
+
+    sprites = {}  # entity index -> restored sprite
+    members = []  # (sprite, flags, step it fell asleep)
+    for _ in range(entity_count):
+        index, flags = ENTITY.unpack_from(data, offset)
+        offset += ENTITY.size
+        entries, position, sprite = current[index]
+        if not flags & ENTITY_ALIVE:
+            if sprite is not None:
+                sprite.kill()
+            continue
+        slept_at = 0
+        if flags & ENTITY_ASLEEP:
+            slept_at = SLEPT_AT.unpack_from(data, offset)[0]
+            offset += SLEPT_AT.size
+        if sprite is None:
+            sprite = stream.spawn([index])[0]
+            entries[position] = (index, sprite, getattr(sprite, "lease", 0))
+        entity_codec = codec(type(sprite))
+        offset = entity_codec.unpack_into(sprite, data, offset)
+        if entity_codec.positional:
+            sprite.previous_pos = None
+            game.all_sprites.relocate(sprite)
+            if entity_codec.platform:
+                game.platforms.relocate(sprite)
+        sprites[index] = sprite
+        if flags & (ENTITY_ENEMY | ENTITY_ITEM):
+            members.append((sprite, flags, slept_at))
+
+    shells, offset = unpack_ints(data, offset, shell_count)
+    batched, offset = unpack_ints(data, offset, batched_count)
+    for group in groups:
+        group.remove(*group.sprites())  # Sprites respawned above joined their groups
+    if game.physics is not None:
+        for index in batched:
+            game.physics.add(sprites[index])
+    for sprite, flags, slept_at in members:
+        group = game.enemies if flags & ENTITY_ENEMY else game.items
+        if flags & ENTITY_ASLEEP:
+            activation.sleeping.add(sprite)
+            activation.sleeping.homes[sprite] = (group, slept_at)
+        else:
+            group.add(sprite)
+    game.shells = [sprites[index] for index in shells]
+
+    game.all_sprites.relocate(player)
+    game.state = state
+    game.seed = seed
+    if has_rng:
+        words, offset = unpack_ints(data, offset, RNG_WORDS)
+        game.rng.setstate((3, words, None))
+    else:
+        game.rng.seed(seed)
+    game.score = score
+    game.time_left = time_left
+    game.time_counter = time_counter
+    game.play_steps = play_steps
+    game.camera_offset_x = camera
+    game.previous_camera_offset_x = previous_camera
+    game.drawn_view = None  # Redraw everything
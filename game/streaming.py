@@ -0,0 +1,132 @@
+"""
+Streaming module for Mario Sisters game.
+Contains the chunk streamer that keeps only the level around the camera alive.
+"""
+from constants import *
+from level import entity_name, entity_parameters
+from platforms import QuestionBlock
+from render import CHUNK_WIDTH
+
+STREAM_MARGIN = 1  # Chunks kept loaded on each side of the screen
+RESIDENT_TYPES = {"exit"}  # Entities that live for the whole level
+
+# Persistent entity states, kept per chunk across evictions
+ENTITY_REMOVED = 1  # Killed, collected or broken
+ENTITY_SPENT = 2  # A question block that has been hit
+
+
+class LevelStream:
+    """Materialises the entities of a level chunk by chunk around the camera
+
+    Entities belong to the chunk they spawn in and live exactly as long as
+    that chunk is loaded. A chunk that leaves the window stays loaded while
+    any of its entities has walked into a chunk that is still in it, so an
+    enemy is never removed in view of the camera. When a chunk is evicted,
+    entities that were removed during play are remembered, so they stay gone
+    when it is loaded again; the others respawn at their starting positions. The tile layer is small
+    enough to stay in the tile map for the whole level, so only sprites and
+    baked terrain surfaces are streamed.
+    """
+
+    def __init__(self, game, level, margin=STREAM_MARGIN):
+        self.game = game
+        self.level = level
+        self.margin = margin
+        self.chunk_entities = {}  # chunk index -> entity indices, in level order
+        self.resident = []
+        for index, record in enumerate(level.entities):
+            if entity_name(record[0]) in RESIDENT_TYPES:
+                self.resident.append(index)
+            else:
+                self.chunk_entities.setdefault(record[1] // CHUNK_WIDTH, []).append(index)
+        self.states = {}  # chunk index -> {entity index: ENTITY_REMOVED or ENTITY_SPENT}
+        self.loaded = {}  # chunk index -> [(entity index, sprite, lease), ...]
+        self.last_chunk = -(-level.width // CHUNK_WIDTH) - 1
+        self.loads = 0
+        self.evictions = 0
+
+    def window(self, camera_offset_x):
+        """Return the chunk indices that should be loaded for a camera position"""
+        left = int(-camera_offset_x)
+        first = max(left // CHUNK_WIDTH - self.margin, 0)
+        last = min((left + SCREEN_WIDTH - 1) // CHUNK_WIDTH + self.margin, self.last_chunk)
+        return range(first, last + 1)
+
+    def start(self, camera_offset_x):
+        """Spawn the resident entities and the chunks around the camera"""
+        self.load(self.window(camera_offset_x), self.resident)
+
+    def update(self, camera_offset_x):
+        """Load chunks entering the window and evict the ones that left it"""
+        window = self.window(camera_offset_x)
+        leaving = [index for index in self.loaded if index not in window]
+        if leaving and self.game.physics is not None:
+            self.game.physics.sync()  # Batched entities may be ahead of their rects
+        for chunk_index in leaving:
+            if not self.occupied(chunk_index, window):
+                self.evict(chunk_index)
+        entering = [index for index in window if index not in self.loaded]
+        if entering:
+            self.load(entering)
+
+    def load(self, chunk_indices, resident=()):
+        """Spawn the surviving entities of chunks, plus any resident ones, in level order"""
+        entity_indices = list(resident)
+        for chunk_index in chunk_indices:
+            self.loaded[chunk_index] = []
+            removed = self.states.get(chunk_index, {})
+            entity_indices += [index for index in self.chunk_entities.get(chunk_index, ())
+                               if removed.get(index) != ENTITY_REMOVED]
+            self.loads += 1
+        entity_indices.sort()
+        for index, sprite in zip(entity_indices, self.spawn(entity_indices)):
+            if index in resident:
+                continue
+            chunk_index = self.chunk_of(index)
+            self.loaded[chunk_index].append((index, sprite, getattr(sprite, "lease", 0)))
+            if self.states.get(chunk_index, {}).get(index) == ENTITY_SPENT:
+                sprite.hit()
+
+    def occupied(self, chunk_index, window):
+        """Return True if a live entity of a chunk is in one of the window's chunks"""
+        for _, sprite, lease in self.loaded[chunk_index]:
+            if (sprite.alive() and getattr(sprite, "lease", 0) == lease and
+                    sprite.rect.x // CHUNK_WIDTH in window):
+                return True
+        return False
+
+    def chunk_of(self, entity_index):
+        """Return the chunk an entity spawns in"""
+        return self.level.entities[entity_index][1] // CHUNK_WIDTH
+
+    def spawn(self, entity_indices):
+        """Create the sprites of entity records and return them"""
+        sprites = []
+        for index in entity_indices:
+            record = self.level.entities[index]
+            sprites.append(self.game.spawn_entity(record[0], record[1], record[2],
+                                                  entity_parameters(record[0], record)))
+        return sprites
+
+    def evict(self, chunk_index):
+        """Record what happened to a chunk's entities, then remove them"""
+        state = self.states.setdefault(chunk_index, {})
+        for index, sprite, lease in self.loaded.pop(chunk_index):
+            # A pooled sprite may have been killed and handed out again since
+            if not sprite.alive() or getattr(sprite, "lease", 0) != lease:
+                state[index] = ENTITY_REMOVED
+            else:
+                if isinstance(sprite, QuestionBlock) and not sprite.active:
+                    state[index] = ENTITY_SPENT
+                sprite.kill()
+        self.game.terrain.evict(chunk_index)
+        self.evictions += 1
+
+    def stats(self):
+        """Return counters describing what is currently streamed in"""
+        return {
+            "chunks_loaded": len(self.loaded),
+            "sprites_loaded": sum(len(sprites) for sprites in self.loaded.values()),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
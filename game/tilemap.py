@@ -0,0 +1,155 @@
+"""
+Tile map module for Mario Sisters game.
+Contains the compact grid that stores static, tile-aligned terrain.
+"""
+from array import array
+
+import pygame
+from constants import *
+
+# Levels are laid out from the bottom of the screen, so the grid is anchored there
+TILE_ROWS = -(-SCREEN_HEIGHT // TILE_SIZE)
+TILE_ORIGIN_Y = SCREEN_HEIGHT - TILE_ROWS * TILE_SIZE
+
+# Colours used when terrain is drawn straight from the tile map
+TILE_COLORS = {
+    TILE_GROUND: (150, 75, 0),  # Brown
+    TILE_BRICK: (210, 105, 30),  # Dark orange
+    TILE_QUESTION: (255, 255, 0),  # Yellow
+    TILE_PIPE: (0, 200, 0),  # Green
+}
+
+
+class TileMap:
+    """Column-major grid of tile codes, one byte per cell"""
+
+    def __init__(self, columns=0, rows=TILE_ROWS, origin_y=TILE_ORIGIN_Y):
+        self.rows = rows
+        self.columns = 0
+        self.origin_y = origin_y
+        self.cells = array('B')
+        self.ensure_columns(columns)
+
+    def ensure_columns(self, columns):
+        """Grow the map so that it holds at least this many columns"""
+        if columns > self.columns:
+            self.cells.frombytes(bytes((columns - self.columns) * self.rows))
+            self.columns = columns
+
+    def clear(self):
+        """Remove every tile"""
+        self.cells = array('B')
+        self.columns = 0
+
+    def load(self, cells, columns):
+        """Replace the map with column-major cells of a level, e.g. from a level cache"""
+        if len(cells) != columns * self.rows:
+            raise ValueError(f"Expected {columns * self.rows} cells, got {len(cells)}")
+        self.cells = array('B', cells)
+        self.columns = columns
+
+    def get_tile(self, col, row):
+        """Return the tile code at a cell, or TILE_EMPTY outside the map"""
+        if 0 <= col < self.columns and 0 <= row < self.rows:
+            return self.cells[col * self.rows + row]
+        return TILE_EMPTY
+
+    def set_tile(self, col, row, code):
+        """Store a tile code at a cell, growing the map to the right if needed"""
+        self.ensure_columns(col + 1)
+        self.cells[col * self.rows + row] = code
+
+    def tile_rect(self, col, row):
+        """Return the world rect covered by a cell"""
+        return pygame.Rect(col * TILE_SIZE, self.origin_y + row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+
+    def cell_span(self, rect):
+        """Return the cells a rect covers exactly, or None if it is not grid-aligned"""
+        if rect.width <= 0 or rect.height <= 0:
+            return None
+        top = rect.y - self.origin_y
+        if (rect.x % TILE_SIZE or top % TILE_SIZE or
+                rect.width % TILE_SIZE or rect.height % TILE_SIZE):
+            return None
+        col0 = rect.x // TILE_SIZE
+        row0 = top // TILE_SIZE
+        col1 = col0 + rect.width // TILE_SIZE - 1
+        row1 = row0 + rect.height // TILE_SIZE - 1
+        if col0 < 0 or row0 < 0 or row1 >= self.rows:
+            return None
+        return col0, row0, col1, row1
+
+    def fill_rect(self, rect, code):
+        """Store a grid-aligned rect as solid tiles
+
+        Returns False and leaves the map untouched if the rect is not aligned
+        or overlaps tiles that are already stored.
+        """
+        span = self.cell_span(rect)
+        if span is None:
+            return False
+        col0, row0, col1, row1 = span
+        self.ensure_columns(col1 + 1)
+        rows = self.rows
+        cells = self.cells
+        for col in range(col0, col1 + 1):
+            start = col * rows
+            if any(cells[start + row0:start + row1 + 1]):
+                return False
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                cells[col * rows + row] = code
+        return True
+
+    def clear_rect(self, rect):
+        """Empty the cells of a rect previously stored with fill_rect"""
+        span = self.cell_span(rect)
+        if span is None:
+            return
+        col0, row0, col1, row1 = span
+        for col in range(col0, min(col1, self.columns - 1) + 1):
+            for row in range(row0, row1 + 1):
+                self.cells[col * self.rows + row] = TILE_EMPTY
+
+    def cell_range(self, rect):
+        """Return the inclusive cell range a rect overlaps, clipped to the map"""
+        col0 = max(rect.left // TILE_SIZE, 0)
+        col1 = min((rect.right - 1) // TILE_SIZE, self.columns - 1)
+        row0 = max((rect.top - self.origin_y) // TILE_SIZE, 0)
+        row1 = min((rect.bottom - 1 - self.origin_y) // TILE_SIZE, self.rows - 1)
+        return col0, row0, col1, row1
+
+    def collide(self, rect):
+        """Return the rects of solid tiles overlapping rect, left to right"""
+        col0, row0, col1, row1 = self.cell_range(rect)
+        hits = []
+        rows = self.rows
+        cells = self.cells
+        for col in range(col0, col1 + 1):
+            start = col * rows
+            for row in range(row0, row1 + 1):
+                if cells[start + row]:
+                    hits.append(pygame.Rect(col * TILE_SIZE, self.origin_y + row * TILE_SIZE,
+                                            TILE_SIZE, TILE_SIZE))
+        return hits
+
+    def has_surface(self, x, y, tolerance):
+        """Return True if a solid tile with open space above has its top near (x, y)
+
+        Tile edges count as part of the tile, like the inclusive edge checks
+        the enemies use for ledges.
+        """
+        rows = self.rows
+        cells = self.cells
+        col = x // TILE_SIZE
+        cols = (col - 1, col) if x % TILE_SIZE == 0 else (col,)
+        row = (y - self.origin_y) // TILE_SIZE
+        for row in (row, row + 1):
+            if not 0 <= row < rows or abs(self.origin_y + row * TILE_SIZE - y) >= tolerance:
+                continue
+            for col in cols:
+                if 0 <= col < self.columns:
+                    start = col * rows
+                    if cells[start + row] and (row == 0 or not cells[start + row - 1]):
+                        return True
+        return False
@@ -0,0 +1,11 @@
+"""
+Shared setup for the Mario Sisters tests.
+The game's modules import each other by bare name, so the game directory
+goes on the path, and pygame runs on its dummy video and audio drivers.
+"""
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "game"))
@@ -0,0 +1,41 @@
+"""Tests for the background asset loader"""
+import json
+
+import pygame
+import pytest
+
+from assets import AssetManager, PLACEHOLDER_COLOR
+
+
+@pytest.fixture
+def asset_dir(tmp_path):
+    pygame.init()
+    good = pygame.Surface((20, 30))
+    good.fill((10, 20, 30))
+    pygame.image.save(good, str(tmp_path / "good.png"))
+    (tmp_path / "corrupt.png").write_bytes(b"not a png")
+    (tmp_path / "corrupt.wav").write_bytes(b"not a wav")
+    manifest = {"common": {"images": {"good": "good.png", "corrupt": "corrupt.png", "missing": "missing.png"},
+                           "sounds": {"corrupt": "corrupt.wav"}}}
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    return tmp_path
+
+
+def test_poll_survives_bad_files(asset_dir):
+    assets = AssetManager(str(asset_dir), workers=2)
+    assets.load_scope("common")
+    try:
+        while assets.loading():
+            assets.poll()
+        assert assets.stats()["failures"] == (3 if pygame.mixer.get_init() else 2)
+        assert assets.image("good").get_at((0, 0))[:3] == (10, 20, 30)
+        assert assets.image("corrupt").get_at((0, 0))[:3] == PLACEHOLDER_COLOR
+        assert assets.image("missing").get_at((0, 0))[:3] == PLACEHOLDER_COLOR
+    finally:
+        assets.close()
+
+
+def test_lazy_fetch_survives_bad_files(asset_dir):
+    assets = AssetManager(str(asset_dir))
+    assert assets.image("missing").get_at((0, 0))[:3] == PLACEHOLDER_COLOR
+    assert assets.stats()["failures"] == 1
@@ -0,0 +1,23 @@
+"""Tests for the game object itself"""
+import time
+
+import pytest
+
+from constants import *
+from game import Game
+
+
+def test_only_the_tuned_sim_rate_is_accepted():
+    assert Game(headless=True, render=False, sim_rate=SIM_RATE).sim_rate == SIM_RATE
+    with pytest.raises(ValueError):
+        Game(headless=True, render=False, sim_rate=SIM_RATE * 2)
+
+
+def test_asset_polling_is_its_own_profiler_phase():
+    game = Game(headless=True, render=False, profile=True, rewind_seconds=0)
+    game.new_game()
+    game.assets.poll = lambda: time.sleep(0.02)
+    game.step()
+    phases = game.profiler.phases
+    assert game.profiler.phase_samples(phases.index("assets"))[0] >= 0.02
+    assert game.profiler.phase_samples(phases.index("platforms"))[0] < 0.02
@@ -0,0 +1,63 @@
+"""Tests for level files and their binary cache"""
+import json
+import os
+
+import pytest
+
+from level import CACHE_SUFFIX, ENTITY_CODES, load_level_file, parse_level, tile_level, write_cache
+
+LEVEL = {
+    "name": "World 9-9 ★",
+    "tiles": ["..?.", "####"],
+    "entities": [{"type": "brick", "x": 300, "y": 472}, {"type": "coin", "x": 64, "y": 400},
+                 {"type": "exit", "x": 100, "y": 400}],
+}
+
+
+@pytest.fixture
+def level_file(tmp_path):
+    path = tmp_path / "level.json"
+    path.write_text(json.dumps(LEVEL))
+    return str(path)
+
+
+def cache_path(path):
+    return os.path.splitext(path)[0] + CACHE_SUFFIX
+
+
+def test_cache_keeps_the_name(level_file):
+    parsed = load_level_file(level_file)
+    assert os.path.exists(cache_path(level_file))
+    cached = load_level_file(level_file)
+    assert cached.name == parsed.name == LEVEL["name"]
+    assert cached.tiles == parsed.tiles
+    assert cached.entities == parsed.entities
+
+
+def test_truncated_cache_is_rebuilt(level_file):
+    parsed = load_level_file(level_file)
+    path = cache_path(level_file)
+    full_size = os.path.getsize(path)
+    with open(path, "r+b") as cache_file:
+        cache_file.truncate(full_size - 5)
+    level = load_level_file(level_file)
+    assert level.entities == parsed.entities
+    assert level.tiles == parsed.tiles
+    assert os.path.getsize(path) == full_size
+
+
+def test_failed_cache_write_leaves_no_temp_file(level_file, monkeypatch):
+    def fail(source, destination):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        write_cache(cache_path(level_file), parse_level(LEVEL), os.stat(level_file))
+    assert os.listdir(os.path.dirname(level_file)) == [os.path.basename(level_file)]
+
+
+def test_tiled_level_keeps_one_exit():
+    level = tile_level(parse_level(LEVEL), 3)
+    exits = [record[1] for record in level.entities if record[0] == ENTITY_CODES["exit"]]
+    assert exits == [100 + 2 * level.width // 3]
+    assert len(level.entities) == 3 * len(LEVEL["entities"]) - 2
@@ -0,0 +1,32 @@
+"""Tests for the sprite pools"""
+import pytest
+
+from pool import ObjectPool, PooledSprite
+
+
+class Spark(PooledSprite):
+    def __init__(self, x, y):
+        super().__init__()
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def test_pool_recycles_released_sprites():
+    pool = ObjectPool(Spark, 1)
+    spark = pool.acquire(1, 2)
+    spark.kill()
+    assert pool.acquire(3, 4) is spark
+    assert (spark.x, spark.y) == (3, 4)
+    assert pool.stats()["misses"] == 0
+
+
+def test_class_without_reset_is_refused():
+    class Ember(PooledSprite):
+        def __init__(self, x, y):
+            super().__init__()
+
+    with pytest.raises(TypeError):
+        ObjectPool(Ember)
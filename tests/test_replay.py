@@ -0,0 +1,65 @@
+"""Tests for recording and replaying sessions"""
+import pygame
+
+from constants import *
+from game import Game
+from replay import InputRecorder, ReplayInput, PressedKeys, TRACKED_KEYS, play
+from rewind import REWIND_KEY
+from snapshot import snapshot
+
+SEED = 7
+STEPS = 240
+REWIND_STEPS = range(150, 170)  # Backspace is held over these steps
+
+
+class ScriptedInput:
+    """Starts a game, then holds Right, jumps now and then and rewinds for a while"""
+
+    def __init__(self):
+        self.step = 0
+
+    def get_events(self):
+        if self.step == 0:
+            return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN)]
+        if self.step % 40 == 0:
+            return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE)]
+        return []
+
+    def get_pressed(self):
+        held = {pygame.K_RIGHT}
+        if self.step in REWIND_STEPS:
+            held.add(REWIND_KEY)
+        self.step += 1
+        return PressedKeys(sum(1 << bit for bit, key in enumerate(TRACKED_KEYS) if key in held))
+
+
+def test_replay_reproduces_rewinds(tmp_path):
+    game = Game(headless=True, render=False, seed=SEED)
+    recorder = InputRecorder(ScriptedInput(), game.seed)
+    game.input = recorder
+    for _ in range(STEPS):
+        game.events()
+        game.update()
+    assert game.state == STATE_PLAYING
+    # Each rewound step undoes one step instead of playing one
+    assert game.play_steps == STEPS - 2 * len(REWIND_STEPS)
+    path = tmp_path / "session.msr"
+    recorder.save(path)
+
+    replayed, trace = play(path)
+    assert len(trace) == STEPS
+    assert replayed.play_steps == game.play_steps
+    assert replayed.player.rect == game.player.rect
+    assert snapshot(replayed) == snapshot(game)
+
+
+def test_rewind_key_is_recorded(tmp_path):
+    recorder = InputRecorder(ScriptedInput(), SEED)
+    for _ in range(REWIND_STEPS.start + 1):
+        recorder.get_events()
+        recorder.get_pressed()
+    path = tmp_path / "session.msr"
+    recorder.save(path)
+    replay = ReplayInput(path)
+    replay.position = REWIND_STEPS.start
+    assert replay.get_pressed()[REWIND_KEY]
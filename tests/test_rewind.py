@@ -0,0 +1,31 @@
+"""Tests for the rewind buffer"""
+from constants import *
+from game import Game
+from level import level_path, load_level_file
+
+SEED = 3
+
+
+def test_win_screen_is_not_captured():
+    game = Game(headless=True, render=False, seed=SEED)
+    game.new_game()
+    game.current_level = LEVEL_COUNT
+    game.load_level(LEVEL_COUNT)
+    game.update()
+    frames = len(game.rewind)
+    assert frames
+    game.player.rect.topleft = game.exit.rect.topleft
+    game.update()
+    assert game.state == STATE_WIN
+    assert len(game.rewind) == frames
+
+
+def test_unstreamed_level_plays_with_rewind_on():
+    game = Game(headless=True, render=False, seed=SEED)
+    game.new_game()
+    game.clear_level()
+    game.build_level(load_level_file(level_path(1)), stream=False)
+    for _ in range(3):
+        game.update()
+    assert game.state == STATE_PLAYING
+    assert len(game.rewind) == 0
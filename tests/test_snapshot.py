@@ -0,0 +1,44 @@
+"""Tests for game snapshots"""
+from benchmark import build_level_1
+from constants import *
+from game import Game
+from snapshot import restore, snapshot
+
+SEED = 5
+
+
+def walk(game, start, stop):
+    """Carry the sister from start to stop, streaming chunks in and out"""
+    for x in range(start, stop, 40 if stop > start else -40):
+        game.player.rect.x = x
+        game.update()
+
+
+def test_restore_on_win_screen():
+    game = Game(headless=True, render=False, seed=SEED, rewind_seconds=0)
+    game.new_game()
+    for _ in range(LEVEL_COUNT):
+        game.complete_level()
+    assert game.state == STATE_WIN
+    data = snapshot(game)
+
+    other = Game(headless=True, render=False, seed=SEED, rewind_seconds=0)
+    other.new_game()
+    restore(other, data)
+    assert other.state == STATE_WIN
+    assert other.current_level == LEVEL_COUNT + 1
+    assert snapshot(other) == data
+
+
+def test_restore_after_evictions_is_exact():
+    game = Game(headless=True, render=False, seed=SEED, rewind_seconds=0)
+    game.new_game()
+    build_level_1(game, copies=8, stream=True)
+    game.player.invincible = True
+    walk(game, 100, 2756)
+    assert game.stream.evictions
+    data = snapshot(game)
+
+    walk(game, 2756, 4500)
+    restore(game, data)
+    assert snapshot(game) == data
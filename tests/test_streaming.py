@@ -0,0 +1,27 @@
+"""Tests for streaming level chunks around the camera"""
+from game import Game
+from enemies import Enemy
+from render import CHUNK_WIDTH
+
+
+def test_enemy_outlives_its_spawn_chunk():
+    game = Game(headless=True, render=False, seed=1, rewind_seconds=0)
+    game.new_game()
+    stream = game.stream
+    index, enemy = next((index, sprite) for entries in stream.loaded.values()
+                        for index, sprite, _ in entries if isinstance(sprite, Enemy))
+    spawn_chunk = stream.chunk_of(index)
+
+    # The enemy walks into the next chunk, then the camera leaves its spawn chunk behind
+    enemy.rect.x = (spawn_chunk + 1) * CHUNK_WIDTH + 10
+    camera = -(spawn_chunk + 1 + stream.margin) * CHUNK_WIDTH
+    assert spawn_chunk not in stream.window(camera)
+    stream.update(camera)
+    assert enemy.alive()
+    assert spawn_chunk in stream.loaded
+
+    # Once it is out of the window too, the chunk goes and takes it along
+    enemy.rect.x = spawn_chunk * CHUNK_WIDTH
+    stream.update(camera)
+    assert not enemy.alive()
+    assert spawn_chunk not in stream.loaded